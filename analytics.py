@@ -0,0 +1,221 @@
+"""
+Per-course grade analytics.
+
+For each course: count, mean, median, population standard deviation,
+percentiles, a letter-grade histogram and each student's rank. The
+school-wide mode computes every course in one pass over the grades,
+vectorized with NumPy when it is installed and in pure Python otherwise.
+
+Results are cached per database file and course until a grade in that
+course changes, tracked by the trigger-kept course_grade_versions table
+(see migrations.py), whose versions start at random values.
+"""
+import json
+import math
+import threading
+
+from database import get_connection
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PERCENTILES = (10, 25, 50, 75, 90)
+LETTERS = ("A", "B", "C", "D", "F")
+
+# (database file, course_id) -> (grade version, stats)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# ── Computation ─────────────────────────────────────────
+
+def _load(conn, course_ids=None):
+    """Graded rows as parallel lists, ordered by course, then score descending."""
+    where, args = "", ()
+    if course_ids is not None:
+        where, args = "AND e.course_id IN (SELECT value FROM json_each(?))", (json.dumps(list(course_ids)),)
+    rows = conn.execute(f"""
+        SELECT e.course_id, e.student_id, g.score, g.letter_grade
+        FROM grades g JOIN enrollments e ON g.enrollment_id = e.id
+        WHERE g.score IS NOT NULL {where}
+        ORDER BY e.course_id, g.score DESC, e.student_id
+    """, args).fetchall()
+    return ([r["course_id"] for r in rows], [r["student_id"] for r in rows],
+            [r["score"] for r in rows], [r["letter_grade"] for r in rows])
+
+
+def _percentile(desc, q):
+    """Linear-interpolated percentile of a descending list (NumPy's default method)."""
+    pos = (len(desc) - 1) * q / 100
+    lo, hi = math.floor(pos), math.ceil(pos)
+    a, b = desc[-1 - lo], desc[-1 - hi]
+    return a + (b - a) * (pos - lo)
+
+
+def _compute_python(courses, scores):
+    """Returns ({course_id: (start, count, mean, std, {q: value})}, ranks per row)."""
+    out, ranks, start = {}, [0] * len(scores), 0
+    while start < len(courses):
+        end = start
+        while end < len(courses) and courses[end] == courses[start]:
+            end += 1
+        group = scores[start:end]
+        n = len(group)
+        mean = sum(group) / n
+        std = math.sqrt(sum((x - mean) ** 2 for x in group) / n)
+        for i in range(start, end):
+            ranks[i] = ranks[i - 1] if i > start and scores[i] == scores[i - 1] else i - start + 1
+        out[courses[start]] = (start, n, mean, std, {q: _percentile(group, q) for q in PERCENTILES})
+        start = end
+    return out, ranks
+
+
+def _compute_numpy(courses, scores):
+    courses, scores = np.asarray(courses), np.asarray(scores, dtype=float)
+    ids, starts, counts = np.unique(courses, return_index=True, return_counts=True)
+    means = np.add.reduceat(scores, starts) / counts
+    stds = np.sqrt(np.add.reduceat((scores - np.repeat(means, counts)) ** 2, starts) / counts)
+
+    pct = {}
+    for q in PERCENTILES:
+        pos = (counts - 1) * q / 100
+        lo, hi = np.floor(pos).astype(int), np.ceil(pos).astype(int)
+        # Rows are descending within a course: ascending index k is at start + n - 1 - k.
+        a, b = scores[starts + counts - 1 - lo], scores[starts + counts - 1 - hi]
+        pct[q] = a + (b - a) * (pos - lo)
+
+    # Competition ranking (1, 2, 2, 4): each row takes the position of the first equal score.
+    idx = np.arange(len(scores))
+    first = np.ones(len(scores), dtype=bool)
+    first[1:] = (scores[1:] != scores[:-1]) | (courses[1:] != courses[:-1])
+    ranks = np.maximum.accumulate(np.where(first, idx, 0)) - np.repeat(starts, counts) + 1
+
+    out = {}
+    for i, cid in enumerate(ids.tolist()):
+        out[cid] = (int(starts[i]), int(counts[i]), float(means[i]), float(stds[i]),
+                    {q: float(pct[q][i]) for q in PERCENTILES})
+    return out, ranks.tolist()
+
+
+def _compute(conn, course_ids=None):
+    """Stats for the given courses (all if None) in one pass. Courses without grades are omitted."""
+    courses, students, scores, letters = _load(conn, course_ids)
+    if not courses:
+        return {}
+    groups, ranks = (_compute_numpy if np is not None else _compute_python)(courses, scores)
+    result = {}
+    for cid, (start, n, mean, std, pct) in groups.items():
+        histogram = dict.fromkeys(LETTERS, 0)
+        for letter in letters[start:start + n]:
+            if letter:
+                histogram[letter] = histogram.get(letter, 0) + 1
+        result[cid] = {
+            "count": n,
+            "mean": round(mean, 2),
+            "median": round(pct[50], 2),
+            "std": round(std, 2),
+            "percentiles": {f"p{q}": round(v, 2) for q, v in pct.items()},
+            "histogram": histogram,
+            "ranking": [
+                {"student_id": students[i], "score": scores[i], "letter_grade": letters[i], "rank": ranks[i]}
+                for i in range(start, start + n)
+            ],
+        }
+    return result
+
+
+def _empty():
+    return {"count": 0, "mean": None, "median": None, "std": None,
+            "percentiles": {f"p{q}": None for q in PERCENTILES},
+            "histogram": dict.fromkeys(LETTERS, 0), "ranking": []}
+
+
+def _cached(conn, course_ids):
+    """Stats for `course_ids`, recomputing (in one pass) only courses whose grades changed."""
+    db = conn.execute("PRAGMA database_list").fetchone()[2]
+    versions = dict(conn.execute(
+        "SELECT course_id, version FROM course_grade_versions WHERE course_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(course_ids)),),
+    ).fetchall())
+    with _cache_lock:
+        stale = [c for c in course_ids if _cache.get((db, c), (None,))[0] != versions.get(c, 0)]
+    if stale:
+        # Read the versions before the grades, so a concurrent write leaves the entry stale, never wrong.
+        fresh = _compute(conn, stale if len(stale) < len(course_ids) else None)
+        with _cache_lock:
+            for c in stale:
+                _cache[(db, c)] = (versions.get(c, 0), fresh.get(c) or _empty())
+    with _cache_lock:
+        return {c: _cache[(db, c)][1] for c in course_ids}
+
+
+# ── Queries ─────────────────────────────────────────────
+
+def course_stats(conn, course_id):
+    """Analytics for one course, with student names in the ranking. None if no such course."""
+    course = conn.execute("SELECT id, code, name FROM courses WHERE id=?", (course_id,)).fetchone()
+    if not course:
+        return None
+    stats = dict(_cached(conn, [course_id])[course_id])
+    names = dict(conn.execute(
+        "SELECT id, first_name || ' ' || last_name FROM students WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps([r["student_id"] for r in stats["ranking"]]),),
+    ).fetchall())
+    stats["ranking"] = [dict(r, name=names.get(r["student_id"], "")) for r in stats["ranking"]]
+    return dict(course_id=course["id"], code=course["code"], name=course["name"], **stats)
+
+
+def school_stats(conn):
+    """Summary analytics (no per-student ranking) for every course, ordered by code."""
+    courses = conn.execute("SELECT id, code, name FROM courses ORDER BY code").fetchall()
+    stats = _cached(conn, [c["id"] for c in courses]) if courses else {}
+    return [
+        dict(course_id=c["id"], code=c["code"], name=c["name"],
+             **{k: v for k, v in stats[c["id"]].items() if k != "ranking"})
+        for c in courses
+    ]
+
+
+# ── CLI reports ─────────────────────────────────────────
+
+def _fmt(value):
+    return f"{value:.1f}" if value is not None else "N/A"
+
+
+def course_report(course_id):
+    conn = get_connection()
+    stats = course_stats(conn, course_id)
+    conn.close()
+    if not stats:
+        print("Course not found.")
+        return
+    print(f"\n{stats['code']} — {stats['name']}: {stats['count']} graded student(s)")
+    if not stats["count"]:
+        return
+    pct = "  ".join(f"{k.upper()} {_fmt(v)}" for k, v in stats["percentiles"].items())
+    print(f"Mean {_fmt(stats['mean'])}  Median {_fmt(stats['median'])}  Std {_fmt(stats['std'])}")
+    print(pct)
+    print("Grades: " + "  ".join(f"{k}: {v}" for k, v in stats["histogram"].items()))
+    print(f"\n{'Rank':<6} {'Student ID':<12} {'Name':<25} {'Score':<8} {'Grade'}")
+    print("-" * 60)
+    for r in stats["ranking"]:
+        print(f"{r['rank']:<6} {r['student_id']:<12} {r['name']:<25} {r['score']:<8.1f} {r['letter_grade'] or 'N/A'}")
+
+
+def school_report():
+    conn = get_connection()
+    rows = school_stats(conn)
+    conn.close()
+    if not rows:
+        print("No courses found.")
+        return
+    print(f"\n{'Code':<10} {'Course':<25} {'N':<5} {'Mean':<7} {'Median':<7} {'Std':<7} {'P10':<7} {'P90':<7} "
+          + " ".join(f"{l:<4}" for l in LETTERS))
+    print("-" * 105)
+    for r in rows:
+        p = r["percentiles"]
+        print(f"{r['code']:<10} {r['name']:<25} {r['count']:<5} {_fmt(r['mean']):<7} {_fmt(r['median']):<7} "
+              f"{_fmt(r['std']):<7} {_fmt(p['p10']):<7} {_fmt(p['p90']):<7} "
+              + " ".join(f"{r['histogram'].get(l, 0):<4}" for l in LETTERS))
@@ -2,27 +2,198 @@
 School Management System — Flask API
 All endpoints served under /api/
 """
-import sqlite3, os, json
-from flask import Flask, request, jsonify
+import os, sys, json, base64, functools, hashlib
+from datetime import date
+from flask import Flask, Response, request, jsonify, make_response
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analytics
+import database
+import digest
+import enrollments
+import exporter
+import importer
+import migrations
+import search
+import schedules
+import timetable
+import attendance
+import transcripts
+import outbox
+import notifications
 
 app = Flask(__name__)
 
 DB_PATH = "/tmp/school.db"
+database.set_db_path(DB_PATH)
 
 
 # ── Database ────────────────────────────────────────────
 
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return database.get_connection()
 
 
 def dict_rows(rows):
     return [dict(r) for r in rows]
 
 
+# ── Conditional GET ─────────────────────────────────────
+
+def table_versions(tables):
+    """Current (name, version) pairs for `tables`, kept by triggers (see migrations.py)."""
+    conn = get_conn()
+    rows = conn.execute(
+        f"SELECT name, version FROM table_versions WHERE name IN ({', '.join('?' * len(tables))}) ORDER BY name",
+        tables,
+    ).fetchall()
+    conn.close()
+    return tuple((r["name"], r["version"]) for r in rows)
+
+
+def etag(*tables, vary=None):
+    """Give a GET view a strong ETag derived from the versions of the tables it reads.
+
+    Versions are bumped by triggers on every write (see migrations.py) and
+    read before the view runs, so If-None-Match gets a 304 without running
+    the view's query. `vary` returns anything else the response depends on.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = [request.full_path] + [f"{name}={version}" for name, version in table_versions(tables)]
+            if vary:
+                key.append(str(vary()))
+            tag = hashlib.sha1("\n".join(key).encode()).hexdigest()
+            if tag in request.if_none_match:
+                resp = Response(status=304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(tag)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+        return wrapper
+    return decorator
+
+
+# ── Entity lists ────────────────────────────────────────
+
+# The row shape of each entity list: (SELECT, id expr, sort keys for list_response).
+# /api/changes re-reads changed rows with the same SELECT, so deltas match the lists.
+ENTITY_LISTS = {
+    "students": ("""
+        SELECT s.*, c.name AS class_name
+        FROM students s LEFT JOIN classes c ON s.class_id = c.id
+    """, "s.id", [("s.last_name", "last_name"), ("s.first_name", "first_name"), ("s.id", "id")]),
+    "teachers": ("SELECT * FROM teachers", "id",
+                 [("last_name", "last_name"), ("first_name", "first_name"), ("id", "id")]),
+    # No enrolled_count: enrolling does not version courses, so seats come from /api/courses/seats.
+    "courses": ("""
+        SELECT c.id, c.name, c.code, c.description, c.teacher_id, c.max_capacity, c.credits, c.weekly_hours,
+               t.first_name||' '||t.last_name AS teacher_name
+        FROM courses c LEFT JOIN teachers t ON c.teacher_id=t.id
+    """, "c.id", [("c.code", "code")]),
+    "classes": ("""
+        SELECT cl.*, t.first_name||' '||t.last_name AS teacher_name
+        FROM classes cl LEFT JOIN teachers t ON cl.homeroom_teacher_id=t.id
+    """, "cl.id", [("cl.grade_level", "grade_level"), ("COALESCE(cl.section, '')", "section"), ("cl.id", "id")]),
+    "parents": ("SELECT * FROM parents", "id",
+                [("last_name", "last_name"), ("first_name", "first_name"), ("id", "id")]),
+}
+
+
+def entity_list(table):
+    select, _id, keys = ENTITY_LISTS[table]
+    return list_response(select, keys)
+
+
+# ── Pagination & streaming ──────────────────────────────
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_ROWS = 500
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def stream_json_array(conn, cursor):
+    """Write the cursor's rows to the socket as a JSON array, a chunk at a time."""
+    def generate():
+        try:
+            yield "["
+            sep = ""
+            while True:
+                rows = cursor.fetchmany(STREAM_CHUNK_ROWS)
+                if not rows:
+                    break
+                yield sep + ",".join(json.dumps(dict(r)) for r in rows)
+                sep = ","
+            yield "]"
+        finally:
+            conn.close()
+    return Response(generate(), mimetype="application/json")
+
+
+def list_response(select, keys, where="", params=()):
+    """Serve a list query in one of three modes, chosen by the query string.
+
+    - ?limit=N[&cursor=...]  one keyset page: {"items": [...], "next_cursor": ...}
+    - ?stream=1              the whole list, streamed from the cursor in chunks
+    - (neither)              the whole list as a plain JSON array
+
+    `keys` are (sql_expr, row_field) pairs forming a unique sort key, e.g.
+    last name, first name, id. Append " DESC" to every expr for descending
+    order. Nullable sort columns must be wrapped in COALESCE(..., '').
+    """
+    exprs = [e for e, _ in keys]
+    desc = exprs[0].endswith(" DESC")
+    cols = ", ".join(e[:-5] if desc else e for e in exprs)
+    order = " ORDER BY " + ", ".join(exprs)
+    conds = [where] if where else []
+    args = list(params)
+
+    limit = request.args.get("limit", type=int)
+    token = request.args.get("cursor")
+    if limit is None and not token:
+        conn = get_conn()
+        sql = select + (" WHERE " + " AND ".join(conds) if conds else "") + order
+        if request.args.get("stream") in ("1", "true"):
+            return stream_json_array(conn, conn.execute(sql, args))
+        rows = conn.execute(sql, args).fetchall()
+        conn.close()
+        return jsonify(dict_rows(rows))
+
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    if token:
+        after = decode_cursor(token)
+        if after is None or len(after) != len(keys):
+            return jsonify({"error": "Invalid cursor"}), 400
+        conds.append(f"({cols}) {'<' if desc else '>'} ({', '.join('?' * len(keys))})")
+        args.extend(after)
+    sql = select + (" WHERE " + " AND ".join(conds) if conds else "") + order + " LIMIT ?"
+    conn = get_conn()
+    rows = conn.execute(sql, args + [limit + 1]).fetchall()
+    conn.close()
+    items = dict_rows(rows[:limit])
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(["" if last[f] is None else last[f] for _, f in keys])
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+
 def init_db():
     conn = get_conn()
     conn.executescript("""
@@ -100,10 +271,13 @@ def init_db():
         );
     """)
     conn.commit()
+    migrations.migrate(conn)
     conn.close()
 
 
 init_db()
+if outbox.OUTBOX_AUTOSTART:
+    outbox.start_worker()
 
 
 def _letter(score):
@@ -121,18 +295,35 @@ def health():
     return jsonify({"status": "ok"})
 
 
+# ── Search ──────────────────────────────────────────────
+
+@app.route("/api/search", methods=["GET"])
+@etag("students", "teachers", "parents", "courses")
+def global_search():
+    q = request.args.get("q", "").strip()
+    kinds = [k for k in request.args.get("kind", "").split(",") if k in search.KINDS]
+    limit = max(1, min(request.args.get("limit", 20, type=int), MAX_PAGE_SIZE))
+    offset = 0
+    token = request.args.get("cursor")
+    if token:
+        after = decode_cursor(token)
+        if not after or not isinstance(after[0], int):
+            return jsonify({"error": "Invalid cursor"}), 400
+        offset = after[0]
+    conn = get_conn()
+    rows = search.search(conn, q, kinds=kinds, limit=limit + 1, offset=offset)
+    conn.close()
+    items = dict_rows(rows[:limit])
+    next_cursor = encode_cursor([offset + limit]) if len(rows) > limit else None
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+
 # ── Students ────────────────────────────────────────────
 
 @app.route("/api/students", methods=["GET"])
+@etag("students", "classes")
 def get_students():
-    conn = get_conn()
-    rows = conn.execute("""
-        SELECT s.*, c.name AS class_name
-        FROM students s LEFT JOIN classes c ON s.class_id = c.id
-        ORDER BY s.last_name, s.first_name
-    """).fetchall()
-    conn.close()
-    return jsonify(dict_rows(rows))
+    return entity_list("students")
 
 
 @app.route("/api/students", methods=["POST"])
@@ -171,11 +362,9 @@ def delete_student(sid):
 # ── Teachers ────────────────────────────────────────────
 
 @app.route("/api/teachers", methods=["GET"])
+@etag("teachers")
 def get_teachers():
-    conn = get_conn()
-    rows = conn.execute("SELECT * FROM teachers ORDER BY last_name, first_name").fetchall()
-    conn.close()
-    return jsonify(dict_rows(rows))
+    return entity_list("teachers")
 
 
 @app.route("/api/teachers", methods=["POST"])
@@ -212,22 +401,29 @@ def delete_teacher(tid):
 # ── Courses ─────────────────────────────────────────────
 
 @app.route("/api/courses", methods=["GET"])
+@etag("courses", "teachers")
 def get_courses():
+    return entity_list("courses")
+
+
+@app.route("/api/courses/seats", methods=["GET"])
+@etag("enrollments", "courses")
+def get_course_seats():
+    """Seats taken per course, {course_id: enrolled}. Kept apart from the course list,
+    which changes only when a course is edited."""
     conn = get_conn()
-    rows = conn.execute("""
-        SELECT c.*, t.first_name||' '||t.last_name AS teacher_name
-        FROM courses c LEFT JOIN teachers t ON c.teacher_id=t.id ORDER BY c.code
-    """).fetchall()
+    seats = {r["id"]: r["enrolled_count"] for r in conn.execute("SELECT id, enrolled_count FROM courses")}
     conn.close()
-    return jsonify(dict_rows(rows))
+    return jsonify(seats)
 
 
 @app.route("/api/courses", methods=["POST"])
 def create_course():
     d = request.json; conn = get_conn()
     try:
-        conn.execute("INSERT INTO courses (name,code,description,teacher_id,max_capacity) VALUES (?,?,?,?,?)",
-                     (d["name"], d["code"], d.get("description"), d.get("teacher_id") or None, d.get("max_capacity") or 30))
+        conn.execute("INSERT INTO courses (name,code,description,teacher_id,max_capacity,credits,weekly_hours) VALUES (?,?,?,?,?,?,?)",
+                     (d["name"], d["code"], d.get("description"), d.get("teacher_id") or None, d.get("max_capacity") or 30,
+                      d.get("credits") or 1, d.get("weekly_hours") or 3))
         conn.commit()
         return jsonify({"message": "Course created"}), 201
     except Exception as e:
@@ -239,8 +435,9 @@ def create_course():
 @app.route("/api/courses/<int:cid>", methods=["PUT"])
 def update_course(cid):
     d = request.json; conn = get_conn()
-    conn.execute("UPDATE courses SET name=?,code=?,description=?,teacher_id=?,max_capacity=? WHERE id=?",
-                 (d["name"], d["code"], d.get("description"), d.get("teacher_id") or None, d.get("max_capacity") or 30, cid))
+    conn.execute("UPDATE courses SET name=?,code=?,description=?,teacher_id=?,max_capacity=?,credits=?,weekly_hours=? WHERE id=?",
+                 (d["name"], d["code"], d.get("description"), d.get("teacher_id") or None, d.get("max_capacity") or 30,
+                  d.get("credits") or 1, d.get("weekly_hours") or 3, cid))
     conn.commit(); conn.close()
     return jsonify({"message": "Course updated"})
 
@@ -256,15 +453,9 @@ def delete_course(cid):
 # ── Classes ─────────────────────────────────────────────
 
 @app.route("/api/classes", methods=["GET"])
+@etag("classes", "teachers")
 def get_classes():
-    conn = get_conn()
-    rows = conn.execute("""
-        SELECT cl.*, t.first_name||' '||t.last_name AS teacher_name
-        FROM classes cl LEFT JOIN teachers t ON cl.homeroom_teacher_id=t.id
-        ORDER BY cl.grade_level, cl.section
-    """).fetchall()
-    conn.close()
-    return jsonify(dict_rows(rows))
+    return entity_list("classes")
 
 
 @app.route("/api/classes", methods=["POST"])
@@ -299,6 +490,7 @@ def delete_class(cid):
 
 
 @app.route("/api/classes/<int:cid>/students", methods=["GET"])
+@etag("students")
 def get_class_students(cid):
     conn = get_conn()
     rows = conn.execute("SELECT * FROM students WHERE class_id=? ORDER BY last_name", (cid,)).fetchall()
@@ -309,11 +501,9 @@ def get_class_students(cid):
 # ── Parents ─────────────────────────────────────────────
 
 @app.route("/api/parents", methods=["GET"])
+@etag("parents")
 def get_parents():
-    conn = get_conn()
-    rows = conn.execute("SELECT * FROM parents ORDER BY last_name, first_name").fetchall()
-    conn.close()
-    return jsonify(dict_rows(rows))
+    return entity_list("parents")
 
 
 @app.route("/api/parents", methods=["POST"])
@@ -371,6 +561,7 @@ def unlink_parent():
 
 
 @app.route("/api/students/<int:sid>/parents", methods=["GET"])
+@etag("student_parents", "parents")
 def get_student_parents(sid):
     conn = get_conn()
     rows = conn.execute("""
@@ -382,6 +573,7 @@ def get_student_parents(sid):
 
 
 @app.route("/api/parents/<int:pid>/children", methods=["GET"])
+@etag("student_parents", "students", "classes")
 def get_parent_children(pid):
     conn = get_conn()
     rows = conn.execute("""
@@ -398,9 +590,21 @@ def get_parent_children(pid):
 # ── Enrollments & Grades ────────────────────────────────
 
 @app.route("/api/enrollments", methods=["GET"])
+@etag("enrollments", "students", "courses", "grades")
 def get_enrollments():
     course_id = request.args.get("course_id")
     student_id = request.args.get("student_id")
+    if not course_id and not student_id:
+        return list_response("""
+            SELECT e.id AS enrollment_id, e.student_id, e.course_id,
+                   s.first_name||' '||s.last_name AS student_name, s.last_name AS student_last_name,
+                   c.code AS course_code, c.name AS course_name,
+                   g.score, g.letter_grade
+            FROM enrollments e
+            JOIN students s ON e.student_id=s.id
+            JOIN courses c ON e.course_id=c.id
+            LEFT JOIN grades g ON g.enrollment_id=e.id
+        """, [("c.code", "course_code"), ("s.last_name", "student_last_name"), ("e.id", "enrollment_id")])
     conn = get_conn()
     if course_id:
         rows = conn.execute("""
@@ -412,25 +616,37 @@ def get_enrollments():
             WHERE e.course_id=? ORDER BY s.last_name
         """, (course_id,)).fetchall()
     elif student_id:
-        rows = conn.execute("""
-            SELECT e.id AS enrollment_id, c.id AS course_id, c.code, c.name AS course_name,
-                   g.score, g.letter_grade, g.remarks AS grade_remarks
-            FROM enrollments e JOIN courses c ON e.course_id=c.id
-            LEFT JOIN grades g ON g.enrollment_id=e.id
-            WHERE e.student_id=? ORDER BY c.code
-        """, (student_id,)).fetchall()
-    else:
-        rows = conn.execute("""
-            SELECT e.id AS enrollment_id, e.student_id, e.course_id,
-                   s.first_name||' '||s.last_name AS student_name,
-                   c.code AS course_code, c.name AS course_name,
-                   g.score, g.letter_grade
-            FROM enrollments e
-            JOIN students s ON e.student_id=s.id
-            JOIN courses c ON e.course_id=c.id
-            LEFT JOIN grades g ON g.enrollment_id=e.id
-            ORDER BY c.code, s.last_name
-        """).fetchall()
+        # Served from the stored transcript instead of re-joining enrollments, courses and grades.
+        transcript = transcripts.get_transcript(conn, student_id)
+        conn.close()
+        return jsonify([
+            {"enrollment_id": c["enrollment_id"], "course_id": c["course_id"], "code": c["code"],
+             "course_name": c["name"], "score": c["score"], "letter_grade": c["letter_grade"],
+             "grade_remarks": c["remarks"]}
+            for c in (transcript["courses"] if transcript else [])
+        ])
+    conn.close()
+    return jsonify(dict_rows(rows))
+
+
+@app.route("/api/students/<int:sid>/transcript", methods=["GET"])
+@etag("students", "enrollments", "grades", "courses")
+def get_student_transcript(sid):
+    conn = get_conn()
+    transcript = transcripts.get_transcript(conn, sid)
+    conn.close()
+    if transcript is None:
+        return jsonify({"error": "Student not found"}), 404
+    return jsonify(transcript)
+
+
+@app.route("/api/honor-roll", methods=["GET"])
+@etag("students", "enrollments", "grades", "courses")
+def get_honor_roll():
+    min_gpa = request.args.get("min_gpa", transcripts.HONOR_ROLL_GPA, type=float)
+    min_credits = request.args.get("min_credits", 0, type=float)
+    conn = get_conn()
+    rows = transcripts.honor_roll(conn, min_gpa, min_credits)
     conn.close()
     return jsonify(dict_rows(rows))
 
@@ -439,11 +655,29 @@ def get_enrollments():
 def create_enrollment():
     d = request.json; conn = get_conn()
     try:
-        conn.execute("INSERT INTO enrollments (student_id,course_id) VALUES (?,?)",
-                     (d["student_id"], d["course_id"]))
+        conn.execute("BEGIN IMMEDIATE")
+        enrollments.enroll(conn, d["student_id"], d["course_id"])
         conn.commit()
         return jsonify({"message": "Enrolled"}), 201
     except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+
+
+@app.route("/api/enrollments/bulk", methods=["POST"])
+def bulk_enrollment():
+    """Body: {course_ids, class_id | student_ids}. One transaction; returns a summary."""
+    d = request.json or {}
+    conn = get_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        summary = enrollments.bulk_enroll(conn, d.get("course_ids"), d.get("student_ids"), d.get("class_id"))
+        conn.commit()
+        return jsonify(summary)
+    except (ValueError, TypeError) as e:
+        conn.rollback()
         return jsonify({"error": str(e)}), 400
     finally:
         conn.close()
@@ -465,12 +699,13 @@ def assign_grade():
     try:
         existing = conn.execute("SELECT id FROM grades WHERE enrollment_id=?", (d["enrollment_id"],)).fetchone()
         if existing:
-            conn.execute("UPDATE grades SET score=?,letter_grade=?,remarks=? WHERE enrollment_id=?",
+            conn.execute("UPDATE grades SET score=?,letter_grade=?,remarks=?,graded_at=datetime('now') WHERE enrollment_id=?",
                          (score, letter, d.get("remarks",""), d["enrollment_id"]))
         else:
-            conn.execute("INSERT INTO grades (enrollment_id,score,letter_grade,remarks) VALUES (?,?,?,?)",
+            conn.execute("INSERT INTO grades (enrollment_id,score,letter_grade,remarks,graded_at) VALUES (?,?,?,?,datetime('now'))",
                          (d["enrollment_id"], score, letter, d.get("remarks","")))
         conn.commit()
+        notifications.notify_parents_of_grade_async(d["enrollment_id"], score, letter, d.get("remarks",""))
         return jsonify({"message": f"Grade: {score:.1f} ({letter})", "letter_grade": letter})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -478,27 +713,71 @@ def assign_grade():
         conn.close()
 
 
+@app.route("/api/grades/bulk", methods=["POST"])
+def bulk_grades():
+    """Save a score sheet. Body: {course_id?, grades: [{enrollment_id | student_id, score, remarks?}]}."""
+    d = request.json or {}
+    course_id = d.get("course_id")
+    if course_id is not None and not isinstance(course_id, int):
+        return jsonify({"error": "course_id must be an integer"}), 400
+    conn = get_conn()
+    try:
+        results = enrollments.upsert_grades(conn, d["grades"], course_id)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    counts = {k: sum(1 for r in results if r["result"] == k) for k in ("created", "updated", "unchanged", "rejected")}
+    changed = [r["enrollment_id"] for r in results if r["result"] in ("created", "updated")]
+    if changed:
+        notifications.notify_parents_of_grades_async(changed)
+    return jsonify({"message": f"Saved {len(results) - counts['rejected']} grades", **counts, "results": results})
+
+
+# ── Grade analytics ─────────────────────────────────────
+
+@app.route("/api/analytics/courses", methods=["GET"])
+@etag("grades", "enrollments", "courses")
+def get_school_analytics():
+    conn = get_conn()
+    rows = analytics.school_stats(conn)
+    conn.close()
+    return jsonify(rows)
+
+
+@app.route("/api/analytics/courses/<int:cid>", methods=["GET"])
+@etag("grades", "enrollments", "courses", "students")
+def get_course_analytics(cid):
+    conn = get_conn()
+    stats = analytics.course_stats(conn, cid)
+    conn.close()
+    if stats is None:
+        return jsonify({"error": "Course not found"}), 404
+    return jsonify(stats)
+
+
 # ── Attendance ──────────────────────────────────────────
 
 @app.route("/api/attendance", methods=["GET"])
+@etag("attendance", "students")
 def get_attendance():
     student_id = request.args.get("student_id")
     class_id = request.args.get("class_id")
     date = request.args.get("date")
     conn = get_conn()
     if student_id:
-        rows = conn.execute("""
-            SELECT * FROM attendance WHERE student_id=? ORDER BY date DESC
-        """, (student_id,)).fetchall()
-        data = dict_rows(rows)
-        total = len(data)
-        present = sum(1 for r in data if r["status"] == "Present")
-        late = sum(1 for r in data if r["status"] == "Late")
-        absent = sum(1 for r in data if r["status"] == "Absent")
-        excused = sum(1 for r in data if r["status"] == "Excused")
-        rate = (present + late) / total * 100 if total else 0
+        # Stats stay one aggregate row; records are the first page of /api/attendance/records.
+        date_from, date_to = request.args.get("from"), request.args.get("to")
+        stats = attendance.attendance_stats(conn, student_id, date_from, date_to)
+        limit = max(1, min(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        cond, params = attendance.date_range(date_from, date_to)
+        rows = conn.execute(f"""
+            SELECT * FROM attendance WHERE student_id=? AND {cond} ORDER BY date DESC LIMIT ?
+        """, (student_id, *params, limit + 1)).fetchall()
         conn.close()
-        return jsonify({"records": data, "stats": {"total": total, "present": present, "late": late, "absent": absent, "excused": excused, "rate": round(rate, 1)}})
+        data = dict_rows(rows[:limit])
+        next_cursor = encode_cursor([data[-1]["date"]]) if len(rows) > limit else None
+        return jsonify({"records": data, "next_cursor": next_cursor, "stats": stats})
     elif class_id and date:
         rows = conn.execute("""
             SELECT s.id AS student_id, s.first_name||' '||s.last_name AS name,
@@ -512,20 +791,55 @@ def get_attendance():
     return jsonify([])
 
 
+@app.route("/api/attendance/records", methods=["GET"])
+@etag("attendance")
+def get_attendance_records():
+    student_id = request.args.get("student_id", type=int)
+    if student_id is None:
+        return jsonify({"error": "student_id is required"}), 400
+    cond, params = attendance.date_range(request.args.get("from"), request.args.get("to"))
+    return list_response("SELECT * FROM attendance", [("date DESC", "date")],
+                         where=f"student_id=? AND {cond}", params=(student_id, *params))
+
+
+@app.route("/api/attendance/rates/students/<int:sid>", methods=["GET"])
+@etag("attendance")
+def get_student_attendance_rates(sid):
+    conn = get_conn()
+    months = attendance.student_monthly_rates(conn, sid, request.args.get("from"), request.args.get("to"))
+    conn.close()
+    return jsonify({"student_id": sid, "months": months})
+
+
+@app.route("/api/attendance/rates/classes/<int:cid>", methods=["GET"])
+@etag("attendance", "students")
+def get_class_attendance_rates(cid):
+    conn = get_conn()
+    students = attendance.class_rates(conn, cid, request.args.get("from"), request.args.get("to"))
+    conn.close()
+    totals = {k: sum(r[k] for r in students) for k in ("present", "absent", "late", "excused", "total")}
+    totals["rate"] = round((totals["present"] + totals["late"]) / totals["total"] * 100, 1) if totals["total"] else 0
+    return jsonify({"class_id": cid, "students": students, "totals": totals})
+
+
+@app.route("/api/attendance/rates/months", methods=["GET"])
+@etag("attendance")
+def get_monthly_attendance_rates():
+    conn = get_conn()
+    months = attendance.school_monthly_rates(conn, request.args.get("from"), request.args.get("to"))
+    conn.close()
+    return jsonify(months)
+
+
 @app.route("/api/attendance", methods=["POST"])
 def mark_attendance():
     d = request.json; conn = get_conn()
     try:
-        existing = conn.execute("SELECT id FROM attendance WHERE student_id=? AND date=?",
-                                (d["student_id"], d["date"])).fetchone()
-        if existing:
-            conn.execute("UPDATE attendance SET status=?,remarks=? WHERE id=?",
-                         (d["status"], d.get("remarks",""), existing["id"]))
-        else:
-            conn.execute("INSERT INTO attendance (student_id,date,status,remarks) VALUES (?,?,?,?)",
-                         (d["student_id"], d["date"], d["status"], d.get("remarks","")))
-        conn.commit()
-        return jsonify({"message": "Recorded"})
+        outcome, = attendance.upsert_attendance(conn, d["date"], [
+            {"student_id": d["student_id"], "status": d["status"], "remarks": d.get("remarks", "")}])
+        if outcome["result"] == "rejected":
+            return jsonify({"error": outcome["error"]}), 400
+        return jsonify({"message": "Recorded", "result": outcome["result"]})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
     finally:
@@ -538,17 +852,10 @@ def bulk_attendance():
     d = request.json  # { "date": "...", "records": [{"student_id":1,"status":"Present"}, ...] }
     conn = get_conn()
     try:
-        for rec in d["records"]:
-            existing = conn.execute("SELECT id FROM attendance WHERE student_id=? AND date=?",
-                                    (rec["student_id"], d["date"])).fetchone()
-            if existing:
-                conn.execute("UPDATE attendance SET status=?,remarks=? WHERE id=?",
-                             (rec["status"], rec.get("remarks",""), existing["id"]))
-            else:
-                conn.execute("INSERT INTO attendance (student_id,date,status,remarks) VALUES (?,?,?,?)",
-                             (rec["student_id"], d["date"], rec["status"], rec.get("remarks","")))
-        conn.commit()
-        return jsonify({"message": f"Recorded {len(d['records'])} entries"})
+        results = attendance.upsert_attendance(conn, d["date"], d["records"])
+        counts = {k: sum(1 for r in results if r["result"] == k) for k in ("created", "updated", "unchanged", "rejected")}
+        saved = len(results) - counts["rejected"]
+        return jsonify({"message": f"Recorded {saved} entries", **counts, "results": results})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
     finally:
@@ -558,6 +865,7 @@ def bulk_attendance():
 # ── Schedules ───────────────────────────────────────────
 
 @app.route("/api/schedules", methods=["GET"])
+@etag("schedules", "courses", "teachers", "students")
 def get_schedules():
     class_id = request.args.get("class_id")
     student_id = request.args.get("student_id")
@@ -575,10 +883,7 @@ def get_schedules():
             FROM schedules s JOIN courses c ON s.course_id=c.id
             LEFT JOIN teachers t ON c.teacher_id=t.id
             WHERE s.class_id=?
-            ORDER BY CASE s.day_of_week
-                WHEN 'Monday' THEN 1 WHEN 'Tuesday' THEN 2 WHEN 'Wednesday' THEN 3
-                WHEN 'Thursday' THEN 4 WHEN 'Friday' THEN 5 WHEN 'Saturday' THEN 6
-                WHEN 'Sunday' THEN 7 END, s.start_time
+            ORDER BY s.day_num, s.start_min
         """, (class_id,)).fetchall()
         conn.close()
         return jsonify(dict_rows(rows))
@@ -590,12 +895,58 @@ def get_schedules():
 def create_schedule():
     d = request.json; conn = get_conn()
     try:
-        conn.execute("INSERT INTO schedules (class_id,course_id,day_of_week,start_time,end_time,room) VALUES (?,?,?,?,?,?)",
-                     (d["class_id"], d["course_id"], d["day_of_week"], d["start_time"], d["end_time"], d.get("room","")))
+        conn.execute("BEGIN IMMEDIATE")
+        conflicts = schedules.find_conflicts(conn, d["class_id"], d["course_id"], d["day_of_week"],
+                                             d["start_time"], d["end_time"], d.get("room", ""))
+        if conflicts:
+            conn.rollback()
+            return jsonify({"error": "Slot clashes with existing bookings",
+                            "conflicts": [dict(slot, dimension=dim) for dim, slot in conflicts]}), 409
+        schedules.insert_slot(conn, d["class_id"], d["course_id"], d["day_of_week"], d["start_time"], d["end_time"],
+                              d.get("room", ""))
         conn.commit()
         return jsonify({"message": "Slot added"}), 201
     except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+
+
+@app.route("/api/schedules/conflicts", methods=["GET"])
+@etag("schedules", "courses", "classes")
+def get_schedule_conflicts():
+    conn = get_conn()
+    conflicts, malformed = schedules.all_conflicts(conn)
+    conn.close()
+    return jsonify({"conflicts": conflicts, "invalid": malformed})
+
+
+@app.route("/api/timetable", methods=["POST"])
+def create_timetable():
+    """Generate a timetable. Body: {rooms?, time_budget?, dry_run?}; the budget is capped at the configured one."""
+    d = request.json or {}
+    conn = get_conn()
+    try:
+        rooms = d.get("rooms")
+        if rooms is not None and not (isinstance(rooms, list)
+                                      and all(isinstance(r, str) and r.strip() for r in rooms)):
+            return jsonify({"error": "rooms must be a list of room names"}), 400
+        rooms = rooms or timetable.existing_rooms(conn)
+        budget = min(float(d.get("time_budget") or timetable.TIMETABLE_TIME_BUDGET_SECONDS),
+                     timetable.TIMETABLE_TIME_BUDGET_SECONDS)
+        result = timetable.generate(conn, rooms, budget)
+        if d.get("dry_run"):
+            result["preview"] = result.pop("slots")
+        else:
+            if result["slots"]:
+                timetable.apply_timetable(conn, result)
+            result["written"] = len(result.pop("slots"))
+        return jsonify(result)
+    except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
 
@@ -608,19 +959,212 @@ def delete_schedule(sid):
     return jsonify({"message": "Slot deleted"})
 
 
+@app.route("/api/schedules/send", methods=["POST"])
+def send_schedules():
+    """Queue schedule emails for a class (or the whole school) and deliver them in the background."""
+    d = request.json or {}
+    class_id = d.get("class_id")
+    if class_id is not None and not isinstance(class_id, int):
+        return jsonify({"error": "class_id must be an integer"}), 400
+    summary, ids = notifications.queue_schedules(class_id)
+    if summary is None:
+        return jsonify({"error": "SMTP is not configured"}), 503
+    if summary["queued"]:
+        outbox.deliver_in_background(ids=ids)
+    return jsonify(summary), 202
+
+
+@app.route("/api/digest/weekly", methods=["POST"])
+def send_weekly_digest():
+    """Queue every parent's weekly digest and deliver them in the background."""
+    d = request.json or {}
+    if not outbox.smtp_configured():
+        return jsonify({"error": "SMTP is not configured"}), 503
+    try:
+        messages, summary = digest.build_digests(d.get("week_ending"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "week_ending must be a date (YYYY-MM-DD)"}), 400
+    if messages:
+        outbox.deliver_in_background(ids=digest.queue_digests(messages))
+    return jsonify(summary), 202
+
+
+# ── Email outbox ────────────────────────────────────────
+
+@app.route("/api/outbox", methods=["GET"])
+@etag("email_outbox")
+def get_outbox():
+    conn = get_conn()
+    counts = outbox.outbox_counts(conn)
+    conn.close()
+    return jsonify(counts)
+
+
+@app.route("/api/outbox/drain", methods=["POST"])
+def drain_outbox():
+    """Deliver due emails now (for hosts where the background worker cannot run)."""
+    worker = outbox.OutboxWorker()
+    try:
+        sent, failed = worker.drain()
+    finally:
+        worker.close()
+    return jsonify({"sent": sent, "failed": failed})
+
+
+@app.route("/api/outbox/retry", methods=["POST"])
+def retry_outbox():
+    conn = get_conn()
+    count = outbox.requeue_dead(conn)
+    conn.close()
+    return jsonify({"requeued": count})
+
+
+# ── Bulk import and export ──────────────────────────────
+
+@app.route("/api/import/<entity>", methods=["POST"])
+def import_rows(entity):
+    """Import a CSV upload (multipart field "file") or a raw text/csv body, streamed row by row."""
+    upload = request.files.get("file")
+    stream = importer.text_stream(upload.stream if upload else request.stream)
+    conn = get_conn()
+    try:
+        return jsonify(importer.import_csv(conn, entity, stream))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+
+
+@app.route("/api/export/<name>", methods=["GET"])
+def export_rows(name):
+    """Stream a table or report. Query: format=csv|ndjson, gzip=1, since, until, class_id."""
+    fmt = request.args.get("format", "csv")
+    compress = request.args.get("gzip") in ("1", "true")
+    conn = get_conn()
+    try:
+        chunks = exporter.export(conn, name, fmt, compress, request.args.get("since"),
+                                 request.args.get("until"), request.args.get("class_id", type=int))
+    except ValueError as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 400
+
+    def stream():
+        try:
+            yield from chunks
+        finally:
+            conn.close()
+
+    resp = Response(stream(), mimetype="application/gzip" if compress else exporter.FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{exporter.filename(name, fmt, compress)}"'
+    return resp
+
+
+# ── Lookups ─────────────────────────────────────────────
+
+# id/label pairs for dropdowns, in the same order as the entity lists.
+LOOKUPS = {
+    "teachers": "SELECT id, first_name||' '||last_name FROM teachers ORDER BY last_name, first_name, id",
+    "classes": "SELECT id, name FROM classes ORDER BY grade_level, COALESCE(section, ''), id",
+    "courses": "SELECT id, code||' — '||name FROM courses ORDER BY code",
+    "students": "SELECT id, first_name||' '||last_name FROM students ORDER BY last_name, first_name, id",
+    "parents": "SELECT id, first_name||' '||last_name FROM parents ORDER BY last_name, first_name, id",
+}
+
+# (table versions, encoded body) of the last /api/lookups response.
+_lookups_cache = (None, None)
+
+
+@app.route("/api/lookups", methods=["GET"])
+@etag(*LOOKUPS)
+def get_lookups():
+    """All dropdown options as {"teachers": [[id, label], ...], ...}.
+
+    The encoded body is reused until a write bumps one of the tables' versions.
+    """
+    global _lookups_cache
+    versions = table_versions(tuple(LOOKUPS))
+    cached_versions, body = _lookups_cache
+    if versions != cached_versions:
+        conn = get_conn()
+        data = {name: [list(r) for r in conn.execute(sql)] for name, sql in LOOKUPS.items()}
+        conn.close()
+        body = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        _lookups_cache = (versions, body)
+    return Response(body, mimetype="application/json")
+
+
+# ── Change feed ─────────────────────────────────────────
+
+# Beyond this many changed rows a client is better off reloading its lists.
+MAX_CHANGES = 5000
+
+
+@app.route("/api/changes", methods=["GET"])
+def get_changes():
+    """Entity rows upserted or deleted since `?since=<cursor>`.
+
+    Without `since`, returns only the current cursor: take it before
+    loading the full lists, then poll with it. `reset: true` means the
+    cursor is unusable (another database, too far behind, or older than
+    the trimmed change log keeps) and the client must reload its lists.
+    """
+    since = request.args.get("since", type=int)
+    conn = get_conn()
+    try:
+        cursor = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'").fetchone()["seq"]
+        if since is None:
+            return jsonify({"cursor": cursor})
+        if since >> 32 != cursor >> 32 or since > cursor:
+            return jsonify({"cursor": cursor, "reset": True})
+        # Entries after `since` have been trimmed (see migrations.CHANGE_LOG_MAX_ROWS).
+        oldest = conn.execute("SELECT MIN(seq) AS seq FROM change_log").fetchone()["seq"]
+        if oldest is not None and since < oldest - 1:
+            return jsonify({"cursor": cursor, "reset": True})
+        # Latest operation per row; the cursor moves to the last entry read.
+        rows = conn.execute("""
+            SELECT table_name, row_id, op, seq FROM change_log
+            WHERE seq IN (SELECT MAX(seq) FROM change_log WHERE seq > ? AND seq <= ?
+                          GROUP BY table_name, row_id)
+        """, (since, cursor)).fetchall()
+        if len(rows) > MAX_CHANGES:
+            return jsonify({"cursor": cursor, "reset": True})
+        changes = {}
+        for r in rows:
+            entry = changes.setdefault(r["table_name"], {"upserted": [], "deleted": []})
+            entry["deleted" if r["op"] == "delete" else "upserted"].append(r["row_id"])
+        for table, entry in changes.items():
+            select, id_expr, _keys = ENTITY_LISTS[table]
+            found = conn.execute(f"{select} WHERE {id_expr} IN (SELECT value FROM json_each(?))",
+                                 (json.dumps(entry["upserted"]),)).fetchall()
+            # An upserted row that has since vanished is reported as deleted.
+            entry["deleted"].extend(set(entry["upserted"]) - {r["id"] for r in found})
+            entry["upserted"] = dict_rows(found)
+        return jsonify({"cursor": cursor, "reset": False, "changes": changes})
+    finally:
+        conn.close()
+
+
 # ── Dashboard stats ─────────────────────────────────────
 
 @app.route("/api/dashboard", methods=["GET"])
+@etag(*migrations.COUNTED_TABLES, "grades", "attendance", vary=date.today)
 def dashboard():
+    """Counts, today's attendance and the grade distribution, from the trigger-kept
+    counters and attendance_daily tables (see migrations.py) in one query."""
+    today = request.args.get("date") or date.today().isoformat()
     conn = get_conn()
-    stats = {
-        "students": conn.execute("SELECT COUNT(*) AS c FROM students").fetchone()["c"],
-        "teachers": conn.execute("SELECT COUNT(*) AS c FROM teachers").fetchone()["c"],
-        "courses":  conn.execute("SELECT COUNT(*) AS c FROM courses").fetchone()["c"],
-        "classes":  conn.execute("SELECT COUNT(*) AS c FROM classes").fetchone()["c"],
-        "parents":  conn.execute("SELECT COUNT(*) AS c FROM parents").fetchone()["c"],
-        "enrollments": conn.execute("SELECT COUNT(*) AS c FROM enrollments").fetchone()["c"],
-    }
+    row = conn.execute("""
+        SELECT (SELECT json_group_object(name, value) FROM counters) AS counters,
+               COALESCE(d.present, 0) AS present, COALESCE(d.absent, 0) AS absent,
+               COALESCE(d.late, 0) AS late, COALESCE(d.excused, 0) AS excused
+        FROM (SELECT 1) LEFT JOIN attendance_daily d ON d.date = ?
+    """, (today,)).fetchone()
     conn.close()
+    counters = json.loads(row["counters"])
+    stats = {table: counters.get(table, 0) for table in migrations.COUNTED_TABLES}
+    today_row = {k: row[k] for k in ("present", "absent", "late", "excused")}
+    stats["attendance_today"] = dict(attendance.with_rate(today_row), date=today)
+    stats["grade_distribution"] = {name[6:]: n for name, n in sorted(counters.items())
+                                   if name.startswith("grade:") and n}
     return jsonify(stats)
 
@@ -1,31 +1,123 @@
+import json
+import re
+from datetime import date as _date
+
 from database import get_connection
 
 
 VALID_STATUSES = ("Present", "Absent", "Late", "Excused")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# One day's attendance upserted from a JSON array of [student_id, status, remarks];
+# rows whose status and remarks are unchanged are left alone.
+BULK_UPSERT_SQL = """
+    INSERT INTO attendance (student_id, date, status, remarks)
+    SELECT json_extract(value, '$[0]'), ?, json_extract(value, '$[1]'), json_extract(value, '$[2]')
+    FROM json_each(?) WHERE true
+    ON CONFLICT(student_id, date) DO UPDATE SET status=excluded.status, remarks=excluded.remarks
+    WHERE status IS NOT excluded.status OR remarks IS NOT excluded.remarks
+"""
+
+
+def check_date(date):
+    """Raise ValueError unless `date` is a real YYYY-MM-DD date."""
+    try:
+        # fromisoformat() alone would also take forms like 20261012, which break the month keys.
+        if not isinstance(date, str) or not _DATE.fullmatch(date):
+            raise ValueError
+        _date.fromisoformat(date)
+    except ValueError:
+        raise ValueError(f"Invalid date '{date}', expected YYYY-MM-DD") from None
+
+
+def upsert_attendance(conn, date, records):
+    """Record a day's attendance for many students in one transaction.
+
+    `records` is a list of {"student_id", "status", "remarks"?} dicts. Bad
+    records (unknown status or student, duplicates) are rejected before
+    anything is written; the rest are saved by a single upsert statement,
+    which skips rows whose status and remarks did not change.
+    Returns one {"student_id", "result", "error"?} outcome per record,
+    where result is "created", "updated", "unchanged" or "rejected".
+    The outcomes are read under the same write lock as the upsert, so
+    concurrent submissions cannot make them wrong.
+    """
+    check_date(date)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        outcomes, batch = _classify(conn, date, records)
+        conn.execute(BULK_UPSERT_SQL, (date, json.dumps(batch)))
+    return outcomes
+
+
+def _classify(conn, date, records):
+    """(outcomes, rows to upsert) for `records` against the attendance currently stored."""
+    ids = [r.get("student_id") for r in records]
+    current = {row[0]: row for row in conn.execute("""
+        SELECT s.id, a.id, a.status, a.remarks
+        FROM students s LEFT JOIN attendance a ON a.student_id = s.id AND a.date = ?
+        WHERE s.id IN (SELECT value FROM json_each(?))
+    """, (date, json.dumps([i for i in ids if isinstance(i, int)])))}
+
+    outcomes, batch, seen = [], [], set()
+    for rec, sid in zip(records, ids):
+        error = None
+        if rec.get("status") not in VALID_STATUSES:
+            error = f"Invalid status. Choose from: {', '.join(VALID_STATUSES)}"
+        elif sid not in current:
+            error = "Student not found"
+        elif sid in seen:
+            error = "Duplicate record for student"
+        if error:
+            outcomes.append({"student_id": sid, "result": "rejected", "error": error})
+            continue
+        seen.add(sid)
+        status, remarks = rec["status"], rec.get("remarks", "")
+        _, existing_id, old_status, old_remarks = current[sid]
+        if existing_id is None:
+            result = "created"
+        elif (old_status, old_remarks) == (status, remarks):
+            result = "unchanged"
+        else:
+            result = "updated"
+        batch.append([sid, status, remarks])
+        outcomes.append({"student_id": sid, "result": result})
+    return outcomes, batch
+
+
+def date_range(date_from=None, date_to=None):
+    """SQL condition and params restricting attendance.date to an inclusive range."""
+    return "date BETWEEN ? AND ?", (date_from or "0000-01-01", date_to or "9999-12-31")
+
+
+def attendance_stats(conn, student_id, date_from=None, date_to=None):
+    """Status counts and attendance rate for one student, in a single aggregate query."""
+    cond, params = date_range(date_from, date_to)
+    row = conn.execute(f"""
+        SELECT COUNT(*) AS total,
+               COALESCE(SUM(status = 'Present'), 0) AS present,
+               COALESCE(SUM(status = 'Absent'), 0) AS absent,
+               COALESCE(SUM(status = 'Late'), 0) AS late,
+               COALESCE(SUM(status = 'Excused'), 0) AS excused
+        FROM attendance
+        WHERE student_id = ? AND {cond}
+    """, (student_id, *params)).fetchone()
+    stats = dict(row)
+    total = stats["total"]
+    stats["rate"] = round((stats["present"] + stats["late"]) / total * 100, 1) if total else 0
+    return stats
 
 
 def mark_attendance(student_id, date, status, remarks=""):
-    if status not in VALID_STATUSES:
-        print(f"Invalid status. Choose from: {', '.join(VALID_STATUSES)}")
-        return
     conn = get_connection()
     try:
-        existing = conn.execute(
-            "SELECT id FROM attendance WHERE student_id=? AND date=?",
-            (student_id, date),
-        ).fetchone()
-        if existing:
-            conn.execute(
-                "UPDATE attendance SET status=?, remarks=? WHERE id=?",
-                (status, remarks, existing["id"]),
-            )
+        outcome, = upsert_attendance(conn, date, [{"student_id": student_id, "status": status, "remarks": remarks}])
+        if outcome["result"] == "rejected":
+            print(outcome["error"] + ".")
         else:
-            conn.execute(
-                "INSERT INTO attendance (student_id, date, status, remarks) VALUES (?, ?, ?, ?)",
-                (student_id, date, status, remarks),
-            )
-        conn.commit()
-        print(f"Attendance recorded: Student {student_id} — {status} on {date}")
+            print(f"Attendance recorded: Student {student_id} — {status} on {date}")
+    except ValueError as e:
+        print(e)
     except Exception as e:
         print(f"Error: {e}")
     finally:
@@ -34,6 +126,11 @@ def mark_attendance(student_id, date, status, remarks=""):
 
 def mark_class_attendance(class_id, date):
     """Interactively mark attendance for all students in a class."""
+    try:
+        check_date(date)
+    except ValueError as e:
+        print(e)
+        return
     conn = get_connection()
     students = conn.execute("""
         SELECT id, first_name, last_name
@@ -61,7 +158,7 @@ def mark_class_attendance(class_id, date):
             print("    Invalid. Use P, A, L, or E.")
 
 
-def view_attendance_by_student(student_id):
+def view_attendance_by_student(student_id, date_from=None, date_to=None):
     conn = get_connection()
     student = conn.execute(
         "SELECT first_name, last_name FROM students WHERE id=?", (student_id,)
@@ -71,32 +168,26 @@ def view_attendance_by_student(student_id):
         conn.close()
         return
 
-    rows = conn.execute("""
-        SELECT date, status, remarks
-        FROM attendance
-        WHERE student_id = ?
-        ORDER BY date DESC
-    """, (student_id,)).fetchall()
-    conn.close()
-
-    if not rows:
+    s = attendance_stats(conn, student_id, date_from, date_to)
+    if not s["total"]:
         print(f"No attendance records for {student['first_name']} {student['last_name']}.")
+        conn.close()
         return
 
-    total = len(rows)
-    present = sum(1 for r in rows if r["status"] == "Present")
-    absent = sum(1 for r in rows if r["status"] == "Absent")
-    late = sum(1 for r in rows if r["status"] == "Late")
-    excused = sum(1 for r in rows if r["status"] == "Excused")
-    rate = (present + late) / total * 100 if total else 0
-
     print(f"\nAttendance for {student['first_name']} {student['last_name']}:")
-    print(f"  Total: {total} | Present: {present} | Absent: {absent} | Late: {late} | Excused: {excused}")
-    print(f"  Attendance rate: {rate:.1f}%\n")
+    print(f"  Total: {s['total']} | Present: {s['present']} | Absent: {s['absent']} | Late: {s['late']} | Excused: {s['excused']}")
+    print(f"  Attendance rate: {s['rate']:.1f}%\n")
     print(f"{'Date':<14} {'Status':<10} {'Remarks'}")
     print("-" * 45)
-    for r in rows:
+    cond, params = date_range(date_from, date_to)
+    for r in conn.execute(f"""
+        SELECT date, status, remarks
+        FROM attendance
+        WHERE student_id = ? AND {cond}
+        ORDER BY date DESC
+    """, (student_id, *params)):
         print(f"{r['date']:<14} {r['status']:<10} {r['remarks'] or ''}")
+    conn.close()
 
 
 def view_attendance_by_class_date(class_id, date):
@@ -121,3 +212,104 @@ def view_attendance_by_class_date(class_id, date):
     for r in rows:
         status = r["status"] or "Not marked"
         print(f"{r['student_id']:<5} {r['name']:<25} {status:<10} {r['remarks'] or ''}")
+
+
+# ── Monthly summary (attendance_monthly, kept current by triggers) ──
+
+_SUMMED = """SUM(m.present) AS present, SUM(m.absent) AS absent,
+             SUM(m.late) AS late, SUM(m.excused) AS excused"""
+
+
+def month_range(month_from=None, month_to=None):
+    """SQL condition and params restricting attendance_monthly.month (YYYY-MM) to a range."""
+    return "m.month BETWEEN ? AND ?", (month_from or "0000-01", month_to or "9999-12")
+
+
+def with_rate(row):
+    d = dict(row)
+    d["total"] = d["present"] + d["absent"] + d["late"] + d["excused"]
+    d["rate"] = round((d["present"] + d["late"]) / d["total"] * 100, 1) if d["total"] else 0
+    return d
+
+
+def student_monthly_rates(conn, student_id, month_from=None, month_to=None):
+    cond, params = month_range(month_from, month_to)
+    rows = conn.execute(f"""
+        SELECT m.month, {_SUMMED}
+        FROM attendance_monthly m
+        WHERE m.student_id = ? AND {cond}
+        GROUP BY m.month ORDER BY m.month
+    """, (student_id, *params)).fetchall()
+    return [with_rate(r) for r in rows]
+
+
+def class_rates(conn, class_id, month_from=None, month_to=None):
+    """One rate per student currently in the class, over the month range."""
+    cond, params = month_range(month_from, month_to)
+    rows = conn.execute(f"""
+        SELECT s.id AS student_id, s.first_name || ' ' || s.last_name AS name,
+               COALESCE(SUM(m.present), 0) AS present, COALESCE(SUM(m.absent), 0) AS absent,
+               COALESCE(SUM(m.late), 0) AS late, COALESCE(SUM(m.excused), 0) AS excused
+        FROM students s
+        LEFT JOIN attendance_monthly m ON m.student_id = s.id AND {cond}
+        WHERE s.class_id = ?
+        GROUP BY s.id ORDER BY s.last_name, s.first_name
+    """, (*params, class_id)).fetchall()
+    return [with_rate(r) for r in rows]
+
+
+def school_monthly_rates(conn, month_from=None, month_to=None):
+    cond, params = month_range(month_from, month_to)
+    rows = conn.execute(f"""
+        SELECT m.month, {_SUMMED}
+        FROM attendance_monthly m
+        WHERE {cond}
+        GROUP BY m.month ORDER BY m.month
+    """, params).fetchall()
+    return [with_rate(r) for r in rows]
+
+
+def rebuild_summary(conn):
+    """Recompute attendance_monthly and attendance_daily from the attendance table.
+
+    Returns the attendance_monthly row count.
+    """
+    with conn:
+        conn.execute("DELETE FROM attendance_monthly")
+        conn.execute("""
+            INSERT INTO attendance_monthly (student_id, month, present, absent, late, excused)
+            SELECT student_id, substr(date, 1, 7), SUM(status = 'Present'), SUM(status = 'Absent'),
+                   SUM(status = 'Late'), SUM(status = 'Excused')
+            FROM attendance GROUP BY student_id, substr(date, 1, 7)
+        """)
+        conn.execute("DELETE FROM attendance_daily")
+        conn.execute("""
+            INSERT INTO attendance_daily (date, present, absent, late, excused)
+            SELECT date, SUM(status = 'Present'), SUM(status = 'Absent'), SUM(status = 'Late'), SUM(status = 'Excused')
+            FROM attendance GROUP BY date
+        """)
+    return conn.execute("SELECT COUNT(*) FROM attendance_monthly").fetchone()[0]
+
+
+def rebuild_attendance_summary():
+    conn = get_connection()
+    try:
+        count = rebuild_summary(conn)
+        print(f"Attendance summary rebuilt: {count} student-month rows.")
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+def view_class_attendance_rates(class_id, month_from=None, month_to=None):
+    conn = get_connection()
+    rows = class_rates(conn, class_id, month_from, month_to)
+    conn.close()
+    if not rows:
+        print("No students found in this class.")
+        return
+    print(f"\n{'ID':<5} {'Name':<25} {'Total':<7} {'Present':<9} {'Absent':<8} {'Late':<6} {'Excused':<9} {'Rate'}")
+    print("-" * 80)
+    for r in rows:
+        print(f"{r['student_id']:<5} {r['name']:<25} {r['total']:<7} {r['present']:<9} {r['absent']:<8} {r['late']:<6} {r['excused']:<9} {r['rate']:.1f}%")
@@ -0,0 +1,69 @@
+"""
+Benchmark: bulk attendance for one class, legacy loop vs. upsert.
+
+The legacy path is the old /api/attendance/bulk body (SELECT, then
+INSERT or UPDATE, per record); the upsert path is
+attendance.upsert_attendance(). Runs against a throwaway database.
+
+    python benchmarks/attendance_bulk.py [rounds]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+from attendance import upsert_attendance
+
+CLASS_SIZES = (30, 100, 300, 1000)
+STATUSES = ("Present", "Absent", "Late", "Excused")
+
+
+def legacy_bulk(conn, date, records):
+    for rec in records:
+        existing = conn.execute("SELECT id FROM attendance WHERE student_id=? AND date=?",
+                                (rec["student_id"], date)).fetchone()
+        if existing:
+            conn.execute("UPDATE attendance SET status=?,remarks=? WHERE id=?",
+                         (rec["status"], rec.get("remarks", ""), existing["id"]))
+        else:
+            conn.execute("INSERT INTO attendance (student_id,date,status,remarks) VALUES (?,?,?,?)",
+                         (rec["student_id"], date, rec["status"], rec.get("remarks", "")))
+    conn.commit()
+
+
+def run(rounds=5):
+    tmp = tempfile.mkdtemp()
+    database.set_db_path(os.path.join(tmp, "bench.db"))
+    database.init_db()
+    conn = database.get_connection()
+    conn.executemany("INSERT INTO students (first_name, last_name) VALUES (?, ?)",
+                     [(f"S{i}", "Bench") for i in range(max(CLASS_SIZES))])
+    conn.commit()
+    ids = [r[0] for r in conn.execute("SELECT id FROM students ORDER BY id")]
+
+    print(f"{'Class size':<12} {'Legacy rec/s':>14} {'Upsert rec/s':>14} {'Speed-up':>10}")
+    print("-" * 54)
+    day = 0
+    for size in CLASS_SIZES:
+        timings = {}
+        for name, fn in (("legacy", legacy_bulk), ("upsert", upsert_attendance)):
+            elapsed = 0.0
+            for r in range(rounds):
+                # First round of each day inserts, second one updates the same rows.
+                date = f"2025-{1 + day // 28:02d}-{1 + day % 28:02d}"
+                records = [{"student_id": sid, "status": STATUSES[(sid + r) % 4]} for sid in ids[:size]]
+                start = time.perf_counter()
+                fn(conn, date, records)
+                elapsed += time.perf_counter() - start
+                if r % 2:
+                    day += 1
+            timings[name] = size * rounds / elapsed
+        print(f"{size:<12} {timings['legacy']:>14,.0f} {timings['upsert']:>14,.0f} "
+              f"{timings['upsert'] / timings['legacy']:>9.1f}x")
+    conn.close()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
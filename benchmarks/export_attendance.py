@@ -0,0 +1,77 @@
+"""
+Benchmark: exporting attendance, JSON list vs. streaming export.
+
+The list path is how the JSON endpoints answer (fetchall, a dict per
+row, one json.dumps); the streaming path is exporter.export() as CSV.
+Both write to a throwaway file. Peak memory is Python heap as seen by
+tracemalloc. Runs against a throwaway database.
+
+    python benchmarks/export_attendance.py [largest size]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+from exporter import export
+
+SIZES = (10000, 100000, 1000000)
+STUDENTS = 1000
+STATUSES = ("Present", "Absent", "Late", "Excused")
+FIRST_DAY = date(2000, 1, 1)
+
+
+def list_export(conn, out):
+    rows = [dict(r) for r in conn.execute("SELECT * FROM attendance ORDER BY date, id").fetchall()]
+    out.write(json.dumps(rows).encode())
+
+
+def stream_export(conn, out):
+    for chunk in export(conn, "attendance"):
+        out.write(chunk)
+
+
+def measure(fn, conn, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(path, "wb") as out:
+        fn(conn, out)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+def run(largest=max(SIZES)):
+    tmp = tempfile.mkdtemp()
+    database.set_db_path(os.path.join(tmp, "bench.db"))
+    database.init_db()
+    conn = database.get_connection()
+    conn.executemany("INSERT INTO students (first_name, last_name) VALUES (?, ?)",
+                     [(f"S{i}", "Bench") for i in range(STUDENTS)])
+    conn.commit()
+    out = os.path.join(tmp, "out")
+
+    print(f"{'Rows':<10} {'List time':>10} {'List peak':>11} {'Stream time':>12} {'Stream peak':>12}")
+    print("-" * 60)
+    rows = 0
+    for n in (s for s in SIZES if s <= largest):
+        # One record per student per day, days counted from FIRST_DAY.
+        conn.executemany("INSERT INTO attendance (student_id, date, status) VALUES (?, ?, ?)",
+                         ((k % STUDENTS + 1, (FIRST_DAY + timedelta(days=k // STUDENTS)).isoformat(), STATUSES[k % 4])
+                          for k in range(rows, n)))
+        conn.commit()
+        rows = n
+        list_time, list_peak = measure(list_export, conn, out)
+        stream_time, stream_peak = measure(stream_export, conn, out)
+        print(f"{n:<10} {list_time:>9.2f}s {list_peak:>8.1f} MB {stream_time:>11.2f}s {stream_peak:>9.1f} MB")
+    conn.close()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else max(SIZES))
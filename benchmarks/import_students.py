@@ -0,0 +1,73 @@
+"""
+Benchmark: CSV import of students, row per transaction vs. importer.
+
+The legacy path inserts and commits one row at a time, as POST
+/api/students does; the import path is importer.import_csv() on the same
+file. Each run starts from an empty throwaway database.
+
+    python benchmarks/import_students.py [largest size]
+"""
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+from importer import import_csv
+
+SIZES = (1000, 10000, 100000)
+LEGACY_MAX = 10000  # the row-by-row path is only timed up to this size
+
+
+def write_csv(path, n):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["first_name", "last_name", "date_of_birth", "email", "phone"])
+        for i in range(n):
+            writer.writerow([f"First{i}", f"Last{i}", f"20{i % 10:02d}-0{i % 9 + 1}-1{i % 9}",
+                             f"student{i}@school.test", f"555-{i:07d}"])
+
+
+def fresh_db(tmp, name):
+    database.set_db_path(os.path.join(tmp, name))
+    database.init_db()
+    return database.get_connection()
+
+
+def legacy_import(conn, path):
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            conn.execute("INSERT INTO students (first_name,last_name,date_of_birth,email,phone) VALUES (?,?,?,?,?)",
+                         (row["first_name"], row["last_name"], row["date_of_birth"], row["email"], row["phone"]))
+            conn.commit()
+
+
+def run(largest=max(SIZES)):
+    tmp = tempfile.mkdtemp()
+    print(f"{'Rows':<10} {'Legacy rows/s':>14} {'Import rows/s':>14} {'Import time':>12} {'Speed-up':>10}")
+    print("-" * 64)
+    for n in (s for s in SIZES if s <= largest):
+        path = os.path.join(tmp, f"students{n}.csv")
+        write_csv(path, n)
+        legacy = None
+        if n <= LEGACY_MAX:
+            conn = fresh_db(tmp, f"legacy{n}.db")
+            start = time.perf_counter()
+            legacy_import(conn, path)
+            legacy = n / (time.perf_counter() - start)
+            conn.close()
+        conn = fresh_db(tmp, f"import{n}.db")
+        start = time.perf_counter()
+        with open(path, newline="") as f:
+            result = import_csv(conn, "students", f)
+        elapsed = time.perf_counter() - start
+        conn.close()
+        assert result["inserted"] == n, result["errors"][:5]
+        print(f"{n:<10} {f'{legacy:,.0f}' if legacy else '-':>14} {n / elapsed:>14,.0f} {elapsed:>11.2f}s "
+              f"{f'{n / elapsed / legacy:.1f}x' if legacy else '-':>10}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else max(SIZES))
@@ -0,0 +1,74 @@
+"""
+Benchmark: timetable generation on synthetic schools of 50 to 500 classes.
+
+Each school has twelve grade levels with their own teachers. Every class
+takes eight courses of 2 to 5 hours (28 of the 35 weekly periods), each
+teacher teaches one subject for up to 25 hours, and there are rooms for
+90% of the classes. Every school is solved with one process and with
+TIMETABLE_WORKERS processes. Runs against throwaway databases.
+
+    python benchmarks/timetable.py [time budget in seconds]
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+from timetable import TIMETABLE_WORKERS, generate
+
+SCHOOL_SIZES = (50, 100, 250, 500)
+GRADE_LEVELS = 12
+SUBJECT_HOURS = {"MATH": 5, "LANG": 5, "SCI": 4, "HIST": 4, "GEO": 3, "ART": 3, "MUS": 2, "PE": 2}
+TEACHER_HOURS = 25
+
+
+def build_school(path, n_classes):
+    database.set_db_path(path)
+    database.init_db()
+    conn = database.get_connection()
+    teacher_id = 0
+    for c in range(n_classes):
+        grade = c % GRADE_LEVELS + 1
+        conn.execute("INSERT INTO classes (id, name, grade_level) VALUES (?, ?, ?)", (c + 1, f"{grade}-{c}", str(grade)))
+        conn.execute("INSERT INTO students (id, first_name, last_name, class_id) VALUES (?, ?, ?, ?)",
+                     (c + 1, "S", str(c), c + 1))
+    for grade in range(1, GRADE_LEVELS + 1):
+        classes = list(range(grade, n_classes + 1, GRADE_LEVELS))
+        for subject, hours in SUBJECT_HOURS.items():
+            per_teacher = TEACHER_HOURS // hours
+            for k, class_id in enumerate(classes):
+                if k % per_teacher == 0:
+                    teacher_id += 1
+                    conn.execute("INSERT INTO teachers (id, first_name, last_name) VALUES (?, ?, ?)",
+                                 (teacher_id, subject, str(teacher_id)))
+                cur = conn.execute(
+                    "INSERT INTO courses (name, code, teacher_id, weekly_hours) VALUES (?, ?, ?, ?)",
+                    (subject, f"{subject}-{class_id}", teacher_id, hours))
+                conn.execute("INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)",
+                             (class_id, cur.lastrowid))
+    conn.commit()
+    return conn
+
+
+def run(time_budget=30):
+    tmp = tempfile.mkdtemp()
+    print(f"{os.cpu_count()} CPU(s); worker processes are capped at the CPU count.\n")
+    print(f"{'Classes':<9} {'Lessons':>8} {'Rooms':>6}   {'1 process':>20}   {TIMETABLE_WORKERS:>2} processes{'':>8} "
+          f"{'Speed-up':>8}")
+    print("-" * 82)
+    for n in SCHOOL_SIZES:
+        conn = build_school(os.path.join(tmp, f"school{n}.db"), n)
+        rooms = [f"R{i}" for i in range(1, -(-n * 9 // 10) + 1)]
+        runs = {}
+        for workers in (1, TIMETABLE_WORKERS):
+            result = generate(conn, rooms, time_budget, workers)
+            runs[workers] = result
+        conn.close()
+        cells = [f"{r['placed']:>5}/{r['lessons']:<5} {r['seconds']:>7.2f}s" for r in runs.values()]
+        print(f"{n:<9} {runs[1]['lessons']:>8} {len(rooms):>6}   {cells[0]:>20}   {cells[1]:>20} "
+              f"{runs[1]['seconds'] / runs[TIMETABLE_WORKERS]['seconds']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 30)
@@ -18,3 +18,38 @@ SMTP_PORT = 587
 SMTP_USER = ""        # e.g. "school@gmail.com"
 SMTP_PASSWORD = ""    # e.g. "abcd efgh ijkl mnop" (Gmail App Password)
 SENDER_NAME = "School Management System"
+SMTP_USE_TLS = True   # STARTTLS after connecting; set False for a local relay
+SMTP_AUTH = True      # log in with SMTP_USER/SMTP_PASSWORD; set False for an unauthenticated
+                      # local relay (SMTP_USER is then only the sender address)
+
+# Email outbox delivery
+OUTBOX_BATCH_SIZE = 50          # messages claimed per round trip to the outbox table
+OUTBOX_MAX_ATTEMPTS = 5         # after this many failures a message is dead-lettered
+OUTBOX_RETRY_BASE_SECONDS = 30  # retry delay doubles with every failed attempt
+OUTBOX_POLL_SECONDS = 5         # background worker sleep when the outbox is empty
+OUTBOX_AUTOSTART = True         # start a background delivery worker in the CLI and API
+OUTBOX_WORKERS = 4              # parallel SMTP sessions for bulk mailings
+OUTBOX_RATE_PER_SECOND = 10     # max messages per second across all workers (0 = unlimited)
+
+# Database connection pool / SQLite tuning
+DB_POOL_SIZE = 8              # idle connections kept per database file
+DB_BUSY_TIMEOUT_MS = 5000     # wait this long for a write lock before failing
+DB_CACHE_SIZE_KB = 20000      # page cache per connection
+DB_MMAP_SIZE = 268435456      # 256 MB memory-mapped I/O
+
+# Timetable generator
+TIMETABLE_DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday")
+TIMETABLE_PERIODS = (("08:00", "08:50"), ("09:00", "09:50"), ("10:00", "10:50"), ("11:00", "11:50"),
+                     ("13:00", "13:50"), ("14:00", "14:50"), ("15:00", "15:50"))
+TIMETABLE_TIME_BUDGET_SECONDS = 10  # search time per run before the best partial timetable is kept
+TIMETABLE_WORKERS = 4               # processes solving independent grade levels in parallel
+
+# Bulk CSV import
+IMPORT_CHUNK_SIZE = 5000   # rows written per transaction
+IMPORT_MAX_ERRORS = 1000   # per-row errors kept in an import summary (all are counted)
+
+# Streaming export
+EXPORT_BATCH_ROWS = 1000   # rows fetched from the cursor and encoded per chunk
+
+# Weekly parent digest
+DIGEST_WORKERS = 4         # processes rendering digests in parallel
@@ -1,12 +1,12 @@
 from database import get_connection
 
 
-def add_course(name, code, description, teacher_id, max_capacity):
+def add_course(name, code, description, teacher_id, max_capacity, credits=1, weekly_hours=3):
     conn = get_connection()
     try:
         conn.execute(
-            "INSERT INTO courses (name, code, description, teacher_id, max_capacity) VALUES (?, ?, ?, ?, ?)",
-            (name, code, description, teacher_id or None, max_capacity),
+            "INSERT INTO courses (name, code, description, teacher_id, max_capacity, credits, weekly_hours) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (name, code, description, teacher_id or None, max_capacity, credits, weekly_hours),
         )
         conn.commit()
         print(f"Course '{name}' ({code}) added successfully.")
@@ -28,17 +28,18 @@ def list_courses():
     if not rows:
         print("No courses found.")
         return
-    print(f"\n{'ID':<5} {'Code':<10} {'Name':<25} {'Teacher':<25} {'Capacity':<10} {'Description'}")
-    print("-" * 100)
+    print(f"\n{'ID':<5} {'Code':<10} {'Name':<25} {'Teacher':<25} {'Enrolled':<10} {'Credits':<9} {'Hours/wk':<10} {'Description'}")
+    print("-" * 120)
     for r in rows:
-        print(f"{r['id']:<5} {r['code']:<10} {r['name']:<25} {r['teacher_name'] or 'Unassigned':<25} {r['max_capacity']:<10} {r['description'] or ''}")
+        seats = f"{r['enrolled_count']}/{r['max_capacity']}"
+        print(f"{r['id']:<5} {r['code']:<10} {r['name']:<25} {r['teacher_name'] or 'Unassigned':<25} {seats:<10} {r['credits']:<9g} {r['weekly_hours']:<10} {r['description'] or ''}")
 
 
-def update_course(course_id, name, code, description, teacher_id, max_capacity):
+def update_course(course_id, name, code, description, teacher_id, max_capacity, credits=1, weekly_hours=3):
     conn = get_connection()
     conn.execute(
-        "UPDATE courses SET name=?, code=?, description=?, teacher_id=?, max_capacity=? WHERE id=?",
-        (name, code, description, teacher_id or None, max_capacity, course_id),
+        "UPDATE courses SET name=?, code=?, description=?, teacher_id=?, max_capacity=?, credits=?, weekly_hours=? WHERE id=?",
+        (name, code, description, teacher_id or None, max_capacity, credits, weekly_hours, course_id),
     )
     conn.commit()
     conn.close()
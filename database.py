@@ -1,14 +1,127 @@
 import sqlite3
 import os
+import queue
+import threading
+
+from migrations import migrate
+
+try:
+    from config import DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE
+except ImportError:
+    DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE = 8, 5000, 20000, 268435456
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "school.db")
 
 
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool."""
+
+    pool = None
+    checked_out = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Reusable connections to one database file.
+
+    Released connections go back to a shared idle queue of at most `size`
+    entries, last in first out, so any thread (including a short-lived
+    request thread) picks up the most recently used connection. PRAGMAs
+    are applied once, when a connection is first opened.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA cache_size = -{int(DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def connect(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        if conn is not None and not self._healthy(conn):
+            conn.discard()
+            conn = None
+        if conn is None:
+            conn = self._open()
+        conn.pool = self
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        conn.row_factory = sqlite3.Row
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.discard()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().discard()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    path = path or DB_PATH
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def set_db_path(path):
+    """Point get_connection() (and every module using it) at another database file."""
+    global DB_PATH
+    DB_PATH = path
+
+
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pool(DB_PATH).connect()
 
 
 def init_db():
@@ -117,4 +230,5 @@ def init_db():
         );
     """)
     conn.commit()
+    migrate(conn)
     conn.close()
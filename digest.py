@@ -0,0 +1,263 @@
+"""
+Weekly digest for parents.
+
+One email per parent address covering all of their children: grades
+recorded during the week, the week's attendance counts, and the class
+schedule changes made during the week, dated as they fall in the coming
+week. The data for every family comes from four
+set-based queries, whatever the number of students. Digests are rendered
+in a pool of worker processes and queued in the outbox, whose workers
+send them over reused SMTP sessions. A dry run writes each digest to an
+.eml file instead.
+
+    python main.py weekly-digest [--week-ending YYYY-MM-DD] [--dry-run DIR]
+
+Run it from cron (or any scheduler) once a week, e.g. Friday evening.
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from html import escape
+
+from database import get_connection
+from outbox import OUTBOX_WORKERS, build_message, deliver, enqueue, smtp_configured
+from schedules import DAYS
+
+try:
+    from config import SENDER_NAME
+except ImportError:
+    SENDER_NAME = ""
+
+try:
+    from config import DIGEST_WORKERS
+except ImportError:
+    DIGEST_WORKERS = 4
+
+# Families handed to a render worker at a time.
+RENDER_CHUNK = 200
+STATUSES = ("Present", "Absent", "Late", "Excused")
+
+
+def week_bounds(week_ending=None):
+    """(first day, last day) of the seven days ending on `week_ending` (default today), as dates."""
+    end = date.fromisoformat(week_ending) if isinstance(week_ending, str) else (week_ending or date.today())
+    return end - timedelta(days=6), end
+
+
+def _utc(day):
+    """Local midnight at the start of `day` as UTC text, comparable with datetime('now') timestamps."""
+    return datetime.combine(day, time()).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _next(day_of_week, after):
+    """The first date after `after` that falls on `day_of_week`."""
+    return after + timedelta(days=(DAYS.index(day_of_week) - after.weekday() - 1) % 7 + 1)
+
+
+# ── Gathering ───────────────────────────────────────────
+
+def gather(conn, week_ending=None):
+    """Every family's digest data for the week, in four queries.
+
+    Returns a list of {"email", "first_day", "last_day", "children": [...]}
+    dicts, one per parent address, where each child has its name, class,
+    grades, attendance counts and schedule changes. Parents sharing an
+    address are merged. The week runs over local days; grade and schedule
+    change timestamps are stored in UTC, so the bounds are converted.
+    """
+    first, last = week_bounds(week_ending)
+    since, until = _utc(first), _utc(last + timedelta(days=1))
+
+    families, children = {}, {}
+    for r in conn.execute("""
+        SELECT DISTINCT lower(p.email) AS email, s.id, s.first_name || ' ' || s.last_name AS name,
+               s.class_id, cl.name AS class_name, s.last_name, s.first_name
+        FROM parents p
+        JOIN student_parents sp ON sp.parent_id = p.id
+        JOIN students s ON sp.student_id = s.id
+        LEFT JOIN classes cl ON s.class_id = cl.id
+        WHERE p.email IS NOT NULL AND p.email != ''
+        ORDER BY 1, s.last_name, s.first_name, s.id
+    """):
+        child = children.setdefault(r["id"], {
+            "name": r["name"], "class_name": r["class_name"], "class_id": r["class_id"],
+            "grades": [], "attendance": dict.fromkeys(STATUSES, 0), "schedule": []})
+        families.setdefault(r["email"], {"email": r["email"], "first_day": str(first), "last_day": str(last),
+                                         "next_first_day": str(last + timedelta(days=1)),
+                                         "next_last_day": str(last + timedelta(days=7)),
+                                         "children": []})["children"].append(child)
+
+    for r in conn.execute("""
+        SELECT e.student_id, c.name AS course_name, c.code AS course_code, g.score, g.letter_grade, g.remarks
+        FROM grades g
+        JOIN enrollments e ON g.enrollment_id = e.id
+        JOIN courses c ON e.course_id = c.id
+        WHERE g.graded_at >= ? AND g.graded_at < ?
+        ORDER BY e.student_id, c.code
+    """, (since, until)):
+        if r["student_id"] in children:
+            children[r["student_id"]]["grades"].append(dict(r))
+
+    for r in conn.execute("""
+        SELECT student_id, status, COUNT(*) AS n FROM attendance
+        WHERE date BETWEEN ? AND ?
+        GROUP BY student_id, status
+    """, (str(first), str(last))):
+        if r["student_id"] in children:
+            children[r["student_id"]]["attendance"][r["status"]] = r["n"]
+
+    changes = {}
+    for r in conn.execute("""
+        SELECT sc.class_id, COALESCE(c.name, 'A removed course') AS course_name, sc.day_of_week,
+               sc.start_time, sc.end_time, sc.room, SUM(sc.delta) AS net
+        FROM schedule_changes sc
+        LEFT JOIN courses c ON sc.course_id = c.id
+        WHERE sc.changed_at >= ? AND sc.changed_at < ?
+        GROUP BY sc.class_id, sc.course_id, sc.day_of_week, sc.start_time, sc.end_time, sc.room
+        HAVING SUM(sc.delta) != 0
+    """, (since, until)):
+        # Slots recur weekly, so a change made this week applies from the coming week on.
+        changes.setdefault(r["class_id"], []).append(dict(r, date=str(_next(r["day_of_week"], last))))
+    for class_changes in changes.values():
+        class_changes.sort(key=lambda c: (c["date"], c["start_time"], c["course_name"]))
+    for child in children.values():
+        child["schedule"] = changes.get(child["class_id"], [])
+    return list(families.values())
+
+
+# ── Rendering ───────────────────────────────────────────
+
+def _child_html(child, family):
+    title = escape(child["name"]) + (f" ({escape(child['class_name'])})" if child["class_name"] else "")
+    if child["grades"]:
+        rows = "".join(
+            f"<tr><td>{escape(g['course_name'])} ({escape(g['course_code'])})</td><td>{g['score']:.1f}</td>"
+            f"<td>{g['letter_grade']}</td><td>{escape(g['remarks'] or '')}</td></tr>" for g in child["grades"])
+        grades = (f'<table border="1" cellpadding="6" cellspacing="0"><tr><th>Course</th><th>Score</th>'
+                  f"<th>Grade</th><th>Remarks</th></tr>{rows}</table>")
+    else:
+        grades = "<p>No new grades this week.</p>"
+    counts = child["attendance"]
+    attendance = ", ".join(f"{status}: {counts[status]}" for status in STATUSES) if any(counts.values()) \
+        else "No attendance recorded this week."
+    if child["schedule"]:
+        items = "".join(
+            f"<li>{'Added' if c['net'] > 0 else 'Cancelled'}: {escape(c['course_name'])}, {c['day_of_week']} "
+            f"{c['date']} {c['start_time']}-{c['end_time']}{' in ' + escape(c['room']) if c['room'] else ''}</li>"
+            for c in child["schedule"])
+        schedule = (f"<p>Schedule changes for the coming week ({family['next_first_day']} to "
+                    f"{family['next_last_day']}):</p><ul>{items}</ul>")
+    else:
+        schedule = ""
+    return f"<h3>{title}</h3>{grades}<p>Attendance: {attendance}</p>{schedule}"
+
+
+def render(family):
+    """(to_email, subject, body_html) for one family. Runs in a worker process."""
+    names = ", ".join(c["name"].split(" ")[0] for c in family["children"])
+    subject = f"Weekly Report {family['first_day']} to {family['last_day']}: {names}"
+    body = f"""
+    <html><body>
+    <h2>Weekly Report</h2>
+    <p>Dear Parent,</p>
+    <p>Here is the week of {family['first_day']} to {family['last_day']} at school:</p>
+    {''.join(_child_html(child, family) for child in family['children'])}
+    <p>Best regards,<br>{SENDER_NAME}</p>
+    </body></html>
+    """
+    return family["email"], subject, body
+
+
+def _render_chunk(families):
+    return [render(f) for f in families]
+
+
+def render_all(families, workers=DIGEST_WORKERS):
+    """Render every digest, in worker processes when there is enough work to share."""
+    chunks = [families[i:i + RENDER_CHUNK] for i in range(0, len(families), RENDER_CHUNK)]
+    workers = min(workers, os.cpu_count() or 1, len(chunks))
+    if workers <= 1:
+        return [render(f) for f in families]
+    try:
+        # Spawned, not forked: /api/digest/weekly runs this inside the threaded API process.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return [m for chunk in pool.map(_render_chunk, chunks) for m in chunk]
+    except (OSError, NotImplementedError, PermissionError):
+        # No process support (e.g. a restricted serverless runtime): render in this process.
+        return [render(f) for f in families]
+
+
+# ── Sending ─────────────────────────────────────────────
+
+def write_eml(messages, directory):
+    """Write each message to `directory` as an .eml file. Returns the paths written."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, (to_email, subject, body) in enumerate(messages, 1):
+        path = os.path.join(directory, f"{i:05d}-{re.sub(r'[^A-Za-z0-9@._-]', '_', to_email)}.eml")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(build_message(to_email, subject, body))
+        paths.append(path)
+    return paths
+
+
+def build_digests(week_ending=None, workers=DIGEST_WORKERS):
+    """Gather and render the week's digests. Returns (messages, summary)."""
+    conn = get_connection()
+    try:
+        families = gather(conn, week_ending)
+    finally:
+        conn.close()
+    messages = render_all(families, workers)
+    first, last = week_bounds(week_ending)
+    summary = {
+        "first_day": str(first),
+        "last_day": str(last),
+        "families": len(families),
+        "children": len({id(c) for f in families for c in f["children"]}),
+        "messages": len(messages),
+    }
+    return messages, summary
+
+
+def queue_digests(messages):
+    """Queue the digests in one transaction. Returns their outbox ids."""
+    conn = get_connection()
+    try:
+        with conn:
+            return enqueue(conn, messages)
+    finally:
+        conn.close()
+
+
+# ── CLI ─────────────────────────────────────────────────
+
+def send_weekly_digest(week_ending=None, dry_run=None, workers=DIGEST_WORKERS, send_workers=OUTBOX_WORKERS):
+    """Build the week's digests; write them to `dry_run` (a directory) or queue and deliver them."""
+    if dry_run is None and not smtp_configured():
+        print("  [Email skipped — SMTP not configured in config.py]")
+        return None
+    try:
+        messages, summary = build_digests(week_ending, workers)
+    except ValueError:
+        print("Invalid date. Use YYYY-MM-DD.")
+        return None
+    print(f"  Week {summary['first_day']} to {summary['last_day']}: {summary['messages']} digest(s) "
+          f"for {summary['children']} student(s).")
+    if dry_run is not None:
+        paths = write_eml(messages, dry_run)
+        print(f"  Dry run: {len(paths)} .eml file(s) written to {dry_run}")
+        return summary
+    if not messages:
+        return summary
+    ids = queue_digests(messages)
+
+    def progress(sent, failed):
+        print(f"\r  Delivering: {sent} sent, {failed} failed", end="", flush=True)
+
+    sent, failed = deliver(send_workers, progress, ids)
+    print(f"\r  Delivered: {sent} sent, {failed} failed (failures are retried by the outbox worker).")
+    summary.update(sent=sent, failed=failed)
+    return summary
@@ -1,5 +1,16 @@
+import json
+
 from database import get_connection
-from notifications import notify_parents_of_grade
+from notifications import notify_parents_of_grade_async, notify_parents_of_grades_async
+from transcripts import get_transcript
+
+
+UPSERT_GRADE_SQL = """
+    INSERT INTO grades (enrollment_id, score, letter_grade, remarks, graded_at) VALUES (?, ?, ?, ?, datetime('now'))
+    ON CONFLICT(enrollment_id) DO UPDATE SET score=excluded.score, letter_grade=excluded.letter_grade, remarks=excluded.remarks,
+        graded_at=excluded.graded_at
+    WHERE score IS NOT excluded.score OR remarks IS NOT excluded.remarks
+"""
 
 
 def _letter_grade(score):
@@ -14,30 +25,114 @@ def _letter_grade(score):
     return "F"
 
 
+def enroll(conn, student_id, course_id):
+    """Enroll a student if the course has a free seat. Raises ValueError if not.
+
+    Call it inside BEGIN IMMEDIATE so no other writer can take the seat
+    between the check and the insert; the enrollments_seats_bi trigger
+    refuses an overbooking insert from any other path.
+    """
+    course = conn.execute("SELECT name, max_capacity, enrolled_count FROM courses WHERE id=?", (course_id,)).fetchone()
+    if not course:
+        raise ValueError("Course not found.")
+    if course["max_capacity"] is not None and course["enrolled_count"] >= course["max_capacity"]:
+        raise ValueError(f"Course '{course['name']}' is full ({course['max_capacity']} students).")
+    conn.execute("INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)", (student_id, course_id))
+
+
 def enroll_student(student_id, course_id):
     conn = get_connection()
     try:
-        # Check capacity
-        course = conn.execute("SELECT * FROM courses WHERE id=?", (course_id,)).fetchone()
-        if not course:
-            print("Course not found.")
-            return
-        count = conn.execute(
-            "SELECT COUNT(*) as cnt FROM enrollments WHERE course_id=?", (course_id,)
-        ).fetchone()["cnt"]
-        if count >= course["max_capacity"]:
-            print(f"Course '{course['name']}' is full ({course['max_capacity']} students).")
-            return
-        conn.execute(
-            "INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)",
-            (student_id, course_id),
-        )
+        conn.execute("BEGIN IMMEDIATE")
+        enroll(conn, student_id, course_id)
         conn.commit()
         print("Student enrolled successfully.")
+    except ValueError as e:
+        conn.rollback()
+        print(e)
+    except Exception as e:
+        conn.rollback()
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+def bulk_enroll(conn, course_ids, student_ids=None, class_id=None):
+    """Enroll a class, or a list of students, into one or more courses.
+
+    Seats are read once per course. Pairs already enrolled are skipped, and
+    once a course is full the remaining students (highest ids) are left
+    out. Call it inside BEGIN IMMEDIATE. Raises ValueError for an unknown
+    class, student or course. Returns a summary with totals and, per
+    course, who was enrolled, already enrolled or left without a seat.
+    """
+    if class_id is not None:
+        if not conn.execute("SELECT 1 FROM classes WHERE id=?", (class_id,)).fetchone():
+            raise ValueError("Class not found.")
+        students = [r[0] for r in conn.execute("SELECT id FROM students WHERE class_id=? ORDER BY id", (class_id,))]
+    elif student_ids:
+        students = sorted({int(s) for s in student_ids})
+        found = {r[0] for r in conn.execute("SELECT id FROM students WHERE id IN (SELECT value FROM json_each(?))",
+                                            (json.dumps(students),))}
+        missing = [str(s) for s in students if s not in found]
+        if missing:
+            raise ValueError(f"Student(s) not found: {', '.join(missing)}")
+    else:
+        raise ValueError("Give a class or a list of students.")
+    course_ids = list(dict.fromkeys(int(c) for c in course_ids or ()))
+    if not course_ids:
+        raise ValueError("Give at least one course.")
+    courses = {r["id"]: r for r in conn.execute("""
+        SELECT id, code, max_capacity, enrolled_count FROM courses WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(course_ids),))}
+    missing = [str(c) for c in course_ids if c not in courses]
+    if missing:
+        raise ValueError(f"Course(s) not found: {', '.join(missing)}")
+
+    summary = {"students": len(students), "enrolled": 0, "already_enrolled": 0, "no_seat": 0, "courses": []}
+    batch = json.dumps(students)
+    for course_id in course_ids:
+        course = courses[course_id]
+        taken = {r[0] for r in conn.execute("""
+            SELECT student_id FROM enrollments WHERE course_id = ? AND student_id IN (SELECT value FROM json_each(?))
+        """, (course_id, batch))}
+        new = [s for s in students if s not in taken]
+        left_out = []
+        if course["max_capacity"] is not None:
+            free = max(course["max_capacity"] - course["enrolled_count"], 0)
+            new, left_out = new[:free], new[free:]
+        conn.executemany("INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)",
+                         [(s, course_id) for s in new])
+        summary["enrolled"] += len(new)
+        summary["already_enrolled"] += len(taken)
+        summary["no_seat"] += len(left_out)
+        summary["courses"].append({"course_id": course_id, "code": course["code"], "enrolled": new,
+                                   "already_enrolled": sorted(taken), "no_seat": left_out})
+    return summary
+
+
+def bulk_enroll_students(course_ids, student_ids=None, class_id=None):
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        summary = bulk_enroll(conn, course_ids, student_ids, class_id)
+        conn.commit()
+    except ValueError as e:
+        conn.rollback()
+        print(e)
+        return
     except Exception as e:
+        conn.rollback()
         print(f"Error: {e}")
+        return
     finally:
         conn.close()
+    print(f"\n{'Course':<12} {'Enrolled':>9} {'Already':>9} {'No seat':>9}")
+    print("-" * 42)
+    for c in summary["courses"]:
+        print(f"{c['code']:<12} {len(c['enrolled']):>9} {len(c['already_enrolled']):>9} {len(c['no_seat']):>9}")
+    print(f"\n{summary['enrolled']} enrollment(s) added for {summary['students']} student(s); "
+          f"{summary['already_enrolled']} already enrolled, {summary['no_seat']} left without a seat.")
 
 
 def unenroll_student(student_id, course_id):
@@ -77,24 +172,17 @@ def list_enrollments_by_course(course_id):
 
 def list_enrollments_by_student(student_id):
     conn = get_connection()
-    rows = conn.execute("""
-        SELECT c.code, c.name AS course_name, g.score, g.letter_grade
-        FROM enrollments e
-        JOIN courses c ON e.course_id = c.id
-        LEFT JOIN grades g ON g.enrollment_id = e.id
-        WHERE e.student_id = ?
-        ORDER BY c.code
-    """, (student_id,)).fetchall()
+    transcript = get_transcript(conn, student_id)
     conn.close()
-    if not rows:
+    if not transcript or not transcript["courses"]:
         print("Student is not enrolled in any courses.")
         return
     print(f"\n{'Code':<10} {'Course':<25} {'Score':<8} {'Grade'}")
     print("-" * 55)
-    for r in rows:
+    for r in transcript["courses"]:
         score = f"{r['score']:.1f}" if r['score'] is not None else "N/A"
         grade = r['letter_grade'] or "N/A"
-        print(f"{r['code']:<10} {r['course_name']:<25} {score:<8} {grade}")
+        print(f"{r['code']:<10} {r['name']:<25} {score:<8} {grade}")
 
 
 def assign_grade(enrollment_id, score, remarks=""):
@@ -106,19 +194,139 @@ def assign_grade(enrollment_id, score, remarks=""):
         ).fetchone()
         if existing:
             conn.execute(
-                "UPDATE grades SET score=?, letter_grade=?, remarks=? WHERE enrollment_id=?",
+                "UPDATE grades SET score=?, letter_grade=?, remarks=?, graded_at=datetime('now') WHERE enrollment_id=?",
                 (score, letter, remarks, enrollment_id),
             )
         else:
             conn.execute(
-                "INSERT INTO grades (enrollment_id, score, letter_grade, remarks) VALUES (?, ?, ?, ?)",
+                "INSERT INTO grades (enrollment_id, score, letter_grade, remarks, graded_at) VALUES (?, ?, ?, ?, datetime('now'))",
                 (enrollment_id, score, letter, remarks),
             )
         conn.commit()
         print(f"Grade assigned: {score:.1f} ({letter})")
-        # Auto-notify parents
-        notify_parents_of_grade(enrollment_id, score, letter, remarks)
+        # Auto-notify parents in the background
+        notify_parents_of_grade_async(enrollment_id, score, letter, remarks)
     except Exception as e:
         print(f"Error: {e}")
     finally:
         conn.close()
+
+
+def upsert_grades(conn, records, course_id=None):
+    """Save a score sheet in one transaction.
+
+    `records` is a list of {"enrollment_id", "score", "remarks"?} dicts; with
+    a course_id, a record may name its "student_id" instead. Bad records
+    (unknown enrollment, score outside 0-100, duplicates) are rejected
+    before anything is written; the rest go through one executemany
+    upsert, which leaves unchanged grades alone. Returns one
+    {"enrollment_id", "result", "letter_grade"?, "error"?} outcome per
+    record, where result is "created", "updated", "unchanged" or "rejected".
+    """
+    def ints(key):
+        return json.dumps([r.get(key) for r in records if isinstance(r.get(key), int)])
+
+    current = {}
+    for row in conn.execute("""
+        SELECT e.id, e.student_id, e.course_id, g.id AS grade_id, g.score, g.remarks
+        FROM enrollments e LEFT JOIN grades g ON g.enrollment_id = e.id
+        WHERE e.id IN (SELECT value FROM json_each(?))
+    """, (ints("enrollment_id"),)):
+        current[row["id"]] = row
+    by_student = {}
+    if course_id is not None:
+        for row in conn.execute("""
+            SELECT e.id, e.student_id, e.course_id, g.id AS grade_id, g.score, g.remarks
+            FROM enrollments e LEFT JOIN grades g ON g.enrollment_id = e.id
+            WHERE e.course_id = ? AND e.student_id IN (SELECT value FROM json_each(?))
+        """, (course_id, ints("student_id"))):
+            current[row["id"]] = row
+            by_student[row["student_id"]] = row["id"]
+
+    outcomes, batch, seen = [], [], set()
+    for rec in records:
+        eid = rec.get("enrollment_id")
+        if eid is None and course_id is not None:
+            eid = by_student.get(rec.get("student_id"))
+        error, score = None, rec.get("score")
+        if eid not in current:
+            error = "Enrollment not found"
+        elif course_id is not None and current[eid]["course_id"] != course_id:
+            error = "Enrollment is not in this course"
+        elif isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 100:
+            error = "Score must be a number from 0 to 100"
+        elif eid in seen:
+            error = "Duplicate record for enrollment"
+        if error:
+            outcome = {"enrollment_id": eid, "result": "rejected", "error": error}
+            if eid is None and "student_id" in rec:
+                outcome["student_id"] = rec["student_id"]
+            outcomes.append(outcome)
+            continue
+        seen.add(eid)
+        score, remarks = float(score), rec.get("remarks", "")
+        letter = _letter_grade(score)
+        old = current[eid]
+        if old["grade_id"] is None:
+            result = "created"
+        elif (old["score"], old["remarks"]) == (score, remarks):
+            result = "unchanged"
+        else:
+            result = "updated"
+        batch.append((eid, score, letter, remarks))
+        outcomes.append({"enrollment_id": eid, "result": result, "letter_grade": letter})
+
+    with conn:
+        conn.executemany(UPSERT_GRADE_SQL, batch)
+    return outcomes
+
+
+def enter_course_grades(course_id):
+    """CLI: prompt for every enrolled student's score in a course, then save them together."""
+    conn = get_connection()
+    try:
+        course = conn.execute("SELECT name, code FROM courses WHERE id=?", (course_id,)).fetchone()
+        if not course:
+            print("Course not found.")
+            return
+        rows = conn.execute("""
+            SELECT e.id, s.first_name || ' ' || s.last_name AS student_name, g.score
+            FROM enrollments e
+            JOIN students s ON e.student_id = s.id
+            LEFT JOIN grades g ON g.enrollment_id = e.id
+            WHERE e.course_id = ?
+            ORDER BY s.last_name, s.first_name
+        """, (course_id,)).fetchall()
+        if not rows:
+            print("No students enrolled in this course.")
+            return
+        print(f"\nScores for {course['name']} ({course['code']}); leave blank to skip a student.")
+        records = []
+        for r in rows:
+            current = f" [{r['score']:.1f}]" if r["score"] is not None else ""
+            while True:
+                val = input(f"  {r['student_name']}{current}: ").strip()
+                if not val:
+                    break
+                try:
+                    records.append({"enrollment_id": r["id"], "score": float(val)})
+                    break
+                except ValueError:
+                    print("  Please enter a valid number.")
+        if not records:
+            print("No scores entered.")
+            return
+        outcomes = upsert_grades(conn, records, course_id)
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        conn.close()
+    counts = {k: sum(1 for o in outcomes if o["result"] == k) for k in ("created", "updated", "unchanged", "rejected")}
+    print(f"Grades saved: {counts['created']} new, {counts['updated']} updated, {counts['unchanged']} unchanged.")
+    for o in outcomes:
+        if o["result"] == "rejected":
+            print(f"  Enrollment {o['enrollment_id']}: {o['error']}")
+    changed = [o["enrollment_id"] for o in outcomes if o["result"] in ("created", "updated")]
+    if changed:
+        notify_parents_of_grades_async(changed)
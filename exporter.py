@@ -0,0 +1,195 @@
+"""
+Streaming export of tables and reports to CSV or NDJSON.
+
+Rows are read from the cursor EXPORT_BATCH_ROWS at a time and encoded as
+they arrive, optionally through a gzip stream, so memory use does not
+grow with the table. Whole-table and date-range exports are read in index
+order with no sort step; a class filter sorts only that class's rows.
+
+    python main.py export attendance --since 2025-01-01 --gzip -o attendance.csv.gz
+"""
+import csv
+import io
+import json
+import re
+import sys
+import zlib
+from datetime import date
+
+from database import get_connection
+
+try:
+    from config import EXPORT_BATCH_ROWS
+except ImportError:
+    EXPORT_BATCH_ROWS = 1000
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# name: (query, date column, class column, order). A column of None means
+# the export cannot be filtered that way.
+EXPORTS = {
+    "students": ("""
+        SELECT s.id, s.first_name, s.last_name, s.date_of_birth, s.email, s.phone,
+               s.class_id, cl.name AS class_name, s.enrolled_date
+        FROM students s LEFT JOIN classes cl ON s.class_id = cl.id
+    """, "s.enrolled_date", "s.class_id", "s.id"),
+    "teachers": ("SELECT id, first_name, last_name, email, phone, subject_specialty FROM teachers t",
+                 None, None, "t.id"),
+    "parents": ("SELECT id, first_name, last_name, email, phone, address FROM parents p", None, None, "p.id"),
+    "classes": ("""
+        SELECT cl.id, cl.name, cl.grade_level, cl.section, cl.academic_year, cl.homeroom_teacher_id
+        FROM classes cl
+    """, None, "cl.id", "cl.id"),
+    "courses": ("""
+        SELECT c.id, c.code, c.name, c.description, c.teacher_id, c.max_capacity, c.weekly_hours, c.credits
+        FROM courses c
+    """, None, None, "c.id"),
+    "enrollments": ("""
+        SELECT e.id, e.student_id, s.first_name || ' ' || s.last_name AS student_name, s.class_id,
+               e.course_id, c.code AS course_code, e.enrolled_date
+        FROM enrollments e JOIN students s ON e.student_id = s.id JOIN courses c ON e.course_id = c.id
+    """, "e.enrolled_date", "s.class_id", "e.id"),
+    "grades": ("""
+        SELECT g.id, e.student_id, s.first_name || ' ' || s.last_name AS student_name, s.class_id,
+               e.course_id, c.code AS course_code, g.score, g.letter_grade, g.remarks
+        FROM grades g JOIN enrollments e ON g.enrollment_id = e.id
+        JOIN students s ON e.student_id = s.id JOIN courses c ON e.course_id = c.id
+    """, None, "s.class_id", "g.id"),
+    "attendance": ("""
+        SELECT a.id, a.date, a.student_id, s.first_name || ' ' || s.last_name AS student_name,
+               s.class_id, a.status, a.remarks
+        FROM attendance a JOIN students s ON a.student_id = s.id
+    """, "a.date", "s.class_id", "a.date, a.id"),
+    "schedules": ("""
+        SELECT sc.id, sc.class_id, sc.course_id, c.code AS course_code, sc.day_of_week,
+               sc.start_time, sc.end_time, sc.room
+        FROM schedules sc JOIN courses c ON sc.course_id = c.id
+    """, None, "sc.class_id", "sc.id"),
+    "transcripts": ("""
+        SELECT t.student_id, s.first_name || ' ' || s.last_name AS student_name, s.class_id,
+               t.gpa, t.credits_attempted, t.credits_earned
+        FROM transcripts t JOIN students s ON t.student_id = s.id
+    """, None, "s.class_id", "t.student_id"),
+}
+
+
+def _check_date(name, value):
+    try:
+        if not _DATE.fullmatch(value):
+            raise ValueError
+        date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}', expected YYYY-MM-DD") from None
+
+
+def export_rows(conn, name, since=None, until=None, class_id=None):
+    """Run an export query. Returns (column names, row generator).
+
+    `since` and `until` are inclusive YYYY-MM-DD bounds. Raises ValueError
+    for an unknown export or a filter it does not support, before any row
+    is read.
+    """
+    if name not in EXPORTS:
+        raise ValueError(f"Unknown export '{name}'. Choose from: {', '.join(EXPORTS)}")
+    sql, date_column, class_column, order = EXPORTS[name]
+    where, params = [], []
+    for label, value, op in (("since", since, ">="), ("until", until, "<=")):
+        if value:
+            if date_column is None:
+                raise ValueError(f"The {name} export has no date to filter on")
+            _check_date(label, value)
+            where.append(f"{date_column} {op} ?")
+            params.append(value)
+    if class_id is not None:
+        if class_column is None:
+            raise ValueError(f"The {name} export has no class to filter on")
+        where.append(f"{class_column} = ?")
+        params.append(int(class_id))
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    cur = conn.execute(f"{sql} ORDER BY {order}", params)
+    columns = [d[0] for d in cur.description]
+
+    def rows():
+        while True:
+            batch = cur.fetchmany(EXPORT_BATCH_ROWS)
+            if not batch:
+                return
+            yield from batch
+
+    return columns, rows()
+
+
+def encode(columns, rows, fmt="csv"):
+    """Yield the rows as CSV (with a header line) or NDJSON text, one chunk per EXPORT_BATCH_ROWS rows."""
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        def write(row):
+            buf.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+            buf.write("\n")
+    pending = 0
+    for row in rows:
+        write(row)
+        pending += 1
+        if pending == EXPORT_BATCH_ROWS:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def to_bytes(chunks, compress=False):
+    """UTF-8 encode text chunks, gzip-compressing them on the fly if asked."""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        data = gz.compress(chunk.encode())
+        if data:
+            yield data
+    yield gz.flush()
+
+
+def export(conn, name, fmt="csv", compress=False, since=None, until=None, class_id=None):
+    """Byte stream of an export. Validation errors are raised here, before the first chunk."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+    columns, rows = export_rows(conn, name, since, until, class_id)
+    return to_bytes(encode(columns, rows, fmt), compress)
+
+
+def filename(name, fmt="csv", compress=False):
+    return f"{name}.{fmt}" + (".gz" if compress else "")
+
+
+# ── CLI ─────────────────────────────────────────────────
+
+def export_table(name, fmt="csv", compress=False, output=None, since=None, until=None, class_id=None):
+    """Write an export to `output`, or to stdout when no path is given."""
+    conn = get_connection()
+    try:
+        chunks = export(conn, name, fmt, compress, since, until, class_id)
+        if output is None:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        size = 0
+        with open(output, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        print(f"Exported {name} to {output} ({size:,} bytes).")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+    finally:
+        conn.close()
@@ -0,0 +1,340 @@
+"""
+Bulk CSV import of students, teachers, parents and enrollments.
+
+The file is streamed row by row through a generator, so its size does not
+matter. Each row is validated, de-duplicated on email (on student and
+course for enrollments) against the database and the rows before it, and
+written with executemany in transactions of IMPORT_CHUNK_SIZE rows. A bad
+row is reported with its line number and skipped; it never aborts the
+rest of the import. New people are added to the search index once per
+chunk rather than once per row.
+
+Columns (header names, any order; extra columns are ignored):
+
+    students     first_name*, last_name*, date_of_birth, email, phone, class_id, enrolled_date
+    teachers     first_name*, last_name*, email, phone, subject_specialty
+    parents      first_name*, last_name*, email, phone, address,
+                 student_id or student_email, relationship   (links the parent to a child)
+    enrollments  student_id or student_email*, course_id or course_code*, enrolled_date
+"""
+import csv
+import io
+import re
+import sqlite3
+import time
+from datetime import date
+
+from database import get_connection
+from search import defer_indexing, resume_indexing
+
+try:
+    from config import IMPORT_CHUNK_SIZE, IMPORT_MAX_ERRORS
+except ImportError:
+    IMPORT_CHUNK_SIZE = 5000
+    IMPORT_MAX_ERRORS = 1000
+
+_EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+# ── Field parsing ───────────────────────────────────────
+
+def _text(row, column, required=False):
+    value = (row.get(column) or "").strip()
+    if required and not value:
+        raise ValueError(f"{column} is required")
+    return value or None
+
+
+def _email(row, column="email"):
+    value = _text(row, column)
+    if value and not _EMAIL.fullmatch(value):
+        raise ValueError(f"Invalid {column} '{value}'")
+    return value
+
+
+def _date(row, column):
+    value = _text(row, column)
+    if value:
+        try:
+            # fromisoformat() alone would also take forms like 20100203.
+            if not _DATE.fullmatch(value):
+                raise ValueError
+            date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Invalid {column} '{value}', expected YYYY-MM-DD") from None
+    return value
+
+
+def _id(row, column):
+    value = _text(row, column)
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"Invalid {column} '{value}'")
+    return int(value)
+
+
+class _Lookups:
+    """Reference data loaded once per import, on first use."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._cache = {}
+
+    def _load(self, name, sql, build):
+        if name not in self._cache:
+            self._cache[name] = build(self.conn.execute(sql).fetchall())
+        return self._cache[name]
+
+    def emails(self, table):
+        return self._load(f"{table} emails", f"SELECT lower(email) FROM {table} WHERE email IS NOT NULL",
+                          lambda rows: {r[0] for r in rows})
+
+    def class_ids(self):
+        return self._load("classes", "SELECT id FROM classes", lambda rows: {r[0] for r in rows})
+
+    def student_ids(self):
+        return self._load("students", "SELECT id FROM students", lambda rows: {r[0] for r in rows})
+
+    def students_by_email(self):
+        return self._load("students by email", "SELECT lower(email), id FROM students WHERE email IS NOT NULL",
+                          lambda rows: {r[0]: r[1] for r in rows})
+
+    def courses(self):
+        """{course id: [code, max capacity, enrolled]} and {lower(code): id}."""
+        def build(rows):
+            by_id = {r["id"]: [r["code"], r["max_capacity"], r["enrolled"]] for r in rows}
+            return by_id, {r["code"].lower(): r["id"] for r in rows}
+        return self._load("courses", "SELECT id, code, max_capacity, enrolled_count AS enrolled FROM courses", build)
+
+    def enrolled(self, student_id, course_id):
+        return self.conn.execute("SELECT 1 FROM enrollments WHERE student_id = ? AND course_id = ?",
+                                 (student_id, course_id)).fetchone() is not None
+
+    def student(self, row, required):
+        if _text(row, "student_id"):
+            student_id = _id(row, "student_id")
+            if student_id not in self.student_ids():
+                raise ValueError(f"Student {student_id} not found")
+            return student_id
+        email = _email(row, "student_email")
+        if email:
+            student_id = self.students_by_email().get(email.lower())
+            if student_id is None:
+                raise ValueError(f"No student with email '{email}'")
+            return student_id
+        if required:
+            raise ValueError("student_id or student_email is required")
+        return None
+
+
+# ── Entities ────────────────────────────────────────────
+# Each parser turns a CSV row into (dedupe key, insert parameters, extra)
+# or raises ValueError. A key of None is never a duplicate.
+
+def _person_key(table, email, lookups, seen):
+    if email is None:
+        return None
+    key = email.lower()
+    if key in seen or key in lookups.emails(table):
+        raise ValueError(f"Duplicate email '{email}'")
+    return key
+
+
+def _parse_student(row, lookups, seen):
+    class_id = _id(row, "class_id")
+    if class_id is not None and class_id not in lookups.class_ids():
+        raise ValueError(f"Class {class_id} not found")
+    params = (_text(row, "first_name", True), _text(row, "last_name", True), _date(row, "date_of_birth"),
+              _email(row), _text(row, "phone"), class_id, _date(row, "enrolled_date"))
+    return _person_key("students", params[3], lookups, seen), params, None
+
+
+def _parse_teacher(row, lookups, seen):
+    params = (_text(row, "first_name", True), _text(row, "last_name", True), _email(row),
+              _text(row, "phone"), _text(row, "subject_specialty"))
+    return _person_key("teachers", params[2], lookups, seen), params, None
+
+
+def _parse_parent(row, lookups, seen):
+    params = (_text(row, "first_name", True), _text(row, "last_name", True), _email(row),
+              _text(row, "phone"), _text(row, "address"))
+    student_id = lookups.student(row, required=False)
+    link = (student_id, _text(row, "relationship") or "Parent") if student_id else None
+    return _person_key("parents", params[2], lookups, seen), params, link
+
+
+def _parse_enrollment(row, lookups, seen):
+    student_id = lookups.student(row, required=True)
+    courses, by_code = lookups.courses()
+    if _text(row, "course_id"):
+        course_id = _id(row, "course_id")
+    else:
+        code = _text(row, "course_code")
+        if code is None:
+            raise ValueError("course_id or course_code is required")
+        course_id = by_code.get(code.lower())
+        if course_id is None:
+            raise ValueError(f"Course '{code}' not found")
+    course = courses.get(course_id)
+    if course is None:
+        raise ValueError(f"Course {course_id} not found")
+    key = (student_id, course_id)
+    if key in seen or lookups.enrolled(student_id, course_id):
+        raise ValueError(f"Student {student_id} is already enrolled in {course[0]}")
+    if course[1] is not None and course[2] >= course[1]:
+        raise ValueError(f"Course {course[0]} is full ({course[1]} students)")
+    course[2] += 1
+    return key, (student_id, course_id, _date(row, "enrolled_date")), None
+
+
+# table, parser, insert statement, header columns that must be present
+ENTITIES = {
+    "students": ("students", _parse_student, """
+        INSERT INTO students (first_name, last_name, date_of_birth, email, phone, class_id, enrolled_date)
+        VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, date('now')))
+    """, (("first_name",), ("last_name",))),
+    "teachers": ("teachers", _parse_teacher, """
+        INSERT INTO teachers (first_name, last_name, email, phone, subject_specialty) VALUES (?, ?, ?, ?, ?)
+    """, (("first_name",), ("last_name",))),
+    "parents": ("parents", _parse_parent, """
+        INSERT INTO parents (first_name, last_name, email, phone, address) VALUES (?, ?, ?, ?, ?)
+    """, (("first_name",), ("last_name",))),
+    "enrollments": ("enrollments", _parse_enrollment, """
+        INSERT INTO enrollments (student_id, course_id, enrolled_date) VALUES (?, ?, COALESCE(?, date('now')))
+    """, (("student_id", "student_email"), ("course_id", "course_code"))),
+}
+
+_INDEXED = ("students", "teachers", "parents")
+
+
+# ── Import ──────────────────────────────────────────────
+
+def read_csv(stream):
+    """Yield (1, header columns), then (line number, row dict) for each row of a text stream."""
+    reader = csv.DictReader(stream)
+    header = [h.strip() for h in reader.fieldnames or ()]
+    reader.fieldnames = header
+    yield 1, header
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as e:
+        raise ValueError(f"Line {reader.line_num}: {e}") from None
+
+
+def _write_chunk(conn, table, insert, chunk, result):
+    """Insert one chunk of (line, params, extra) in its own transaction.
+
+    The chunk goes in with one executemany; if a row still violates a
+    constraint (say, an email added by another user since the import
+    started), the chunk is retried row by row and only that row fails.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        after_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        if table in _INDEXED:
+            defer_indexing(conn, table)
+        conn.execute("SAVEPOINT chunk")
+        try:
+            conn.executemany(insert, [params for _line, params, _extra in chunk])
+            written = chunk
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK TO chunk")
+            written = []
+            for item in chunk:
+                try:
+                    conn.execute(insert, item[1])
+                    written.append(item)
+                except sqlite3.IntegrityError as e:
+                    _error(result, item[0], str(e))
+        conn.execute("RELEASE chunk")
+        if table in _INDEXED:
+            resume_indexing(conn, table, after_id)
+        links = [item[2] for item in written if item[2]]
+        if links:
+            # AUTOINCREMENT ids grow in insertion order, so new ids line up with `written`.
+            ids = [r[0] for r in conn.execute(f"SELECT id FROM {table} WHERE id > ? ORDER BY id", (after_id,))]
+            cur = conn.executemany(
+                "INSERT OR IGNORE INTO student_parents (student_id, parent_id, relationship) VALUES (?, ?, ?)",
+                [(item[2][0], new_id, item[2][1]) for item, new_id in zip(written, ids) if item[2]])
+            result["linked"] += cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    result["inserted"] += len(written)
+
+
+def _error(result, line, message):
+    result["failed"] += 1
+    if len(result["errors"]) < IMPORT_MAX_ERRORS:
+        result["errors"].append({"line": line, "error": message})
+
+
+def import_csv(conn, entity, stream, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import CSV rows of `entity` from a text stream.
+
+    Returns a summary dict: rows read, inserted, failed, linked (parents
+    tied to a student), seconds, and the first IMPORT_MAX_ERRORS errors as
+    {line, error}. Raises ValueError for an unknown entity or a header
+    that lacks a required column; nothing is written in that case.
+    """
+    if entity not in ENTITIES:
+        raise ValueError(f"Unknown entity '{entity}'. Choose from: {', '.join(ENTITIES)}")
+    table, parse, insert, required = ENTITIES[entity]
+    started = time.perf_counter()
+    rows = read_csv(stream)
+    _line, header = next(rows)
+    missing = [" or ".join(names) for names in required if not any(n in header for n in names)]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+    result = {"entity": entity, "rows": 0, "inserted": 0, "failed": 0, "linked": 0, "errors": []}
+    lookups, seen, chunk = _Lookups(conn), set(), []
+    for line, row in rows:
+        result["rows"] += 1
+        try:
+            key, params, extra = parse(row, lookups, seen)
+        except ValueError as e:
+            _error(result, line, str(e))
+            continue
+        if key is not None:
+            seen.add(key)
+        chunk.append((line, params, extra))
+        if len(chunk) >= chunk_size:
+            _write_chunk(conn, table, insert, chunk, result)
+            chunk = []
+    if chunk:
+        _write_chunk(conn, table, insert, chunk, result)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def text_stream(binary):
+    """Wrap a binary file object for import_csv(), dropping any UTF-8 BOM."""
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+# ── CLI ─────────────────────────────────────────────────
+
+def import_file(entity, path):
+    conn = get_connection()
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            result = import_csv(conn, entity, f)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        conn.close()
+    print(f"Imported {result['inserted']} of {result['rows']} {entity} rows in {result['seconds']:.2f}s.")
+    if result["linked"]:
+        print(f"Linked {result['linked']} parent(s) to students.")
+    if result["failed"]:
+        print(f"{result['failed']} row(s) skipped:")
+        for e in result["errors"]:
+            print(f"  line {e['line']}: {e['error']}")
+        if result["failed"] > len(result["errors"]):
+            print(f"  ... and {result['failed'] - len(result['errors'])} more")
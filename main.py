@@ -5,8 +5,12 @@ A CLI application to manage students, teachers, courses,
 enrollments, and grades using SQLite.
 """
 
+import argparse
 import sys
-from database import init_db
+import outbox
+from analytics import course_report, school_report
+from transcripts import view_transcript, view_honor_roll
+from database import init_db, get_connection
 from students import add_student, list_students, search_students, update_student, delete_student
 from teachers import add_teacher, list_teachers, update_teacher, delete_teacher
 from courses import add_course, list_courses, update_course, delete_course
@@ -15,9 +19,9 @@ from classes import (
     assign_student_to_class, remove_student_from_class, list_students_in_class,
 )
 from enrollments import (
-    enroll_student, unenroll_student,
+    enroll_student, bulk_enroll_students, unenroll_student,
     list_enrollments_by_course, list_enrollments_by_student,
-    assign_grade,
+    assign_grade, enter_course_grades,
 )
 from parents import (
     add_parent, list_parents, update_parent, delete_parent,
@@ -27,12 +31,17 @@ from parents import (
 from attendance import (
     mark_attendance, mark_class_attendance,
     view_attendance_by_student, view_attendance_by_class_date,
+    view_class_attendance_rates, rebuild_attendance_summary,
 )
 from schedules import (
     add_schedule_slot, list_schedule_by_class, delete_schedule_slot,
-    view_student_schedule,
+    view_student_schedule, check_schedule_conflicts,
 )
-from notifications import send_schedule_to_parents
+from notifications import send_schedule_to_parents, send_schedules
+from importer import ENTITIES as IMPORT_ENTITIES, import_file
+from exporter import EXPORTS, FORMATS as EXPORT_FORMATS, export_table
+from timetable import generate_timetable, TIMETABLE_TIME_BUDGET_SECONDS, TIMETABLE_WORKERS
+from digest import send_weekly_digest, DIGEST_WORKERS
 
 
 def input_int(prompt, allow_empty=False):
@@ -46,6 +55,16 @@ def input_int(prompt, allow_empty=False):
             print("Please enter a valid number.")
 
 
+def input_ids(prompt):
+    """Comma-separated whole numbers; blank gives an empty list."""
+    while True:
+        val = input(prompt).strip()
+        try:
+            return [int(v) for v in val.split(",") if v.strip()]
+        except ValueError:
+            print("Please enter numbers separated by commas.")
+
+
 def input_float(prompt):
     while True:
         val = input(prompt).strip()
@@ -163,7 +182,9 @@ def course_menu():
             desc = input("Description: ").strip()
             tid = input_int("Teacher ID (or empty for none): ", allow_empty=True)
             cap = input_int("Max capacity (default 30): ", allow_empty=True) or 30
-            add_course(name, code, desc, tid, cap)
+            credits = input_int("Credits (default 1): ", allow_empty=True) or 1
+            hours = input_int("Weekly hours (default 3): ", allow_empty=True) or 3
+            add_course(name, code, desc, tid, cap, credits, hours)
 
         elif choice == "2":
             list_courses()
@@ -175,7 +196,9 @@ def course_menu():
             desc = input("New description: ").strip()
             tid = input_int("New teacher ID (or empty): ", allow_empty=True)
             cap = input_int("New max capacity: ", allow_empty=True) or 30
-            update_course(cid, name, code, desc, tid, cap)
+            credits = input_int("New credits (default 1): ", allow_empty=True) or 1
+            hours = input_int("New weekly hours (default 3): ", allow_empty=True) or 3
+            update_course(cid, name, code, desc, tid, cap, credits, hours)
 
         elif choice == "4":
             cid = input_int("Course ID to delete: ")
@@ -250,6 +273,11 @@ def enrollment_menu():
         print("2. Unenroll Student from Course")
         print("3. View Students in a Course")
         print("4. Assign / Update Grade")
+        print("5. Grade Analytics (Course / Whole School)")
+        print("6. View Student Transcript")
+        print("7. Honor Roll")
+        print("8. Bulk Enroll a Class or Student List")
+        print("9. Enter Grades for a Whole Course")
         print("0. Back")
         choice = input("Choose: ").strip()
 
@@ -273,6 +301,30 @@ def enrollment_menu():
             remarks = input("Remarks (optional): ").strip()
             assign_grade(eid, score, remarks)
 
+        elif choice == "5":
+            cid = input_int("Course ID (blank for whole school): ", allow_empty=True)
+            if cid is None:
+                school_report()
+            else:
+                course_report(cid)
+
+        elif choice == "6":
+            sid = input_int("Student ID: ")
+            view_transcript(sid)
+
+        elif choice == "7":
+            view_honor_roll()
+
+        elif choice == "8":
+            course_ids = input_ids("Course IDs (comma-separated): ")
+            class_id = input_int("Class ID (blank to list students): ", allow_empty=True)
+            student_ids = None if class_id is not None else input_ids("Student IDs (comma-separated): ")
+            bulk_enroll_students(course_ids, student_ids, class_id)
+
+        elif choice == "9":
+            cid = input_int("Course ID: ")
+            enter_course_grades(cid)
+
         elif choice == "0":
             break
 
@@ -347,6 +399,8 @@ def attendance_menu():
         print("2. Mark Attendance for Entire Class")
         print("3. View Attendance by Student")
         print("4. View Attendance by Class & Date")
+        print("5. View Class Attendance Rates")
+        print("6. Rebuild Attendance Summary")
         print("0. Back")
         choice = input("Choose: ").strip()
 
@@ -370,13 +424,24 @@ def attendance_menu():
 
         elif choice == "3":
             sid = input_int("Student ID: ")
-            view_attendance_by_student(sid)
+            date_from = input("From date (YYYY-MM-DD, optional): ").strip() or None
+            date_to = input("To date (YYYY-MM-DD, optional): ").strip() or None
+            view_attendance_by_student(sid, date_from, date_to)
 
         elif choice == "4":
             cid = input_int("Class ID: ")
             date = input("Date (YYYY-MM-DD): ").strip()
             view_attendance_by_class_date(cid, date)
 
+        elif choice == "5":
+            cid = input_int("Class ID: ")
+            month_from = input("From month (YYYY-MM, optional): ").strip() or None
+            month_to = input("To month (YYYY-MM, optional): ").strip() or None
+            view_class_attendance_rates(cid, month_from, month_to)
+
+        elif choice == "6":
+            rebuild_attendance_summary()
+
         elif choice == "0":
             break
 
@@ -389,6 +454,9 @@ def schedule_menu():
         print("3. View Schedule by Student")
         print("4. Delete Schedule Slot")
         print("5. Send Schedule to Student's Parents")
+        print("6. Send Schedules to All Parents (Class / Whole School)")
+        print("7. Check Schedule Conflicts")
+        print("8. Generate Timetable")
         print("0. Back")
         choice = input("Choose: ").strip()
 
@@ -418,12 +486,30 @@ def schedule_menu():
             sid = input_int("Student ID: ")
             send_schedule_to_parents(sid)
 
+        elif choice == "6":
+            cid = input_int("Class ID (blank for whole school): ", allow_empty=True)
+            send_schedules(cid)
+
+        elif choice == "7":
+            check_schedule_conflicts()
+
+        elif choice == "8":
+            rooms = input("Rooms, comma-separated (blank = rooms already in use): ").strip()
+            rooms = [r for r in rooms.split(",") if r.strip()]
+            print("This replaces the schedule of every class whose students are enrolled in courses.")
+            if input("Preview only? (y/n): ").strip().lower() == "y":
+                generate_timetable(rooms, dry_run=True)
+            elif input("Write the new timetable? (y/n): ").strip().lower() == "y":
+                generate_timetable(rooms)
+
         elif choice == "0":
             break
 
 
 def main_menu():
     init_db()
+    if outbox.OUTBOX_AUTOSTART:
+        outbox.start_worker()
     print("=" * 40)
     print("   SCHOOL MANAGEMENT SYSTEM")
     print("=" * 40)
@@ -458,11 +544,105 @@ def main_menu():
         elif choice == "8":
             schedule_menu()
         elif choice == "0":
+            conn = get_connection()
+            queued = outbox.outbox_counts(conn)["pending"]
+            conn.close()
+            if queued:
+                print(f"{queued} email(s) still queued; they will be sent on the next run.")
             print("Goodbye!")
             sys.exit(0)
         else:
             print("Invalid choice.")
 
 
+# ── Commands ─────────────────────────────────────────────
+
+def run_command(argv):
+    """Non-interactive entry point: `python main.py <command> [options]`."""
+    parser = argparse.ArgumentParser(prog="main.py", description="School Management System commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild-attendance-summary", help="Resync the monthly attendance summary from scratch")
+    sub.add_parser("outbox-drain", help="Deliver every queued email that is due, then exit")
+    sub.add_parser("outbox-worker", help="Run the email delivery worker until interrupted")
+    sub.add_parser("outbox-retry", help="Requeue dead-lettered emails")
+    report = sub.add_parser("analytics", help="Print grade analytics for a course or every course")
+    report.add_argument("--course-id", type=int, help="Only this course, with student ranks (default: all courses)")
+    mail = sub.add_parser("send-schedules", help="Email every family their child's class schedule")
+    mail.add_argument("--class-id", type=int, help="Only this class (default: whole school)")
+    mail.add_argument("--workers", type=int, default=outbox.OUTBOX_WORKERS, help="Parallel SMTP sessions")
+    weekly = sub.add_parser("weekly-digest", help="Email every parent a digest of their children's week")
+    weekly.add_argument("--week-ending", help="Last day of the week (YYYY-MM-DD, default: today)")
+    weekly.add_argument("--dry-run", metavar="DIR", help="Write the emails to DIR as .eml files instead of sending")
+    weekly.add_argument("--workers", type=int, default=DIGEST_WORKERS, help="Processes rendering digests")
+    weekly.add_argument("--send-workers", type=int, default=outbox.OUTBOX_WORKERS, help="Parallel SMTP sessions")
+    tt = sub.add_parser("timetable", help="Generate a conflict-free timetable and write it into schedules")
+    tt.add_argument("--rooms", help="Comma-separated room names (default: rooms already in use)")
+    tt.add_argument("--time-budget", type=float, default=TIMETABLE_TIME_BUDGET_SECONDS, help="Search time in seconds")
+    tt.add_argument("--workers", type=int, default=TIMETABLE_WORKERS, help="Processes solving grade levels in parallel")
+    tt.add_argument("--dry-run", action="store_true", help="Report the result without writing it")
+    bulk = sub.add_parser("enroll-bulk", help="Enroll a class or a list of students into courses at once")
+    bulk.add_argument("--courses", required=True, help="Comma-separated course IDs")
+    who = bulk.add_mutually_exclusive_group(required=True)
+    who.add_argument("--class-id", type=int, help="Every student in this class")
+    who.add_argument("--students", help="Comma-separated student IDs")
+    imp = sub.add_parser("import", help="Bulk-import rows from a CSV file with a header line")
+    imp.add_argument("entity", choices=list(IMPORT_ENTITIES))
+    imp.add_argument("path", help="CSV file (UTF-8)")
+    exp = sub.add_parser("export", help="Stream a table or report to CSV or NDJSON")
+    exp.add_argument("name", choices=list(EXPORTS))
+    exp.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    exp.add_argument("--gzip", action="store_true", help="Compress the output")
+    exp.add_argument("--since", help="First date to include (YYYY-MM-DD)")
+    exp.add_argument("--until", help="Last date to include (YYYY-MM-DD)")
+    exp.add_argument("--class-id", type=int, help="Only this class")
+    exp.add_argument("-o", "--output", help="File to write (default: stdout)")
+
+    args = parser.parse_args(argv)
+    init_db()
+    if args.command == "rebuild-attendance-summary":
+        rebuild_attendance_summary()
+    elif args.command == "outbox-drain":
+        worker = outbox.OutboxWorker()
+        sent, failed = worker.drain()
+        worker.close()
+        print(f"Outbox drained: {sent} sent, {failed} failed.")
+    elif args.command == "outbox-worker":
+        print("Outbox worker running (Ctrl+C to stop).")
+        try:
+            outbox.run_forever()
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "outbox-retry":
+        conn = get_connection()
+        print(f"Requeued {outbox.requeue_dead(conn)} dead email(s).")
+        conn.close()
+    elif args.command == "analytics":
+        if args.course_id is None:
+            school_report()
+        else:
+            course_report(args.course_id)
+    elif args.command == "send-schedules":
+        send_schedules(args.class_id, args.workers)
+    elif args.command == "weekly-digest":
+        send_weekly_digest(args.week_ending, args.dry_run, args.workers, args.send_workers)
+    elif args.command == "timetable":
+        rooms = [r for r in (args.rooms or "").split(",") if r.strip()]
+        generate_timetable(rooms, args.time_budget, args.workers, args.dry_run)
+    elif args.command == "enroll-bulk":
+        try:
+            course_ids = [int(c) for c in args.courses.split(",") if c.strip()]
+            student_ids = [int(s) for s in (args.students or "").split(",") if s.strip()]
+        except ValueError:
+            parser.error("IDs must be whole numbers separated by commas")
+        bulk_enroll_students(course_ids, student_ids, args.class_id)
+    elif args.command == "import":
+        import_file(args.entity, args.path)
+    elif args.command == "export":
+        export_table(args.name, args.format, args.gzip, args.output, args.since, args.until, args.class_id)
+
+
 if __name__ == "__main__":
-    main_menu()
+    if len(sys.argv) > 1:
+        run_command(sys.argv[1:])
+    else:
+        main_menu()
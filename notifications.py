@@ -1,35 +1,32 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 from database import get_connection
+from outbox import OUTBOX_WORKERS, deliver, enqueue, queue_email, smtp_configured, wake_worker
 
 try:
-    from config import SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SENDER_NAME
+    from config import SENDER_NAME
 except ImportError:
-    SMTP_HOST = SMTP_PORT = SMTP_USER = SMTP_PASSWORD = SENDER_NAME = ""
+    SENDER_NAME = ""
+
+# Renders and queues notifications off the caller's thread, one job at a time.
+_dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notifications")
 
 
 def _send_email(to_email, subject, body_html):
-    """Send an email. Returns True on success, False on failure."""
-    if not SMTP_USER or not SMTP_PASSWORD:
+    """Queue an email in the outbox. Returns True if it was queued.
+
+    Delivery happens on the outbox worker (see outbox.py), not on the caller's thread.
+    """
+    if not smtp_configured():
         print(f"  [Email skipped — SMTP not configured in config.py]")
         return False
-
-    msg = MIMEMultipart("alternative")
-    msg["From"] = f"{SENDER_NAME} <{SMTP_USER}>"
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body_html, "html"))
-
     try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_USER, to_email, msg.as_string())
-        print(f"  Email sent to {to_email}")
+        queue_email(to_email, subject, body_html)
+        print(f"  Email queued for {to_email}")
         return True
     except Exception as e:
-        print(f"  Email failed for {to_email}: {e}")
+        print(f"  Email could not be queued for {to_email}: {e}")
         return False
 
 
@@ -45,27 +42,22 @@ def _get_parents_for_student(student_id):
     return rows
 
 
-def notify_parents_of_grade(enrollment_id, score, letter_grade, remarks):
-    """Send grade notification to all parents of the student in this enrollment."""
-    conn = get_connection()
-    row = conn.execute("""
-        SELECT s.id AS student_id, s.first_name || ' ' || s.last_name AS student_name,
-               c.name AS course_name, c.code AS course_code
+def _grade_messages(conn, enrollment_id, score, letter_grade, remarks):
+    """Build one (to_email, subject, body_html) per parent of the enrolled student."""
+    rows = conn.execute("""
+        SELECT s.first_name || ' ' || s.last_name AS student_name,
+               c.name AS course_name, c.code AS course_code, p.email
         FROM enrollments e
         JOIN students s ON e.student_id = s.id
         JOIN courses c ON e.course_id = c.id
-        WHERE e.id = ?
-    """, (enrollment_id,)).fetchone()
-    conn.close()
-
-    if not row:
-        return
-
-    parents = _get_parents_for_student(row["student_id"])
-    if not parents:
-        print("  No parents linked to this student — no emails sent.")
-        return
+        JOIN student_parents sp ON sp.student_id = s.id
+        JOIN parents p ON sp.parent_id = p.id
+        WHERE e.id = ? AND p.email IS NOT NULL AND p.email != ''
+    """, (enrollment_id,)).fetchall()
+    if not rows:
+        return []
 
+    row = rows[0]
     subject = f"Grade Report: {row['student_name']} — {row['course_name']}"
     body = f"""
     <html><body>
@@ -81,13 +73,107 @@ def notify_parents_of_grade(enrollment_id, score, letter_grade, remarks):
     <p>Best regards,<br>{SENDER_NAME}</p>
     </body></html>
     """
+    return [(r["email"], subject, body) for r in rows]
 
-    sent = 0
-    for p in parents:
-        if p["email"]:
-            if _send_email(p["email"], subject, body):
-                sent += 1
-    print(f"  Grade notification sent to {sent}/{len(parents)} parent(s).")
+
+def notify_parents_of_grade(enrollment_id, score, letter_grade, remarks):
+    """Queue a grade notification for all parents of the student in this enrollment.
+
+    Returns the number of emails queued.
+    """
+    if not smtp_configured():
+        return 0
+    conn = get_connection()
+    try:
+        messages = _grade_messages(conn, enrollment_id, score, letter_grade, remarks)
+        with conn:
+            enqueue(conn, messages)
+    finally:
+        conn.close()
+    wake_worker()
+    return len(messages)
+
+
+def _run_in_background(fn, *args):
+    try:
+        fn(*args)
+    except Exception as e:
+        print(f"  [Notifications] {fn.__name__} failed: {e}")
+
+
+def notify_parents_of_grade_async(enrollment_id, score, letter_grade, remarks):
+    """Hand the grade notification to the background dispatcher and return at once."""
+    return _dispatcher.submit(_run_in_background, notify_parents_of_grade,
+                              enrollment_id, score, letter_grade, remarks)
+
+
+def grade_batch_messages(conn, enrollment_ids):
+    """One email per parent address covering every grade in the batch.
+
+    A parent with several children in the batch, or one child with
+    several grades, gets a single message listing them all. Grades are
+    read as stored, in one query for the whole batch.
+    """
+    rows = conn.execute("""
+        SELECT DISTINCT lower(p.email) AS email, s.first_name || ' ' || s.last_name AS student_name,
+               c.name AS course_name, c.code AS course_code, g.enrollment_id, g.score, g.letter_grade, g.remarks
+        FROM grades g
+        JOIN enrollments e ON g.enrollment_id = e.id
+        JOIN students s ON e.student_id = s.id
+        JOIN courses c ON e.course_id = c.id
+        JOIN student_parents sp ON sp.student_id = s.id
+        JOIN parents p ON sp.parent_id = p.id
+        WHERE g.enrollment_id IN (SELECT value FROM json_each(?)) AND p.email IS NOT NULL AND p.email != ''
+        ORDER BY 1, student_name, course_code
+    """, (json.dumps(list(enrollment_ids)),)).fetchall()
+    by_parent = {}
+    for r in rows:
+        by_parent.setdefault(r["email"], []).append(r)
+
+    messages = []
+    for email, grades in by_parent.items():
+        if len(grades) == 1:
+            subject = f"Grade Report: {grades[0]['student_name']} — {grades[0]['course_name']}"
+        else:
+            subject = f"Grade Report: {len(grades)} grades"
+        table_rows = "".join(
+            f"<tr><td>{g['student_name']}</td><td>{g['course_name']} ({g['course_code']})</td>"
+            f"<td>{g['score']:.1f} / 100</td><td>{g['letter_grade']}</td><td>{g['remarks'] or 'N/A'}</td></tr>"
+            for g in grades)
+        body = f"""
+    <html><body>
+    <h2>Grade Notification</h2>
+    <p>Dear Parent,</p>
+    <p>These are the latest grades for your family:</p>
+    <table border="1" cellpadding="8" cellspacing="0">
+      <tr><th>Student</th><th>Course</th><th>Score</th><th>Grade</th><th>Remarks</th></tr>
+      {table_rows}
+    </table>
+    <p>Best regards,<br>{SENDER_NAME}</p>
+    </body></html>
+    """
+        messages.append((email, subject, body))
+    return messages
+
+
+def notify_parents_of_grades(enrollment_ids):
+    """Queue at most one email per parent for a batch of grades. Returns the number queued."""
+    if not smtp_configured() or not enrollment_ids:
+        return 0
+    conn = get_connection()
+    try:
+        messages = grade_batch_messages(conn, enrollment_ids)
+        with conn:
+            enqueue(conn, messages)
+    finally:
+        conn.close()
+    wake_worker()
+    return len(messages)
+
+
+def notify_parents_of_grades_async(enrollment_ids):
+    """Hand a batch of grade notifications to the background dispatcher and return at once."""
+    return _dispatcher.submit(_run_in_background, notify_parents_of_grades, list(enrollment_ids))
 
 
 def send_schedule_to_parents(student_id):
@@ -114,12 +200,7 @@ def send_schedule_to_parents(student_id):
         FROM schedules s
         JOIN courses c ON s.course_id = c.id
         WHERE s.class_id = ?
-        ORDER BY
-            CASE s.day_of_week
-                WHEN 'Monday' THEN 1 WHEN 'Tuesday' THEN 2 WHEN 'Wednesday' THEN 3
-                WHEN 'Thursday' THEN 4 WHEN 'Friday' THEN 5 WHEN 'Saturday' THEN 6
-                WHEN 'Sunday' THEN 7 END,
-            s.start_time
+        ORDER BY s.day_num, s.start_min
     """, (student["class_id"],)).fetchall()
     conn.close()
 
@@ -134,11 +215,25 @@ def send_schedule_to_parents(student_id):
 
     student_name = f"{student['first_name']} {student['last_name']}"
     class_name = cls["name"] if cls else "Unknown"
+    subject, body = _schedule_email(student_name, class_name, _schedule_rows_html(schedule))
+
+    sent = 0
+    for p in parents:
+        if p["email"]:
+            if _send_email(p["email"], subject, body):
+                sent += 1
+    print(f"  Schedule queued for {sent}/{len(parents)} parent(s).")
 
-    rows_html = ""
-    for s in schedule:
-        rows_html += f"<tr><td>{s['day_of_week']}</td><td>{s['start_time']} - {s['end_time']}</td><td>{s['course_name']} ({s['course_code']})</td><td>{s['room'] or ''}</td></tr>"
 
+def _schedule_rows_html(schedule):
+    return "".join(
+        f"<tr><td>{s['day_of_week']}</td><td>{s['start_time']} - {s['end_time']}</td>"
+        f"<td>{s['course_name']} ({s['course_code']})</td><td>{s['room'] or ''}</td></tr>"
+        for s in schedule
+    )
+
+
+def _schedule_email(student_name, class_name, rows_html):
     subject = f"Class Schedule: {student_name} — {class_name}"
     body = f"""
     <html><body>
@@ -152,10 +247,99 @@ def send_schedule_to_parents(student_id):
     <p>Best regards,<br>{SENDER_NAME}</p>
     </body></html>
     """
+    return subject, body
 
-    sent = 0
-    for p in parents:
-        if p["email"]:
-            if _send_email(p["email"], subject, body):
-                sent += 1
-    print(f"  Schedule sent to {sent}/{len(parents)} parent(s).")
+
+# ── Bulk schedule mailing ───────────────────────────────
+
+def schedule_messages(conn, class_id=None):
+    """Build schedule emails for every parent of every student in a class (or the school).
+
+    Uses two queries whatever the number of students, and renders each
+    class's schedule table once. Returns (messages, summary) where summary
+    counts students, students without a schedule or a reachable parent,
+    and messages.
+    """
+    where, args = ("WHERE s.class_id = ?", (class_id,)) if class_id is not None else ("", ())
+    tables = {}
+    for row in conn.execute(f"""
+        SELECT s.class_id, s.day_of_week, s.start_time, s.end_time, s.room,
+               c.name AS course_name, c.code AS course_code
+        FROM schedules s
+        JOIN courses c ON s.course_id = c.id
+        {where}
+        ORDER BY s.class_id, s.day_num, s.start_min
+    """, args):
+        tables.setdefault(row["class_id"], []).append(row)
+    rendered = {cid: _schedule_rows_html(rows) for cid, rows in tables.items()}
+
+    where = "WHERE s.class_id = ?" if class_id is not None else "WHERE s.class_id IS NOT NULL"
+    recipients = conn.execute(f"""
+        SELECT s.id, s.first_name || ' ' || s.last_name AS student_name,
+               s.class_id, cl.name AS class_name, p.email
+        FROM students s
+        JOIN classes cl ON s.class_id = cl.id
+        LEFT JOIN student_parents sp ON sp.student_id = s.id
+        LEFT JOIN parents p ON sp.parent_id = p.id AND p.email IS NOT NULL AND p.email != ''
+        {where}
+        ORDER BY s.class_id, s.last_name, s.first_name, s.id
+    """, args).fetchall()
+
+    messages, students, no_schedule, reached = [], set(), set(), set()
+    for r in recipients:
+        students.add(r["id"])
+        if r["class_id"] not in rendered:
+            no_schedule.add(r["id"])
+        elif r["email"]:
+            subject, body = _schedule_email(r["student_name"], r["class_name"], rendered[r["class_id"]])
+            messages.append((r["email"], subject, body))
+            reached.add(r["id"])
+    no_parent = students - no_schedule - reached
+    summary = {
+        "students": len(students),
+        "without_schedule": len(no_schedule),
+        "without_parent_email": len(no_parent),
+        "queued": len(messages),
+    }
+    return messages, summary
+
+
+def queue_schedules(class_id=None):
+    """Queue schedule emails for a class, or the whole school, in one transaction.
+
+    Returns (summary from schedule_messages(), outbox ids queued), or
+    (None, None) if SMTP is not configured.
+    """
+    if not smtp_configured():
+        return None, None
+    conn = get_connection()
+    try:
+        messages, summary = schedule_messages(conn, class_id)
+        with conn:
+            ids = enqueue(conn, messages)
+    finally:
+        conn.close()
+    return summary, ids
+
+
+def send_schedules(class_id=None, workers=OUTBOX_WORKERS):
+    """CLI: mail every family their child's schedule and wait for delivery."""
+    summary, ids = queue_schedules(class_id)
+    if summary is None:
+        print("  [Email skipped — SMTP not configured in config.py]")
+        return None
+    scope = f"class {class_id}" if class_id is not None else "the whole school"
+    print(f"  {summary['students']} student(s) in {scope}: "
+          f"{summary['queued']} email(s) queued, "
+          f"{summary['without_schedule']} without a class schedule, "
+          f"{summary['without_parent_email']} without a parent email.")
+    if not summary["queued"]:
+        return summary
+
+    def progress(sent, failed):
+        print(f"\r  Delivering: {sent} sent, {failed} failed", end="", flush=True)
+
+    sent, failed = deliver(workers, progress, ids)
+    print(f"\r  Delivered: {sent} sent, {failed} failed (failures are retried by the outbox worker).")
+    summary.update(sent=sent, failed=failed)
+    return summary
@@ -0,0 +1,347 @@
+"""
+Email outbox.
+
+Notifications are written to the email_outbox table and delivered by a
+worker that drains it in batches over one authenticated SMTP session.
+Failed messages are retried with exponential backoff and moved to the
+'dead' state after OUTBOX_MAX_ATTEMPTS (or at once for a permanent
+rejection such as an unknown recipient).
+"""
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from database import get_connection
+
+try:
+    from config import SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SENDER_NAME
+except ImportError:
+    SMTP_HOST = SMTP_PORT = SMTP_USER = SMTP_PASSWORD = SENDER_NAME = ""
+
+try:
+    from config import (SMTP_USE_TLS, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS,
+                        OUTBOX_RETRY_BASE_SECONDS, OUTBOX_POLL_SECONDS, OUTBOX_AUTOSTART)
+except ImportError:
+    SMTP_USE_TLS, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS = True, 50, 5
+    OUTBOX_RETRY_BASE_SECONDS, OUTBOX_POLL_SECONDS, OUTBOX_AUTOSTART = 30, 5, True
+
+try:
+    from config import OUTBOX_WORKERS, OUTBOX_RATE_PER_SECOND
+except ImportError:
+    OUTBOX_WORKERS, OUTBOX_RATE_PER_SECOND = 4, 10
+
+try:
+    from config import SMTP_AUTH
+except ImportError:
+    SMTP_AUTH = True
+
+# A message left in 'sending' this long (worker died mid-batch) is claimed again.
+CLAIM_TIMEOUT = "-10 minutes"
+
+_wakeup = threading.Event()
+_worker_thread = None
+
+
+def smtp_configured():
+    """A server to send through, with credentials unless it is an unauthenticated relay."""
+    if not SMTP_AUTH:
+        return bool(SMTP_HOST)
+    return bool(SMTP_HOST and SMTP_USER and SMTP_PASSWORD)
+
+
+# ── Queueing ────────────────────────────────────────────
+
+def enqueue(conn, messages):
+    """Queue (to_email, subject, body_html) tuples on `conn`. The caller commits.
+
+    Returns the range of outbox ids given to the messages, for deliver(ids=...).
+    The rows are written under one write lock, so their ids are consecutive.
+    """
+    messages = list(messages)
+    conn.executemany(
+        "INSERT INTO email_outbox (to_email, subject, body_html) VALUES (?, ?, ?)", messages
+    )
+    if not messages:
+        return range(0)
+    last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return range(last - len(messages) + 1, last + 1)
+
+
+def queue_email(to_email, subject, body_html):
+    conn = get_connection()
+    try:
+        enqueue(conn, [(to_email, subject, body_html)])
+        conn.commit()
+    finally:
+        conn.close()
+    wake_worker()
+
+
+def wake_worker():
+    """Tell the background worker there is new mail, instead of waiting for its next poll."""
+    _wakeup.set()
+
+
+def outbox_counts(conn):
+    rows = conn.execute("SELECT status, COUNT(*) AS n FROM email_outbox GROUP BY status").fetchall()
+    counts = {"pending": 0, "sending": 0, "sent": 0, "dead": 0}
+    counts.update({r["status"]: r["n"] for r in rows})
+    return counts
+
+
+def requeue_dead(conn):
+    """Give every dead-lettered message a fresh set of attempts. Returns how many."""
+    with conn:
+        cur = conn.execute("""
+            UPDATE email_outbox SET status='pending', attempts=0, next_attempt_at=datetime('now')
+            WHERE status='dead'
+        """)
+    wake_worker()
+    return cur.rowcount
+
+
+# ── Delivery ────────────────────────────────────────────
+
+def claim_batch(conn, limit, ids=None):
+    """Atomically mark up to `limit` due messages as 'sending' and return them.
+
+    `ids`, a range from enqueue(), restricts the claim to those messages.
+    """
+    first, last = (ids.start, ids.stop - 1) if ids is not None else (0, 2 ** 63 - 1)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT id, to_email, subject, body_html, attempts FROM email_outbox
+            WHERE id BETWEEN ? AND ?
+              AND ((status = 'pending' AND next_attempt_at <= datetime('now'))
+                   OR (status = 'sending' AND claimed_at <= datetime('now', ?)))
+            ORDER BY id LIMIT ?
+        """, (first, last, CLAIM_TIMEOUT, limit)).fetchall()
+        conn.executemany(
+            "UPDATE email_outbox SET status='sending', claimed_at=datetime('now') WHERE id=?",
+            [(r["id"],) for r in rows],
+        )
+    return rows
+
+
+def record_results(conn, sent_ids, failures):
+    """Mark delivered messages sent; reschedule or dead-letter the failures.
+
+    `failures` holds (id, attempts_so_far, error, permanent) tuples.
+    """
+    retry, dead = [], []
+    for msg_id, attempts, error, permanent in failures:
+        if permanent or attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+            dead.append((error, msg_id))
+        else:
+            delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** attempts
+            retry.append((error, f"+{delay} seconds", msg_id))
+    with conn:
+        conn.executemany("""
+            UPDATE email_outbox SET status='sent', attempts=attempts+1, sent_at=datetime('now'), last_error=NULL
+            WHERE id=?
+        """, [(i,) for i in sent_ids])
+        conn.executemany("""
+            UPDATE email_outbox SET status='pending', attempts=attempts+1, last_error=?,
+                   next_attempt_at=datetime('now', ?)
+            WHERE id=?
+        """, retry)
+        conn.executemany(
+            "UPDATE email_outbox SET status='dead', attempts=attempts+1, last_error=? WHERE id=?", dead
+        )
+
+
+def build_message(to_email, subject, body_html):
+    """The MIME text of an email as it is sent."""
+    msg = MIMEMultipart("alternative")
+    msg["From"] = f"{SENDER_NAME} <{SMTP_USER}>"
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body_html, "html"))
+    return msg.as_string()
+
+
+def _is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPDataError) and error.smtp_code >= 500
+
+
+class RateLimiter:
+    """Spaces calls to wait() at least 1/rate seconds apart, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Shared by every worker in the process, so the limit holds however many run.
+_limiter = RateLimiter(OUTBOX_RATE_PER_SECOND)
+
+
+class SMTPSession:
+    """One authenticated SMTP connection, opened on first use and reopened if dropped."""
+
+    def __init__(self):
+        self._server = None
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_USE_TLS:
+            server.starttls()
+        if SMTP_AUTH:
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        self._server = server
+
+    def send(self, to_email, subject, body_html):
+        message = build_message(to_email, subject, body_html)
+        for attempt in (1, 2):
+            if self._server is None:
+                self._connect()
+            try:
+                self._server.sendmail(SMTP_USER, [to_email], message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+class OutboxWorker:
+    """Drains the outbox in batches, reusing a single SMTP session."""
+
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE, limiter=None, progress=None, ids=None):
+        self.batch_size = batch_size
+        self.limiter = limiter or _limiter
+        self.progress = progress
+        self.ids = ids
+        self.session = SMTPSession()
+
+    def drain(self):
+        """Deliver every message that is due. Returns (sent, failed) counts.
+
+        After each batch, progress(sent, failed) is called with that batch's counts.
+        """
+        if not smtp_configured():
+            return 0, 0
+        total_sent = total_failed = 0
+        conn = get_connection()
+        try:
+            while True:
+                batch = claim_batch(conn, self.batch_size, self.ids)
+                if not batch:
+                    break
+                sent, failures, broken = self._deliver(batch)
+                record_results(conn, sent, failures)
+                if self.progress:
+                    self.progress(len(sent), len(failures))
+                total_sent += len(sent)
+                total_failed += len(failures)
+                if broken:
+                    break
+        finally:
+            conn.close()
+        return total_sent, total_failed
+
+    def _deliver(self, batch):
+        sent, failures = [], []
+        for i, msg in enumerate(batch):
+            try:
+                self.limiter.wait()
+                self.session.send(msg["to_email"], msg["subject"], msg["body_html"])
+                sent.append(msg["id"])
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                failures.append((msg["id"], msg["attempts"], str(e), _is_permanent(e)))
+            except (smtplib.SMTPException, OSError) as e:
+                # The session itself is unusable: fail the rest of the batch without trying.
+                self.session.close()
+                failures.extend((m["id"], m["attempts"], str(e), False) for m in batch[i:])
+                return sent, failures, True
+        return sent, failures, False
+
+    def close(self):
+        self.session.close()
+
+
+def deliver(workers=OUTBOX_WORKERS, progress=None, ids=None):
+    """Drain the outbox with a bounded pool of workers, each on its own SMTP session.
+
+    With `ids` (a range from enqueue()) only those messages are sent, so the
+    totals describe one mailing; other queued mail is left to the outbox
+    worker. All workers share the process-wide rate limit. progress(sent,
+    failed) receives running totals. Returns the final (sent, failed) totals.
+    """
+    totals = [0, 0]
+    lock = threading.Lock()
+
+    def tally(sent, failed):
+        with lock:
+            totals[0] += sent
+            totals[1] += failed
+            if progress:
+                progress(*totals)
+
+    def work():
+        worker = OutboxWorker(batch_size=max(1, OUTBOX_BATCH_SIZE // max(1, workers)), progress=tally, ids=ids)
+        try:
+            worker.drain()
+        finally:
+            worker.close()
+
+    threads = [threading.Thread(target=work, name=f"outbox-deliver-{i}") for i in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return tuple(totals)
+
+
+def deliver_in_background(workers=OUTBOX_WORKERS, ids=None):
+    thread = threading.Thread(target=deliver, args=(workers, None, ids), name="outbox-deliver", daemon=True)
+    thread.start()
+    return thread
+
+
+def run_forever(stop=None):
+    """Worker loop: drain, close the idle session, sleep until woken or polled."""
+    worker = OutboxWorker()
+    while stop is None or not stop.is_set():
+        try:
+            _, failed = worker.drain()
+            if failed:
+                print(f"  [Outbox] {failed} message(s) failed; they will be retried or dead-lettered")
+        except Exception as e:
+            print(f"  [Outbox] worker error: {e}")
+        worker.close()
+        _wakeup.wait(OUTBOX_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start_worker():
+    """Start the background delivery thread once per process."""
+    global _worker_thread
+    if _worker_thread is None or not _worker_thread.is_alive():
+        _worker_thread = threading.Thread(target=run_forever, name="outbox-worker", daemon=True)
+        _worker_thread.start()
+    return _worker_thread
@@ -5,8 +5,10 @@ const page = () => $('#page');
 const API = '/api';
 let modal, currentPage = 'dashboard';
 
-// Cache for dropdowns
-let teachersCache = [], classesCache = [], coursesCache = [], studentsCache = [], parentsCache = [];
+// Dropdown options as [id, label] pairs, from /api/lookups
+let lookups = { teachers: [], classes: [], courses: [], students: [], parents: [] };
+// Full rows for the list pages, each loaded on the first visit to its page
+const caches = { teachers: null, classes: null, courses: null, students: null, parents: null };
 
 async function api(path, opts = {}) {
   const res = await fetch(API + path, {
@@ -51,17 +53,50 @@ function selectField(id, label, options, selected = '') {
 function val(id) { return document.getElementById(id)?.value?.trim() || ''; }
 function valInt(id) { const v = val(id); return v ? parseInt(v) : null; }
 
-async function loadCaches() {
-  [teachersCache, classesCache, coursesCache, studentsCache, parentsCache] = await Promise.all([
-    api('/teachers'), api('/classes'), api('/courses'), api('/students'), api('/parents')
-  ]);
+// Position in the server's change feed; null until the caches are first loaded.
+let changeCursor = null;
+
+// Same order as the list endpoints (SQLite compares text by code unit, not locale).
+const cmp = (a, b) => (a < b ? -1 : a > b ? 1 : 0);
+const byName = (a, b) => cmp(a.last_name, b.last_name) || cmp(a.first_name, b.first_name) || a.id - b.id;
+const cacheOrder = {
+  teachers: byName, students: byName, parents: byName,
+  courses: (a, b) => cmp(a.code, b.code),
+  classes: (a, b) => cmp(a.grade_level, b.grade_level) || cmp(a.section || '', b.section || '') || a.id - b.id,
+};
+
+function applyChanges(changes) {
+  for (const [table, { upserted, deleted }] of Object.entries(changes)) {
+    if (!caches[table]) continue;
+    const gone = new Set([...deleted, ...upserted.map(r => r.id)]);
+    const rows = caches[table].filter(r => !gone.has(r.id)).concat(upserted).sort(cacheOrder[table]);
+    caches[table].splice(0, caches[table].length, ...rows);
+  }
 }
 
-function teacherOpts() { return teachersCache.map(t => ({ value: t.id, label: `${t.first_name} ${t.last_name}` })); }
-function classOpts() { return classesCache.map(c => ({ value: c.id, label: c.name })); }
-function courseOpts() { return coursesCache.map(c => ({ value: c.id, label: `${c.code} — ${c.name}` })); }
-function studentOpts() { return studentsCache.map(s => ({ value: s.id, label: `${s.first_name} ${s.last_name}` })); }
-function parentOpts() { return parentsCache.map(p => ({ value: p.id, label: `${p.first_name} ${p.last_name}` })); }
+// Dropdowns come from one /api/lookups request (a 304 while nothing changed).
+// Loaded lists are kept current with rows changed since the cursor (/api/changes);
+// the cursor is taken before any list is loaded, so replayed changes are harmless.
+async function loadCaches(pg) {
+  const pending = api('/lookups');
+  if (changeCursor === null) {
+    changeCursor = (await api('/changes')).cursor;
+  } else {
+    const feed = await api(`/changes?since=${changeCursor}`);
+    if (feed.reset) Object.keys(caches).forEach(k => { caches[k] = null; });
+    else applyChanges(feed.changes);
+    changeCursor = feed.cursor;
+  }
+  if (pg in caches && !caches[pg]) caches[pg] = await api(`/${pg}`);
+  lookups = await pending;
+}
+
+const opts = pairs => pairs.map(([value, label]) => ({ value, label }));
+function teacherOpts() { return opts(lookups.teachers); }
+function classOpts() { return opts(lookups.classes); }
+function courseOpts() { return opts(lookups.courses); }
+function studentOpts() { return opts(lookups.students); }
+function parentOpts() { return opts(lookups.parents); }
 
 // ── Navigation ───────────────────────────────────────
 
@@ -77,7 +112,7 @@ document.querySelectorAll('[data-page]').forEach(link => {
 });
 
 async function navigate(pg) {
-  await loadCaches();
+  await loadCaches(pg);
   const pages = { dashboard: renderDashboard, students: renderStudents, teachers: renderTeachers, courses: renderCourses, classes: renderClasses, parents: renderParents, enrollments: renderEnrollments, attendance: renderAttendance, schedules: renderSchedules };
   if (pages[pg]) pages[pg]();
 }
@@ -93,12 +128,19 @@ async function renderDashboard() {
     { label: 'Classes', val: s.classes, icon: 'bi-building-fill', bg: '#4cc9f0' },
     { label: 'Parents', val: s.parents, icon: 'bi-person-hearts', bg: '#4895ef' },
     { label: 'Enrollments', val: s.enrollments, icon: 'bi-journal-check', bg: '#560bad' },
+    { label: 'Attendance Today', val: s.attendance_today.total ? `${s.attendance_today.rate}%` : '—', icon: 'bi-calendar-check-fill', bg: '#198754' },
   ];
+  const grades = Object.entries(s.grade_distribution);
+  const graded = grades.reduce((n, [, c]) => n + c, 0);
   page().innerHTML = `<h4 class="section-title">Dashboard</h4><div class="row g-3">${cards.map(c => `
     <div class="col-sm-6 col-lg-4 col-xl-3"><div class="card stat-card p-3"><div class="d-flex align-items-center gap-3">
       <div class="icon text-white" style="background:${c.bg}"><i class="bi ${c.icon}"></i></div>
       <div><div class="text-muted small">${c.label}</div><div class="fw-bold fs-4">${c.val}</div></div>
-    </div></div></div>`).join('')}</div>`;
+    </div></div></div>`).join('')}</div>
+    <div class="card stat-card p-3 mt-3"><h6 class="fw-bold mb-3">Grade Distribution</h6>${graded ? grades.map(([g, c]) => `
+      <div class="d-flex align-items-center gap-2 mb-2"><span class="fw-bold" style="width:2rem">${g}</span>
+        <div class="progress flex-grow-1"><div class="progress-bar" style="width:${(c / graded * 100).toFixed(1)}%"></div></div>
+        <span class="text-muted small" style="width:3rem">${c}</span></div>`).join('') : '<p class="text-muted mb-0">No grades yet.</p>'}</div>`;
 }
 
 // ── Generic CRUD table ────────────────────────────────
@@ -122,7 +164,7 @@ function crudTable(title, columns, rows, { onAdd, onEdit, onDelete, extra = '' }
 // ── Students ─────────────────────────────────────────
 
 async function renderStudents() {
-  const data = studentsCache;
+  const data = caches.students;
   const cols = [
     { key: 'id', label: 'ID' },
     { label: 'Name', render: r => `${r.first_name} ${r.last_name}` },
@@ -146,7 +188,7 @@ async function renderStudents() {
 // ── Teachers ─────────────────────────────────────────
 
 async function renderTeachers() {
-  const data = teachersCache;
+  const data = caches.teachers;
   const cols = [
     { key: 'id', label: 'ID' },
     { label: 'Name', render: r => `${r.first_name} ${r.last_name}` },
@@ -169,23 +211,26 @@ async function renderTeachers() {
 // ── Courses ──────────────────────────────────────────
 
 async function renderCourses() {
-  const data = coursesCache;
+  const data = caches.courses;
+  const seats = await api('/courses/seats');
   const cols = [
     { key: 'id', label: 'ID' },
     { key: 'code', label: 'Code' },
     { key: 'name', label: 'Name' },
     { key: 'teacher_name', label: 'Teacher', render: r => r.teacher_name || '<span class="text-muted">Unassigned</span>' },
-    { key: 'max_capacity', label: 'Capacity' },
+    { key: 'max_capacity', label: 'Enrolled', render: r => `${seats[r.id] ?? 0}/${r.max_capacity}` },
+    { key: 'credits', label: 'Credits' },
+    { key: 'weekly_hours', label: 'Hours/Week' },
     { key: 'description', label: 'Description' },
   ];
   page().innerHTML = crudTable('Courses', cols, data, { onAdd: true, onEdit: true, onDelete: true });
   window._add = () => showModal('Add Course',
-    field('nm','Course Name') + field('cd','Code') + field('ds','Description') + selectField('ti','Teacher',teacherOpts()) + field('cap','Max Capacity','number','30'),
-    async () => { await api('/courses', { method: 'POST', body: { name: val('nm'), code: val('cd'), description: val('ds'), teacher_id: valInt('ti'), max_capacity: valInt('cap') || 30 } }); toast('Course added'); navigate('courses'); }
+    field('nm','Course Name') + field('cd','Code') + field('ds','Description') + selectField('ti','Teacher',teacherOpts()) + field('cap','Max Capacity','number','30') + field('cr','Credits','number','1') + field('wh','Hours per Week','number','3'),
+    async () => { await api('/courses', { method: 'POST', body: { name: val('nm'), code: val('cd'), description: val('ds'), teacher_id: valInt('ti'), max_capacity: valInt('cap') || 30, credits: parseFloat(val('cr')) || 1, weekly_hours: valInt('wh') || 3 } }); toast('Course added'); navigate('courses'); }
   );
   window._edit = id => { const r = data.find(x => x.id === id); showModal('Edit Course',
-    field('nm','Course Name','text',r.name) + field('cd','Code','text',r.code) + field('ds','Description','text',r.description||'') + selectField('ti','Teacher',teacherOpts(),r.teacher_id||'') + field('cap','Max Capacity','number',r.max_capacity||30),
-    async () => { await api(`/courses/${id}`, { method: 'PUT', body: { name: val('nm'), code: val('cd'), description: val('ds'), teacher_id: valInt('ti'), max_capacity: valInt('cap') || 30 } }); toast('Course updated'); navigate('courses'); }
+    field('nm','Course Name','text',r.name) + field('cd','Code','text',r.code) + field('ds','Description','text',r.description||'') + selectField('ti','Teacher',teacherOpts(),r.teacher_id||'') + field('cap','Max Capacity','number',r.max_capacity||30) + field('cr','Credits','number',r.credits||1) + field('wh','Hours per Week','number',r.weekly_hours||3),
+    async () => { await api(`/courses/${id}`, { method: 'PUT', body: { name: val('nm'), code: val('cd'), description: val('ds'), teacher_id: valInt('ti'), max_capacity: valInt('cap') || 30, credits: parseFloat(val('cr')) || 1, weekly_hours: valInt('wh') || 3 } }); toast('Course updated'); navigate('courses'); }
   ); };
   window._del = async id => { if (confirm('Delete this course?')) { await api(`/courses/${id}`, { method: 'DELETE' }); toast('Course deleted'); navigate('courses'); } };
 }
@@ -193,7 +238,7 @@ async function renderCourses() {
 // ── Classes ──────────────────────────────────────────
 
 async function renderClasses() {
-  const data = classesCache;
+  const data = caches.classes;
   const cols = [
     { key: 'id', label: 'ID' },
     { key: 'name', label: 'Name' },
@@ -217,7 +262,7 @@ async function renderClasses() {
 // ── Parents ──────────────────────────────────────────
 
 async function renderParents() {
-  const data = parentsCache;
+  const data = caches.parents;
   const cols = [
     { key: 'id', label: 'ID' },
     { label: 'Name', render: r => `${r.first_name} ${r.last_name}` },
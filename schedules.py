@@ -1,21 +1,221 @@
+from bisect import bisect_left
+from collections import defaultdict
+
 from database import get_connection
 
 DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
 
 
-def add_schedule_slot(class_id, course_id, day_of_week, start_time, end_time, room):
+# ── Time parsing ────────────────────────────────────────
+
+def parse_time(text):
+    """'HH:MM' (24-hour) to minutes after midnight. Raises ValueError if malformed."""
+    hours, sep, minutes = (text or "").strip().partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit() or len(hours) > 2 or len(minutes) != 2:
+        raise ValueError(f"Invalid time '{text}', expected HH:MM")
+    h, m = int(hours), int(minutes)
+    if h > 23 or m > 59:
+        raise ValueError(f"Invalid time '{text}', expected HH:MM")
+    return h * 60 + m
+
+
+def format_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def clean_room(room):
+    """A room name with surrounding whitespace removed; None for a blank or missing room."""
+    return (room or "").strip() or None
+
+
+def encode_slot(day_of_week, start_time, end_time):
+    """Return (day_num, start_min, end_min) as stored in schedules, or raise
+    ValueError describing the problem. Days are numbered 1 (Monday) to 7."""
     if day_of_week not in DAYS:
-        print(f"Invalid day. Choose from: {', '.join(DAYS)}")
-        return
+        raise ValueError(f"Invalid day. Choose from: {', '.join(DAYS)}")
+    start, end = parse_time(start_time), parse_time(end_time)
+    if end <= start:
+        raise ValueError("End time must be after start time")
+    return DAYS.index(day_of_week) + 1, start, end
+
+
+# ── Conflict detection ──────────────────────────────────
+
+class IntervalIndex:
+    """Half-open [start, end) intervals grouped by key, sorted by start.
+
+    A lookup bisects to the intervals starting before the query ends, then
+    walks back while the running maximum end still reaches past the query
+    start. With intervals of similar length, as lessons are, that costs
+    O(log n + matches) per key; one interval much longer than the others
+    keeps the running maximum high, so the walk can visit every entry
+    after it (O(n) at worst). Keys are one resource on one day, so n stays
+    small either way.
+    """
+
+    def __init__(self, items=()):
+        groups = defaultdict(list)
+        for key, start, end, value in items:
+            groups[key].append((start, end, value))
+        self._starts, self._entries, self._max_end = {}, {}, {}
+        for key, entries in groups.items():
+            entries.sort(key=lambda e: (e[0], e[1]))
+            running, max_end = 0, []
+            for _start, end, _value in entries:
+                running = max(running, end)
+                max_end.append(running)
+            self._starts[key] = [e[0] for e in entries]
+            self._entries[key] = entries
+            self._max_end[key] = max_end
+
+    def overlapping(self, key, start, end):
+        entries = self._entries.get(key)
+        if not entries:
+            return []
+        found = []
+        i = bisect_left(self._starts[key], end) - 1
+        max_end = self._max_end[key]
+        while i >= 0 and max_end[i] > start:
+            if entries[i][1] > start:
+                found.append(entries[i][2])
+            i -= 1
+        return found
+
+
+_SLOT_SELECT = """
+    SELECT s.id, s.class_id, cl.name AS class_name, s.course_id, c.code AS course_code,
+           c.teacher_id, s.day_of_week, s.start_time, s.end_time, s.room, s.day_num, s.start_min, s.end_min
+    FROM schedules s
+    JOIN courses c ON s.course_id = c.id
+    LEFT JOIN classes cl ON s.class_id = cl.id
+"""
+
+
+def _slot_keys(slot):
+    """The (dimension, resource, day) keys a slot books: its class, room and teacher."""
+    keys = [("class", slot["class_id"], slot["day_num"])]
+    room = clean_room(slot["room"])
+    if room:
+        keys.append(("room", room.lower(), slot["day_num"]))
+    if slot["teacher_id"] is not None:
+        keys.append(("teacher", slot["teacher_id"], slot["day_num"]))
+    return keys
+
+
+def _combined(key, a, b):
+    """Two classes taking the same lesson together share its room and teacher; that is not a clash."""
+    return (key[0] != "class" and a["course_id"] == b["course_id"]
+            and a["start_min"] == b["start_min"] and a["end_min"] == b["end_min"])
+
+
+def _index(slots):
+    """IntervalIndex over well-formed slots; returns (index, [(slot, start, end)], malformed slots).
+
+    Slots whose times could not be encoded (NULL minute columns) count as malformed.
+    """
+    items, valid, malformed = [], [], []
+    for slot in slots:
+        start, end = slot["start_min"], slot["end_min"]
+        if slot["day_num"] is None or start is None or end is None or end <= start:
+            malformed.append(slot)
+            continue
+        valid.append((slot, start, end))
+        items.extend((key, start, end, slot) for key in _slot_keys(slot))
+    return IntervalIndex(items), valid, malformed
+
+
+def find_conflicts(conn, class_id, course_id, day_of_week, start_time, end_time, room, exclude_id=None):
+    """Existing slots that would clash with the proposed one, as (dimension, slot) pairs.
+
+    Raises ValueError if the proposed day or times are invalid.
+    """
+    day, start, end = encode_slot(day_of_week, start_time, end_time)
+    room = clean_room(room)
+    course = conn.execute("SELECT teacher_id FROM courses WHERE id=?", (course_id,)).fetchone()
+    teacher_id = course["teacher_id"] if course else None
+    # One indexed lookup per resource (class, room, teacher) that day, instead
+    # of an OR that could only use day_num.
+    candidates = conn.execute(f"""
+        {_SLOT_SELECT}
+        WHERE s.id IN (
+            SELECT id FROM schedules WHERE class_id = ? AND day_num = ? AND start_min < ?
+            UNION
+            SELECT id FROM schedules WHERE lower(trim(room)) = lower(trim(?)) AND day_num = ? AND start_min < ?
+            UNION
+            SELECT id FROM schedules
+            WHERE course_id IN (SELECT id FROM courses WHERE teacher_id = ?) AND day_num = ? AND start_min < ?
+        ) AND s.end_min > ? AND s.id IS NOT ?
+    """, (class_id, day, end, room, day, end, teacher_id, day, end, start, exclude_id)).fetchall()
+    index, _valid, _malformed = _index(candidates)
+    proposed = {"class_id": class_id, "course_id": course_id, "room": room, "teacher_id": teacher_id,
+                "day_num": day, "start_min": start, "end_min": end}
+    return [(key[0], dict(slot)) for key in _slot_keys(proposed)
+            for slot in index.overlapping(key, start, end) if not _combined(key, proposed, slot)]
+
+
+def all_conflicts(conn):
+    """Every pair of existing slots that clash, in one pass over the schedule.
+
+    Returns (conflicts, malformed): conflicts are dicts with the dimension
+    and both slots; malformed are slots whose day or times are invalid.
+    """
+    index, valid, malformed = _index(conn.execute(_SLOT_SELECT).fetchall())
+    conflicts = []
+    for slot, start, end in valid:
+        for key in _slot_keys(slot):
+            for other in index.overlapping(key, start, end):
+                if other["id"] > slot["id"] and not _combined(key, slot, other):
+                    conflicts.append({"dimension": key[0], "first": dict(slot), "second": dict(other)})
+    conflicts.sort(key=lambda c: (c["first"]["day_num"], c["first"]["id"], c["second"]["id"]))
+    return conflicts, [dict(s) for s in malformed]
+
+
+def _describe(slot):
+    return (f"#{slot['id']} {slot['class_name'] or slot['class_id']} {slot['course_code']} "
+            f"{slot['day_of_week']} {slot['start_time']}-{slot['end_time']} {slot['room'] or ''}").rstrip()
+
+
+# ── Writes ──────────────────────────────────────────────
+
+INSERT_SLOT = """
+    INSERT INTO schedules (class_id, course_id, day_of_week, start_time, end_time, room, day_num, start_min, end_min)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def slot_row(class_id, course_id, day_of_week, start_time, end_time, room):
+    """Parameters for INSERT_SLOT, with the times validated and written as HH:MM and the room
+    stripped (a blank room is stored as NULL). Raises ValueError."""
+    day, start, end = encode_slot(day_of_week, start_time, end_time)
+    return (class_id, course_id, day_of_week, format_time(start), format_time(end), clean_room(room), day, start, end)
+
+
+def insert_slot(conn, class_id, course_id, day_of_week, start_time, end_time, room):
+    conn.execute(INSERT_SLOT, slot_row(class_id, course_id, day_of_week, start_time, end_time, room))
+
+
+# ── CLI ─────────────────────────────────────────────────
+
+def add_schedule_slot(class_id, course_id, day_of_week, start_time, end_time, room):
     conn = get_connection()
     try:
-        conn.execute(
-            "INSERT INTO schedules (class_id, course_id, day_of_week, start_time, end_time, room) VALUES (?, ?, ?, ?, ?, ?)",
-            (class_id, course_id, day_of_week, start_time, end_time, room),
-        )
+        # Hold the write lock from the check to the insert, so two writers cannot both pass.
+        conn.execute("BEGIN IMMEDIATE")
+        conflicts = find_conflicts(conn, class_id, course_id, day_of_week, start_time, end_time, room)
+        if conflicts:
+            conn.rollback()
+            print("Slot not added; it clashes with:")
+            for dimension, slot in conflicts:
+                print(f"  [{dimension}] {_describe(slot)}")
+            return
+        insert_slot(conn, class_id, course_id, day_of_week, start_time, end_time, room)
         conn.commit()
         print(f"Schedule slot added: {day_of_week} {start_time}-{end_time}")
+    except ValueError as e:
+        conn.rollback()
+        print(e)
     except Exception as e:
+        conn.rollback()
         print(f"Error: {e}")
     finally:
         conn.close()
@@ -37,12 +237,7 @@ def list_schedule_by_class(class_id):
         JOIN courses c ON s.course_id = c.id
         LEFT JOIN teachers t ON c.teacher_id = t.id
         WHERE s.class_id = ?
-        ORDER BY
-            CASE s.day_of_week
-                WHEN 'Monday' THEN 1 WHEN 'Tuesday' THEN 2 WHEN 'Wednesday' THEN 3
-                WHEN 'Thursday' THEN 4 WHEN 'Friday' THEN 5 WHEN 'Saturday' THEN 6
-                WHEN 'Sunday' THEN 7 END,
-            s.start_time
+        ORDER BY s.day_num, s.start_min
     """, (class_id,)).fetchall()
     conn.close()
 
@@ -87,3 +282,17 @@ def view_student_schedule(student_id):
     conn.close()
     print(f"\nSchedule for {student['first_name']} {student['last_name']}:")
     list_schedule_by_class(student["class_id"])
+
+
+def check_schedule_conflicts():
+    conn = get_connection()
+    conflicts, malformed = all_conflicts(conn)
+    conn.close()
+    if not conflicts and not malformed:
+        print("No schedule conflicts.")
+        return
+    for c in conflicts:
+        print(f"[{c['dimension']}] {_describe(c['first'])}  <->  {_describe(c['second'])}")
+    for slot in malformed:
+        print(f"[invalid] {_describe(slot)}")
+    print(f"\n{len(conflicts)} conflict(s), {len(malformed)} slot(s) with an invalid day or time.")
@@ -0,0 +1,65 @@
+"""
+Global search over students, teachers, parents and courses.
+
+Backed by the trigram FTS5 table `search_index` (see migrations.py),
+which triggers keep in sync with the source tables.
+"""
+from migrations import SEARCH_SOURCES
+
+KINDS = ("student", "teacher", "parent", "course")
+
+
+def search(conn, query, kinds=None, limit=20, offset=0):
+    """Return index rows matching every word of `query`, best match first.
+
+    Each row has kind, id, name, email and code. Words shorter than three
+    characters cannot use the trigram index, so queries containing one
+    fall back to LIKE over the (small) index table, ordered by name.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    args = []
+    if all(len(t) >= 3 for t in terms):
+        where = ["search_index MATCH ?"]
+        args.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in terms))
+        order = "rank"
+    else:
+        where = []
+        for t in terms:
+            where.append("(name LIKE ? OR email LIKE ? OR code LIKE ?)")
+            args.extend([f"%{t}%"] * 3)
+        order = "name"
+    if kinds:
+        where.append(f"kind IN ({', '.join('?' * len(kinds))})")
+        args.extend(kinds)
+    args.extend([-1 if limit is None else limit, offset])
+    return conn.execute(f"""
+        SELECT kind, ref_id AS id, name, email, code
+        FROM search_index
+        WHERE {' AND '.join(where)}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    """, args).fetchall()
+
+
+def defer_indexing(conn, table):
+    """Stop indexing new rows of `table` one by one, for a bulk insert.
+
+    Only call this inside a transaction, and end it with resume_indexing()
+    before committing.
+    """
+    conn.execute("INSERT OR IGNORE INTO search_deferred (table_name) VALUES (?)", (table,))
+
+
+def resume_indexing(conn, table, after_id):
+    """Index the rows of `table` inserted since defer_indexing() (ids above
+    `after_id`) in one statement, and go back to per-row indexing."""
+    for kind, offset, source, name, email, code, _watched in SEARCH_SOURCES:
+        if source == table:
+            conn.execute(f"""
+                INSERT INTO search_index (rowid, kind, ref_id, name, email, code)
+                SELECT t.id * 4 + {offset}, '{kind}', t.id, {name.format(r='t')}, {email.format(r='t')}, {code.format(r='t')}
+                FROM {table} t WHERE t.id > ?
+            """, (after_id,))
+    conn.execute("DELETE FROM search_deferred WHERE table_name = ?", (table,))
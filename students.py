@@ -1,4 +1,5 @@
 from database import get_connection
+from search import search
 
 
 def add_student(first_name, last_name, dob, email, phone):
@@ -31,16 +32,13 @@ def list_students():
 
 def search_students(keyword):
     conn = get_connection()
-    rows = conn.execute(
-        "SELECT * FROM students WHERE first_name LIKE ? OR last_name LIKE ? OR email LIKE ?",
-        (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"),
-    ).fetchall()
+    rows = search(conn, keyword, kinds=("student",), limit=None)
     conn.close()
     if not rows:
         print("No matching students found.")
         return
     for r in rows:
-        print(f"  [{r['id']}] {r['first_name']} {r['last_name']} — {r['email']}")
+        print(f"  [{r['id']}] {r['name']} — {r['email']}")
 
 
 def update_student(student_id, first_name, last_name, dob, email, phone):
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A freshly migrated throwaway database; get_connection() points at it for the test."""
+    previous = database.DB_PATH
+    database.set_db_path(str(tmp_path / "school.db"))
+    database.init_db()
+    conn = database.get_connection()
+    yield conn
+    conn.close()
+    database.get_pool().close_all()
+    database.set_db_path(previous)
@@ -0,0 +1,58 @@
+import database
+from analytics import course_stats
+
+
+def build(path, score):
+    database.set_db_path(str(path))
+    database.init_db()
+    conn = database.get_connection()
+    with conn:
+        conn.execute("INSERT INTO students (first_name, last_name) VALUES ('A', 'One')")
+        conn.execute("INSERT INTO courses (code, name) VALUES ('M1', 'Math')")
+        conn.execute("INSERT INTO enrollments (student_id, course_id) VALUES (1, 1)")
+        conn.execute("INSERT INTO grades (enrollment_id, score, letter_grade) VALUES (1, ?, 'A')", (score,))
+    return conn
+
+
+def test_cache_does_not_leak_across_databases(tmp_path):
+    previous = database.DB_PATH
+    try:
+        first = build(tmp_path / "first.db", 90)
+        assert course_stats(first, 1)["mean"] == 90
+        first.close()
+        second = build(tmp_path / "second.db", 40)
+        assert course_stats(second, 1)["mean"] == 40
+        second.close()
+    finally:
+        database.get_pool().close_all()
+        database.set_db_path(previous)
+
+
+def test_grade_change_refreshes_stats(db):
+    with db:
+        db.execute("INSERT INTO students (first_name, last_name) VALUES ('A', 'One')")
+        db.execute("INSERT INTO courses (code, name) VALUES ('M1', 'Math')")
+        db.execute("INSERT INTO enrollments (student_id, course_id) VALUES (1, 1)")
+        db.execute("INSERT INTO grades (enrollment_id, score, letter_grade) VALUES (1, 70, 'C')")
+    assert course_stats(db, 1)["mean"] == 70
+    with db:
+        db.execute("UPDATE grades SET score = 80, letter_grade = 'B'")
+    assert course_stats(db, 1)["mean"] == 80
+
+
+def test_grade_write_bumps_the_course_version_once(db):
+    import enrollments
+    with db:
+        db.execute("INSERT INTO students (first_name, last_name) VALUES ('A', 'One')")
+        db.execute("INSERT INTO courses (code, name) VALUES ('M1', 'Math')")
+        db.execute("INSERT INTO enrollments (student_id, course_id) VALUES (1, 1)")
+
+    def version():
+        return db.execute("SELECT version FROM course_grade_versions WHERE course_id = 1").fetchone()[0]
+
+    enrollments.upsert_grades(db, [{"enrollment_id": 1, "score": 60}])
+    for score in (70, 85):
+        before = version()
+        enrollments.upsert_grades(db, [{"enrollment_id": 1, "score": score}])
+        assert version() == before + 1
+    assert db.execute("SELECT graded_at IS NOT NULL FROM grades").fetchone()[0]
@@ -0,0 +1,31 @@
+import pytest
+
+from attendance import upsert_attendance
+
+
+@pytest.fixture
+def students(db):
+    with db:
+        db.executemany("INSERT INTO students (first_name, last_name) VALUES (?, ?)", [("A", "One"), ("B", "Two")])
+    return db
+
+
+@pytest.mark.parametrize("bad", ["20261012", "2026-02-30", "12/10/2026", "", None])
+def test_malformed_dates_are_refused_before_writing(students, bad):
+    with pytest.raises(ValueError):
+        upsert_attendance(students, bad, [{"student_id": 1, "status": "Present"}])
+    assert students.execute("SELECT COUNT(*) FROM attendance").fetchone()[0] == 0
+
+
+def test_outcomes_and_month_keys(students):
+    first = upsert_attendance(students, "2026-10-12", [{"student_id": 1, "status": "Present"},
+                                                        {"student_id": 2, "status": "Sick"},
+                                                        {"student_id": 9, "status": "Late"}])
+    assert [o["result"] for o in first] == ["created", "rejected", "rejected"]
+    again = upsert_attendance(students, "2026-10-12", [{"student_id": 1, "status": "Present"},
+                                                        {"student_id": 2, "status": "Late"}])
+    assert [o["result"] for o in again] == ["unchanged", "created"]
+    changed = upsert_attendance(students, "2026-10-12", [{"student_id": 1, "status": "Absent"}])
+    assert changed[0]["result"] == "updated"
+    months = [r[0] for r in students.execute("SELECT DISTINCT substr(date, 1, 7) FROM attendance")]
+    assert months == ["2026-10"]
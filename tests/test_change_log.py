@@ -0,0 +1,64 @@
+import database
+import migrations
+
+
+def seqs(conn):
+    return [r[0] for r in conn.execute("SELECT seq FROM change_log ORDER BY seq")]
+
+
+def add_students(conn, n):
+    with conn:
+        conn.executemany("INSERT INTO students (first_name, last_name) VALUES (?, ?)",
+                         [(f"S{i}", "Log") for i in range(n)])
+
+
+def test_trim_keeps_a_contiguous_tail_within_the_row_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "CHANGE_LOG_MAX_ROWS", 50)
+    monkeypatch.setattr(migrations, "CHANGE_LOG_TRIM_EVERY", 10)
+    previous = database.DB_PATH
+    database.set_db_path(str(tmp_path / "trim.db"))
+    try:
+        database.init_db()
+        conn = database.get_connection()
+        add_students(conn, 500)
+        kept = seqs(conn)
+        assert 50 <= len(kept) < 60
+        assert kept == list(range(kept[0], kept[-1] + 1))
+        conn.close()
+    finally:
+        database.get_pool().close_all()
+        database.set_db_path(previous)
+
+
+def test_trim_drops_rows_past_the_retention_period(db):
+    add_students(db, 5)
+    with db:
+        db.execute("UPDATE change_log SET changed_at = datetime('now', '-90 days')")
+    last = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()[0]
+    # Advance to the insert that fires the trim trigger.
+    add_students(db, migrations.CHANGE_LOG_TRIM_EVERY - last % migrations.CHANGE_LOG_TRIM_EVERY)
+    kept = seqs(db)
+    assert kept[0] > last
+    assert kept[-1] % migrations.CHANGE_LOG_TRIM_EVERY == 0
+
+
+def test_enrolling_does_not_touch_the_course_version_or_log(db):
+    import enrollments
+    add_students(db, 2)
+    with db:
+        db.execute("INSERT INTO courses (code, name, max_capacity) VALUES ('M1', 'Math', 1)")
+
+    def course_state():
+        version = db.execute("SELECT version FROM table_versions WHERE name = 'courses'").fetchone()[0]
+        logged = db.execute("SELECT COUNT(*) FROM change_log WHERE table_name = 'courses'").fetchone()[0]
+        return version, logged
+
+    before = course_state()
+    with db:
+        enrollments.enroll(db, 1, 1)
+    assert db.execute("SELECT enrolled_count FROM courses WHERE id = 1").fetchone()[0] == 1
+    assert course_state() == before
+    with db:
+        db.execute("UPDATE courses SET max_capacity = 2 WHERE id = 1")
+    version, logged = course_state()
+    assert version == before[0] + 1 and logged == before[1] + 1
@@ -0,0 +1,242 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+import outbox
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """A local stand-in SMTP server that records what it is sent.
+
+    `refuse` maps a recipient to the reply code for its RCPT command and
+    `reject_data` to the reply code after its message body. With
+    `drop_after` set, the first connection to deliver that many messages
+    is closed at its next MAIL command.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = self.logins = 0
+        self.delivered = []  # (recipient, time received)
+        self.refuse, self.reject_data = {}, {}
+        self.drop_after = None
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, text):
+        self.wfile.write(text.encode() + b"\r\n")
+
+    def handle(self):
+        stub = self.server
+        with stub.lock:
+            stub.connections += 1
+        delivered, recipients = 0, []
+        self.reply("220 stub ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.reply("250-stub")
+                self.reply("250 AUTH PLAIN")
+            elif verb == "HELO":
+                self.reply("250 stub")
+            elif verb == "AUTH":
+                with stub.lock:
+                    stub.logins += 1
+                self.reply("235 authenticated")
+            elif verb == "MAIL":
+                with stub.lock:
+                    drop = stub.drop_after is not None and delivered >= stub.drop_after
+                    if drop:
+                        stub.drop_after = None
+                if drop:
+                    return
+                recipients = []
+                self.reply("250 ok")
+            elif verb == "RCPT":
+                address = command[command.index("<") + 1:command.rindex(">")]
+                code = stub.refuse.get(address)
+                if code:
+                    self.reply(f"{code} refused")
+                else:
+                    recipients.append(address)
+                    self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                code = next((stub.reject_data[r] for r in recipients if r in stub.reject_data), None)
+                if code:
+                    self.reply(f"{code} rejected")
+                    continue
+                with stub.lock:
+                    stub.delivered.extend((r, time.monotonic()) for r in recipients)
+                delivered += 1
+                self.reply("250 queued")
+            elif verb in ("RSET", "NOOP"):
+                recipients = []
+                self.reply("250 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+@pytest.fixture
+def smtp(db, monkeypatch):
+    stub = SMTPStub()
+    thread = threading.Thread(target=stub.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(outbox, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(outbox, "SMTP_PORT", stub.server_address[1])
+    monkeypatch.setattr(outbox, "SMTP_USER", "office@school.test")
+    monkeypatch.setattr(outbox, "SMTP_PASSWORD", "secret")
+    monkeypatch.setattr(outbox, "SMTP_USE_TLS", False)
+    monkeypatch.setattr(outbox, "_limiter", outbox.RateLimiter(0))
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+
+def queue(conn, *addresses):
+    with conn:
+        outbox.enqueue(conn, [(a, f"Subject {a}", "<p>Hi</p>") for a in addresses])
+
+
+def statuses(conn):
+    return {r["to_email"]: (r["status"], r["attempts"])
+            for r in conn.execute("SELECT to_email, status, attempts FROM email_outbox")}
+
+
+def drain():
+    worker = outbox.OutboxWorker()
+    try:
+        return worker.drain()
+    finally:
+        worker.close()
+
+
+def test_one_session_is_reused_for_a_batch(db, smtp):
+    addresses = [f"parent{i}@school.test" for i in range(20)]
+    queue(db, *addresses)
+    assert drain() == (20, 0)
+    assert smtp.connections == 1 and smtp.logins == 1
+    assert sorted(r for r, _ in smtp.delivered) == sorted(addresses)
+    assert outbox.outbox_counts(db)["sent"] == 20
+
+
+def test_temporary_failure_is_retried_with_backoff_then_dead_lettered(db, smtp):
+    smtp.refuse["busy@school.test"] = 451
+    queue(db, "busy@school.test", "ok@school.test")
+    delays = []
+    for attempt in range(1, outbox.OUTBOX_MAX_ATTEMPTS + 1):
+        drain()
+        row = db.execute("""
+            SELECT status, attempts, last_error,
+                   CAST(strftime('%s', next_attempt_at) AS INTEGER) - CAST(strftime('%s', 'now') AS INTEGER) AS wait
+            FROM email_outbox WHERE to_email = 'busy@school.test'
+        """).fetchone()
+        assert row["attempts"] == attempt and "451" in row["last_error"]
+        if row["status"] == "dead":
+            break
+        assert row["status"] == "pending"
+        delays.append(row["wait"])
+        # Make it due again without waiting out the backoff.
+        with db:
+            db.execute("UPDATE email_outbox SET next_attempt_at = datetime('now') WHERE status = 'pending'")
+    expected = [outbox.OUTBOX_RETRY_BASE_SECONDS * 2 ** n for n in range(outbox.OUTBOX_MAX_ATTEMPTS - 1)]
+    assert all(abs(got - want) <= 2 for got, want in zip(delays, expected)) and len(delays) == len(expected)
+    assert statuses(db) == {"busy@school.test": ("dead", outbox.OUTBOX_MAX_ATTEMPTS), "ok@school.test": ("sent", 1)}
+
+
+def test_not_due_message_is_not_sent(db, smtp):
+    smtp.refuse["busy@school.test"] = 451
+    queue(db, "busy@school.test")
+    drain()
+    smtp.refuse.clear()
+    assert drain() == (0, 0)
+    assert statuses(db) == {"busy@school.test": ("pending", 1)}
+
+
+def test_permanent_rejections_are_dead_lettered_at_once(db, smtp):
+    smtp.refuse["unknown@school.test"] = 550
+    smtp.reject_data["spam@school.test"] = 554
+    queue(db, "unknown@school.test", "spam@school.test", "ok@school.test")
+    assert drain() == (1, 2)
+    assert statuses(db) == {
+        "unknown@school.test": ("dead", 1),
+        "spam@school.test": ("dead", 1),
+        "ok@school.test": ("sent", 1),
+    }
+    assert smtp.connections == 1
+
+
+def test_session_reconnects_after_a_dropped_connection(db, smtp):
+    smtp.drop_after = 3
+    addresses = [f"parent{i}@school.test" for i in range(6)]
+    queue(db, *addresses)
+    assert drain() == (6, 0)
+    assert smtp.connections == 2 and smtp.logins == 2
+    assert sorted(r for r, _ in smtp.delivered) == sorted(addresses)
+
+
+def test_unreachable_server_fails_the_batch_for_retry(db, smtp, monkeypatch):
+    monkeypatch.setattr(outbox, "SMTP_PORT", 1)
+    queue(db, "a@school.test", "b@school.test")
+    assert drain() == (0, 2)
+    assert statuses(db) == {"a@school.test": ("pending", 1), "b@school.test": ("pending", 1)}
+
+
+def test_parallel_workers_share_one_rate_limit(db, smtp, monkeypatch):
+    rate, count = 20, 10
+    monkeypatch.setattr(outbox, "_limiter", outbox.RateLimiter(rate))
+    monkeypatch.setattr(outbox, "OUTBOX_BATCH_SIZE", 4)  # one message per claim with 4 workers
+    queue(db, *(f"parent{i}@school.test" for i in range(count)))
+    start = time.monotonic()
+    assert outbox.deliver(workers=4) == (count, 0)
+    elapsed = time.monotonic() - start
+    assert smtp.connections > 1
+    # Four independent limits would finish in about a quarter of this.
+    assert elapsed >= (count - 1) / rate * 0.9
+    times = sorted(t for _, t in smtp.delivered)
+    assert times[-1] - times[0] >= (count - 1) / rate * 0.8
+
+
+def test_unauthenticated_relay(db, smtp, monkeypatch):
+    monkeypatch.setattr(outbox, "SMTP_AUTH", False)
+    monkeypatch.setattr(outbox, "SMTP_PASSWORD", "")
+    assert outbox.smtp_configured()
+    queue(db, "a@school.test", "b@school.test")
+    assert drain() == (2, 0)
+    assert smtp.connections == 1 and smtp.logins == 0
+
+
+def test_credentials_are_required_when_authenticating(monkeypatch):
+    monkeypatch.setattr(outbox, "SMTP_AUTH", True)
+    monkeypatch.setattr(outbox, "SMTP_USER", "office@school.test")
+    monkeypatch.setattr(outbox, "SMTP_PASSWORD", "")
+    assert not outbox.smtp_configured()
+
+
+def test_deliver_limited_to_one_mailing(db, smtp):
+    queue(db, "earlier@school.test")
+    with db:
+        ids = outbox.enqueue(db, [(f"p{i}@school.test", "Schedule", "<p>Hi</p>") for i in range(3)])
+    queue(db, "later@school.test")
+    totals = []
+    assert outbox.deliver(workers=2, progress=lambda *t: totals.append(t), ids=ids) == (3, 0)
+    assert totals[-1] == (3, 0)
+    assert sorted(r for r, _ in smtp.delivered) == [f"p{i}@school.test" for i in range(3)]
+    assert outbox.outbox_counts(db) == {"pending": 2, "sending": 0, "sent": 3, "dead": 0}
+    assert outbox.enqueue(db, []) == range(0)
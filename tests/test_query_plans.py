@@ -0,0 +1,32 @@
+import pytest
+
+from migrations import HOT_QUERIES, full_scans
+
+
+def plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_is_served_by_index_searches(db, name):
+    sql, params = HOT_QUERIES[name]
+    steps = plan(db, sql, params)
+    # Every table access is a SEARCH; other steps (subqueries, compounds) only structure the plan.
+    access = [step for step in steps if step.startswith(("SCAN ", "SEARCH "))]
+    assert access and all(step.startswith("SEARCH ") for step in access), steps
+
+
+def test_no_hot_query_scans(db):
+    assert full_scans(db) == []
+
+
+@pytest.mark.parametrize("index, query, scan", [
+    ("idx_enrollments_course", "enrollments by course", "SCAN e"),
+    ("idx_student_parents_parent", "children of parent", "SCAN sp"),
+    ("idx_students_class", "students in class", "SCAN students"),
+    ("idx_attendance_date", "attendance by date", "SCAN attendance"),
+])
+def test_dropped_index_is_reported(db, index, query, scan):
+    db.execute(f"DROP INDEX {index}")
+    found = full_scans(db)
+    assert any(name == query and detail.startswith(scan) for name, detail in found), found
@@ -0,0 +1,13 @@
+from schedules import find_conflicts, insert_slot
+
+
+def test_blank_room_is_no_room(db):
+    with db:
+        db.executemany("INSERT INTO classes (name, grade_level) VALUES (?, ?)", [("7A", "7"), ("7B", "7")])
+        db.executemany("INSERT INTO courses (code, name) VALUES (?, ?)", [("M1", "Math"), ("E1", "English")])
+        insert_slot(db, 1, 1, "Monday", "09:00", "10:00", "  ")
+        insert_slot(db, 1, 2, "Tuesday", "09:00", "10:00", " Lab ")
+    assert [r[0] for r in db.execute("SELECT room FROM schedules ORDER BY id")] == [None, "Lab"]
+    assert find_conflicts(db, 2, 2, "Monday", "09:00", "10:00", " ") == []
+    clashes = find_conflicts(db, 2, 1, "Tuesday", "09:30", "10:30", "lab  ")
+    assert [dimension for dimension, _ in clashes] == ["room"]
@@ -0,0 +1,47 @@
+import pytest
+
+import timetable
+from schedules import all_conflicts, insert_slot
+
+SUBJECT_HOURS = {"MATH": 5, "LANG": 4, "SCI": 3, "ART": 2}
+
+
+@pytest.fixture
+def school(db):
+    """Two grade levels of two classes, one teacher per subject and grade, and one class kept out of
+    the timetable whose fixed lesson holds room R1 on Monday morning."""
+    with db:
+        for class_id in range(1, 6):
+            db.execute("INSERT INTO classes (id, name, grade_level) VALUES (?, ?, ?)",
+                       (class_id, f"C{class_id}", str(class_id % 2 + 1)))
+        for class_id in range(1, 5):
+            db.execute("INSERT INTO students (id, first_name, last_name, class_id) VALUES (?, 'S', ?, ?)",
+                       (class_id, str(class_id), class_id))
+        teacher_id = 0
+        for grade_classes in ((1, 3), (2, 4)):
+            for subject, hours in SUBJECT_HOURS.items():
+                teacher_id += 1
+                db.execute("INSERT INTO teachers (id, first_name, last_name) VALUES (?, ?, 'T')",
+                           (teacher_id, subject))
+                for class_id in grade_classes:
+                    course = db.execute(
+                        "INSERT INTO courses (name, code, teacher_id, weekly_hours) VALUES (?, ?, ?, ?)",
+                        (subject, f"{subject}-{class_id}", teacher_id, hours)).lastrowid
+                    db.execute("INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)",
+                               (class_id, course))
+        fixed = db.execute("INSERT INTO courses (name, code) VALUES ('Lab', 'LAB-5')").lastrowid
+        insert_slot(db, 5, fixed, "Monday", "08:00", "08:50", "r1")
+    return db
+
+
+def test_generated_timetable_passes_conflict_checks(school):
+    result = timetable.generate(school, ["R1", " r1", "R2", "r2 ", "R3"], time_budget=5, workers=1)
+    assert result["placed"] == result["lessons"] == 2 * 2 * sum(SUBJECT_HOURS.values())
+    assert {s["room"] for s in result["slots"]} <= {"R1", "R2", "R3"}
+    timetable.apply_timetable(school, result)
+    assert all_conflicts(school) == ([], [])
+
+
+def test_rooms_are_required(school):
+    with pytest.raises(ValueError):
+        timetable.generate(school, ["", "  "], time_budget=1, workers=1)
@@ -0,0 +1,454 @@
+"""
+Automatic timetable generation.
+
+Places every course's weekly lessons on a grid of days x periods so that
+no class, teacher or room is booked twice at once, then writes the
+result into `schedules`.
+
+A class takes the courses its students are enrolled in, and a course
+meets courses.weekly_hours times a week. A course taken by several
+classes is taught to them together. Slots of classes that take no
+course are left alone, and their teachers and rooms stay booked.
+
+Classes that share no course and no teacher are independent, so each
+grade level (merged with any level it shares a teacher or course with)
+is solved in its own worker process. Each group is given a share of the
+free rooms in every period, and rooms are named once all groups finish.
+
+Within a group, every class and teacher has a bitmask of booked periods,
+and a lesson's candidates are the periods free in all of its masks
+(and with a room left). The search always places the lesson with the fewest candidates
+left. When a lesson has none, it takes the period that displaces the
+fewest placed lessons, and those go back on the list. This repairs dead
+ends locally rather than backtracking, which on large schools rarely
+recovers from an early mistake. When the time budget runs out, the best
+assignment seen is kept and the remaining lessons are reported as
+unplaced.
+"""
+import json
+import multiprocessing
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from database import get_connection
+from schedules import INSERT_SLOT, clean_room, parse_time, slot_row
+
+try:
+    from config import TIMETABLE_DAYS, TIMETABLE_PERIODS, TIMETABLE_TIME_BUDGET_SECONDS, TIMETABLE_WORKERS
+except ImportError:
+    TIMETABLE_DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday")
+    TIMETABLE_PERIODS = (("08:00", "08:50"), ("09:00", "09:50"), ("10:00", "10:50"), ("11:00", "11:50"),
+                         ("13:00", "13:50"), ("14:00", "14:50"), ("15:00", "15:50"))
+    TIMETABLE_TIME_BUDGET_SECONDS, TIMETABLE_WORKERS = 10, 4
+
+
+# ── Search ──────────────────────────────────────────────
+#
+# Slots are numbered period-major (slot = period * days + day), so taking
+# the lowest free slot fills the first period of every day before the
+# second and keeps each day compact.
+
+class _Search:
+    """Conflict-directed search over one independent group.
+
+    lessons: [(hours, (resource, ...))]; busy: fixed bookings per
+    resource as a bitmask; quota: rooms available to the group per slot.
+    """
+
+    def __init__(self, lessons, busy, quota, days, periods, seed=0):
+        self.days, self.n_slots = days, days * periods
+        self.day_mask = [sum(1 << (p * days + d) for p in range(periods)) for d in range(days)]
+        self.hours = [hours for hours, _res in lessons]
+        self.resources = [res for _hours, res in lessons]
+        # A course meeting no more often than there are days meets at most once a day.
+        self.spread = [hours <= days for hours in self.hours]
+        self.fixed = list(busy)
+        self.booked = list(busy)                # fixed plus placed lessons, per resource
+        self.holder = [{} for _ in busy]        # resource -> {slot: lesson placed there}
+        self.quota = list(quota)
+        self.in_slot = [[] for _ in range(self.n_slots)]
+        self.full = sum(1 << s for s, q in enumerate(quota) if q <= 0)
+        self.slots = [[] for _ in lessons]      # placed slots per lesson
+        self.placed, self.total = 0, sum(self.hours)
+        self.rng = random.Random(seed)
+
+    def domain(self, i):
+        """Bitmask of the slots where one more lesson of `i` fits right now."""
+        mask = ((1 << self.n_slots) - 1) & ~self.full
+        for r in self.resources[i]:
+            mask &= ~self.booked[r]
+        if self.spread[i]:
+            for s in self.slots[i]:
+                mask &= ~self.day_mask[s % self.days]
+        return mask
+
+    def place(self, i, slot):
+        bit = 1 << slot
+        for r in self.resources[i]:
+            self.booked[r] |= bit
+            self.holder[r][slot] = i
+        self.slots[i].append(slot)
+        self.in_slot[slot].append(i)
+        if len(self.in_slot[slot]) >= self.quota[slot]:
+            self.full |= bit
+        self.placed += 1
+
+    def remove(self, i, slot):
+        bit = 1 << slot
+        for r in self.resources[i]:
+            self.booked[r] &= ~bit
+            del self.holder[r][slot]
+        self.slots[i].remove(slot)
+        self.in_slot[slot].remove(i)
+        self.full &= ~bit
+        self.placed -= 1
+
+    def choose(self):
+        """The unfinished lesson with the least room to spare, and its domain."""
+        best, best_key, best_domain = None, None, 0
+        for i, hours in enumerate(self.hours):
+            left = hours - len(self.slots[i])
+            if left:
+                domain = self.domain(i)
+                key = (not domain, domain.bit_count() - left, -len(self.resources[i]), self.rng.random())
+                if best_key is None or key < best_key:
+                    best, best_key, best_domain = i, key, domain
+        return best, best_domain
+
+    def evictions(self, i, slot):
+        """The placed lessons that would have to move for `i` to take `slot`."""
+        out = set()
+        for r in self.resources[i]:
+            j = self.holder[r].get(slot)
+            if j is not None:
+                out.add((j, slot))
+        if self.spread[i]:
+            out.update((i, s) for s in self.slots[i] if s % self.days == slot % self.days)
+        # If the group's rooms are all taken at that time, one more lesson has to go.
+        staying = [j for j in self.in_slot[slot] if (j, slot) not in out]
+        if len(staying) >= self.quota[slot]:
+            out.add((self.rng.choice(staying), slot))
+        return out
+
+    def repair(self, i):
+        """Put `i` in the slot that displaces the fewest lessons. False if no slot can ever take it."""
+        options = []
+        for slot in range(self.n_slots):
+            bit = 1 << slot
+            if self.quota[slot] <= 0 or any(self.fixed[r] & bit for r in self.resources[i]):
+                continue
+            out = self.evictions(i, slot)
+            options.append((len(out) + self.rng.random(), slot, out))
+        if not options:
+            return False
+        _cost, slot, out = min(options)
+        for j, s in out:
+            self.remove(j, s)
+        self.place(i, slot)
+        return True
+
+    def run(self, deadline):
+        """Search until every lesson is placed or `deadline` passes.
+
+        Returns (placements, steps), keeping the best assignment seen.
+        """
+        best, best_slots, steps = -1, None, 0
+        while self.placed < self.total:
+            steps += 1
+            if steps % 64 == 0 and time.monotonic() > deadline:
+                break
+            i, domain = self.choose()
+            if domain:
+                self.place(i, (domain & -domain).bit_length() - 1)
+                continue
+            # Dead end: remember the best assignment so far, then move lessons out of the way.
+            if self.placed > best:
+                best, best_slots = self.placed, [list(s) for s in self.slots]
+            if not self.repair(i):
+                break
+        slots = self.slots if self.placed >= best else best_slots
+        return [(i, s) for i, placed in enumerate(slots) for s in placed], steps
+
+
+def _solve_group(problem):
+    """Worker entry point: solve one group. Returns (placements, stats)."""
+    lessons, busy, quota, days, periods, budget = problem
+    started = time.monotonic()
+    placements, steps = _Search(lessons, busy, quota, days, periods).run(started + budget)
+    stats = {"solved": len(placements) == sum(hours for hours, _res in lessons), "steps": steps,
+             "seconds": round(time.monotonic() - started, 3)}
+    return placements, stats
+
+
+# ── Problem setup ───────────────────────────────────────
+
+def _grid():
+    periods = [(parse_time(start), parse_time(end)) for start, end in TIMETABLE_PERIODS]
+    return list(TIMETABLE_DAYS), periods
+
+
+def _load(conn):
+    """Courses to place, and the fixed bookings left by classes that are not timetabled."""
+    courses = conn.execute("""
+        SELECT c.id, c.code, c.teacher_id, c.weekly_hours,
+               json_group_array(DISTINCT s.class_id) AS class_ids,
+               json_group_array(DISTINCT cl.grade_level) AS grade_levels
+        FROM courses c
+        JOIN enrollments e ON e.course_id = c.id
+        JOIN students s ON s.id = e.student_id
+        JOIN classes cl ON cl.id = s.class_id
+        WHERE c.weekly_hours > 0
+        GROUP BY c.id
+        ORDER BY c.id
+    """).fetchall()
+    courses = [dict(r, class_ids=json.loads(r["class_ids"]), grade_levels=json.loads(r["grade_levels"]))
+               for r in courses]
+    timetabled = sorted({cid for c in courses for cid in c["class_ids"]})
+    fixed = conn.execute("""
+        SELECT s.day_of_week, s.start_min, s.end_min, s.room, c.teacher_id
+        FROM schedules s JOIN courses c ON s.course_id = c.id
+        WHERE s.class_id NOT IN (SELECT value FROM json_each(?)) AND s.start_min IS NOT NULL AND s.end_min IS NOT NULL
+    """, (json.dumps(timetabled),)).fetchall()
+    return courses, timetabled, fixed
+
+
+def _fixed_bookings(fixed, days, periods):
+    """Grid slots taken by fixed bookings: ({teacher_id: mask}, {slot: {room, ...}})."""
+    teachers, rooms = defaultdict(int), defaultdict(set)
+    for row in fixed:
+        if row["day_of_week"] not in days:
+            continue
+        start, end, d = row["start_min"], row["end_min"], days.index(row["day_of_week"])
+        for p, (p_start, p_end) in enumerate(periods):
+            if start < p_end and p_start < end:
+                slot = p * len(days) + d
+                if row["teacher_id"] is not None:
+                    teachers[row["teacher_id"]] |= 1 << slot
+                if row["room"]:
+                    rooms[slot].add(row["room"].strip().lower())
+    return teachers, rooms
+
+
+def _groups(courses):
+    """Partition courses into independent groups: grade levels joined by shared classes or teachers."""
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for c in courses:
+        keys = [("grade", g) for g in c["grade_levels"]] + [("class", cid) for cid in c["class_ids"]]
+        if c["teacher_id"] is not None:
+            keys.append(("teacher", c["teacher_id"]))
+        for key in keys[1:]:
+            parent[find(key)] = find(keys[0])
+    groups = defaultdict(list)
+    for c in courses:
+        groups[find(("class", c["class_ids"][0]))].append(c)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def _room_quotas(groups, free_rooms, n_slots):
+    """Split the free rooms of every slot between groups, in proportion to their weekly lessons."""
+    demand = [sum(c["weekly_hours"] for c in g) for g in groups]
+    total = sum(demand) or 1
+    quotas = [[0] * n_slots for _ in groups]
+    carry = [0.0] * len(groups)
+    for slot in range(n_slots):
+        free = free_rooms[slot]
+        shares = [free * d / total for d in demand]
+        given = [int(s) for s in shares]
+        # Leftover rooms go to the groups owed the most so far, so over the
+        # week every group gets its proportional share, not just its floor.
+        for k in range(len(groups)):
+            carry[k] += shares[k] - given[k]
+        for k in sorted(range(len(groups)), key=lambda k: carry[k], reverse=True)[:free - sum(given)]:
+            given[k] += 1
+            carry[k] -= 1
+        for k, q in enumerate(given):
+            quotas[k][slot] = q
+    return quotas
+
+
+def _problem(group, busy_teachers, quota, days, periods, budget):
+    index = {}
+    lessons, busy = [], []
+
+    def resource(key, mask=0):
+        if key not in index:
+            index[key] = len(busy)
+            busy.append(mask)
+        return index[key]
+
+    for c in group:
+        res = [resource(("class", cid)) for cid in c["class_ids"]]
+        if c["teacher_id"] is not None:
+            res.append(resource(("teacher", c["teacher_id"]), busy_teachers.get(c["teacher_id"], 0)))
+        lessons.append((c["weekly_hours"], tuple(res)))
+    return lessons, busy, quota, len(days), len(periods), budget
+
+
+def _solve_all(problems, workers):
+    if workers <= 1:
+        return [_solve_group(p) for p in problems]
+    try:
+        # Spawned, not forked: the API process runs outbox and notification threads
+        # whose locks and pooled connections a forked child would inherit mid-use.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return list(pool.map(_solve_group, problems))
+    except BrokenProcessPool as e:
+        raise RuntimeError("A timetable worker process died; try again with fewer workers") from e
+    except (OSError, NotImplementedError, PermissionError):
+        # No process support (e.g. a restricted serverless runtime): solve in this process.
+        return [_solve_group(p) for p in problems]
+
+
+def _name_rooms(placements, rooms, taken):
+    """Give every placed lesson a room, keeping a course in the same room where possible."""
+    by_slot, preferred, named = defaultdict(list), {}, []
+    for course, slot in placements:
+        by_slot[slot].append(course)
+    for slot in sorted(by_slot):
+        free = [r for r in rooms if r.strip().lower() not in taken.get(slot, ())]
+        waiting = []
+        for course in by_slot[slot]:
+            room = preferred.get(course["id"])
+            if room in free:
+                free.remove(room)
+                named.append((course, slot, room))
+            else:
+                waiting.append(course)
+        for course in waiting:
+            room = free.pop(0)
+            preferred.setdefault(course["id"], room)
+            named.append((course, slot, room))
+    return named
+
+
+def generate(conn, rooms, time_budget=TIMETABLE_TIME_BUDGET_SECONDS, workers=TIMETABLE_WORKERS):
+    """Build a timetable without writing it.
+
+    Returns a dict with the proposed `slots` (one per class and lesson),
+    the `unplaced` lessons per course, and counts and timings. Raises
+    ValueError if no rooms are given, RuntimeError if a worker process dies.
+    """
+    # Room names match case-insensitively, as in conflict checks; the first spelling given is kept.
+    unique = {}
+    for room in filter(None, map(clean_room, rooms)):
+        unique.setdefault(room.lower(), room)
+    rooms = list(unique.values())
+    if not rooms:
+        raise ValueError("At least one room is required")
+    started = time.monotonic()
+    days, periods = _grid()
+    n_slots = len(days) * len(periods)
+    courses, timetabled, fixed = _load(conn)
+    busy_teachers, taken_rooms = _fixed_bookings(fixed, days, periods)
+    wanted = {r.lower() for r in rooms}
+    free_rooms = [len(wanted - taken_rooms.get(slot, set())) for slot in range(n_slots)]
+
+    groups = _groups(courses)
+    quotas = _room_quotas(groups, free_rooms, n_slots)
+    workers = max(1, min(workers, len(groups), os.cpu_count() or 1))
+    # Groups beyond the worker count queue up, so each gets its share of the overall budget.
+    rounds = -(-len(groups) // workers) or 1
+    problems = [_problem(g, busy_teachers, q, days, periods, time_budget / rounds)
+                for g, q in zip(groups, quotas)]
+    results = _solve_all(problems, workers)
+
+    placements, placed_count, unplaced = [], defaultdict(int), []
+    for group, (placed, _stats) in zip(groups, results):
+        for i, slot in placed:
+            placements.append((group[i], slot))
+            placed_count[group[i]["id"]] += 1
+    for c in courses:
+        missing = c["weekly_hours"] - placed_count[c["id"]]
+        if missing:
+            unplaced.append({"course_id": c["id"], "code": c["code"], "class_ids": c["class_ids"],
+                             "missing": missing})
+
+    slots = []
+    for course, slot, room in _name_rooms(placements, rooms, taken_rooms):
+        p, d = divmod(slot, len(days))
+        start, end = TIMETABLE_PERIODS[p]
+        for class_id in course["class_ids"]:
+            slots.append({"class_id": class_id, "course_id": course["id"], "day_of_week": days[d],
+                          "start_time": start, "end_time": end, "room": room})
+    slots.sort(key=lambda s: (s["class_id"], days.index(s["day_of_week"]), s["start_time"]))
+    return {
+        "classes": len(timetabled),
+        "courses": len(courses),
+        "groups": len(groups),
+        "lessons": sum(c["weekly_hours"] for c in courses),
+        "placed": len(placements),
+        "solved": all(stats["solved"] for _placed, stats in results),
+        "steps": sum(stats["steps"] for _placed, stats in results),
+        "seconds": round(time.monotonic() - started, 3),
+        "unplaced": unplaced,
+        "class_ids": timetabled,
+        "slots": slots,
+    }
+
+
+def apply_timetable(conn, result):
+    """Replace the schedules of the timetabled classes with `result['slots']`, in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM schedules WHERE class_id IN (SELECT value FROM json_each(?))",
+                     (json.dumps(result["class_ids"]),))
+        conn.executemany(INSERT_SLOT, [
+            slot_row(s["class_id"], s["course_id"], s["day_of_week"], s["start_time"], s["end_time"], s["room"])
+            for s in result["slots"]
+        ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def existing_rooms(conn):
+    return [r[0] for r in conn.execute(
+        "SELECT DISTINCT trim(room) FROM schedules WHERE trim(COALESCE(room, '')) != '' ORDER BY 1")]
+
+
+# ── CLI ─────────────────────────────────────────────────
+
+UNPLACED_SHOWN = 20
+
+
+def generate_timetable(rooms=None, time_budget=TIMETABLE_TIME_BUDGET_SECONDS, workers=TIMETABLE_WORKERS,
+                       dry_run=False):
+    conn = get_connection()
+    try:
+        rooms = rooms or existing_rooms(conn)
+        try:
+            result = generate(conn, rooms, time_budget, workers)
+        except ValueError as e:
+            print(f"{e}; give a room list.")
+            return
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return
+        print(f"{result['classes']} classes, {result['courses']} courses in {result['groups']} independent group(s).")
+        print(f"Placed {result['placed']} of {result['lessons']} weekly lessons in {result['seconds']:.2f}s.")
+        for u in result["unplaced"][:UNPLACED_SHOWN]:
+            print(f"  {u['code']}: {u['missing']} lesson(s) could not be placed")
+        if len(result["unplaced"]) > UNPLACED_SHOWN:
+            print(f"  ... and {len(result['unplaced']) - UNPLACED_SHOWN} more course(s)")
+        if dry_run:
+            return
+        if not result["slots"]:
+            print("Nothing to write.")
+            return
+        apply_timetable(conn, result)
+        print(f"Wrote {len(result['slots'])} schedule slots.")
+    finally:
+        conn.close()
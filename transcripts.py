@@ -0,0 +1,84 @@
+"""
+Student transcripts and GPA.
+
+Each student's transcript (GPA, credits and course list) is stored in
+the `transcripts` table and rebuilt by triggers whenever one of their
+grades or enrollments, or an enrolled course, changes (see
+migrations.py), so reads never re-join enrollments, courses and grades.
+"""
+import json
+
+from database import get_connection
+
+HONOR_ROLL_GPA = 3.5
+
+
+def get_transcript(conn, student_id):
+    """The stored transcript for a student, or None if there is no such student.
+
+    A student with no enrollments has an empty course list and no GPA.
+    """
+    row = conn.execute("""
+        SELECT s.id, s.first_name || ' ' || s.last_name AS name,
+               t.gpa, COALESCE(t.credits_attempted, 0) AS credits_attempted,
+               COALESCE(t.credits_earned, 0) AS credits_earned, COALESCE(t.courses, '[]') AS courses
+        FROM students s LEFT JOIN transcripts t ON t.student_id = s.id
+        WHERE s.id = ?
+    """, (student_id,)).fetchone()
+    if not row:
+        return None
+    return {
+        "student_id": row["id"],
+        "name": row["name"],
+        "gpa": row["gpa"],
+        "credits_attempted": row["credits_attempted"],
+        "credits_earned": row["credits_earned"],
+        "courses": json.loads(row["courses"]),
+    }
+
+
+def honor_roll(conn, min_gpa=HONOR_ROLL_GPA, min_credits=0):
+    """Students with at least `min_gpa` over at least `min_credits` graded credits, best first."""
+    return conn.execute("""
+        SELECT t.student_id, s.first_name || ' ' || s.last_name AS name,
+               t.gpa, t.credits_attempted, t.credits_earned
+        FROM transcripts t JOIN students s ON t.student_id = s.id
+        WHERE t.gpa >= ? AND t.credits_attempted >= ?
+        ORDER BY t.gpa DESC, s.last_name, s.first_name
+    """, (min_gpa, min_credits)).fetchall()
+
+
+# ── CLI views ───────────────────────────────────────────
+
+def view_transcript(student_id):
+    conn = get_connection()
+    transcript = get_transcript(conn, student_id)
+    conn.close()
+    if not transcript:
+        print("Student not found.")
+        return
+    gpa = f"{transcript['gpa']:.2f}" if transcript["gpa"] is not None else "N/A"
+    print(f"\nTranscript: {transcript['name']}")
+    print(f"GPA: {gpa}   Credits attempted: {transcript['credits_attempted']:g}   "
+          f"Credits earned: {transcript['credits_earned']:g}")
+    if not transcript["courses"]:
+        print("Student is not enrolled in any courses.")
+        return
+    print(f"\n{'Code':<10} {'Course':<25} {'Credits':<9} {'Score':<8} {'Grade'}")
+    print("-" * 62)
+    for c in transcript["courses"]:
+        score = f"{c['score']:.1f}" if c["score"] is not None else "N/A"
+        print(f"{c['code']:<10} {c['name']:<25} {c['credits']:<9g} {score:<8} {c['letter_grade'] or 'N/A'}")
+
+
+def view_honor_roll(min_gpa=HONOR_ROLL_GPA):
+    conn = get_connection()
+    rows = honor_roll(conn, min_gpa)
+    conn.close()
+    if not rows:
+        print(f"No students with a GPA of {min_gpa:.2f} or higher.")
+        return
+    print(f"\n{'ID':<5} {'Name':<25} {'GPA':<6} {'Credits'}")
+    print("-" * 45)
+    for r in rows:
+        print(f"{r['student_id']:<5} {r['name']:<25} {r['gpa']:<6.2f} {r['credits_attempted']:g}")